@@ -1,65 +1,640 @@
 """
 AI-powered summarization using Google Gemini API
 Converts satellite change detection results into natural language
+
+Summaries come from a pluggable backend: Gemini (one reused client per API
+key), Gemini's REST endpoint over plain HTTP (whose base URL can point at a
+local fake server) or an offline stub for testing and benchmarks. They are
+memoized by prompt, i.e. by statistics and method, so the same result is
+never sent twice, and submit_summary generates them on a background thread
+with a timeout so callers never block on the network. summarize_batch
+handles hundreds of results at once: it packs several into each prompt and
+streams the summaries back under a rate limit and concurrency cap, retrying
+throttled and failed requests with exponential backoff.
 """
 
-import google.generativeai as genai
-from typing import Dict, Optional
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    from google.ai import generativelanguage as glm
+except ImportError:
+    glm = None
+
+SUMMARY_MODEL = 'gemini-2.5-flash'
+
+# Seconds a single summary request may take
+DEFAULT_TIMEOUT = 30.0
+
+# Number of memoized summaries kept
+SUMMARY_CACHE_SIZE = 256
+
+MISSING_KEY_MESSAGE = "⚠️ API key not provided. Please add your Google AI Studio API key in the sidebar."
+
+# Start of the text returned in place of a summary when a request fails
+ERROR_PREFIX = "⚠️ Error generating summary"
+
+# Base URL of the Gemini REST API (override with SUMMARY_API_URL)
+GEMINI_API_URL = 'https://generativelanguage.googleapis.com'
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+PROMPT_INTRO = "You are an expert satellite imagery analyst."
+
+PROMPT_GUIDANCE = """Provide a professional summary that:
+1. Describes the magnitude of change (minor, moderate, significant, dramatic)
+2. Interprets what this might indicate (urban development, vegetation loss, natural changes, etc.)
+3. Highlights key patterns or concerns
+4. Keeps it simple and actionable for business intelligence purposes"""
+
+
+def _describe_result(stats: Dict, detection_method: str) -> str:
+    return f"""Detection Method: {detection_method}
+Total Pixels Analyzed: {stats.get('total_pixels', 0):,}
+Changed Pixels: {stats.get('changed_pixels', 0):,}
+Change Percentage: {stats.get('change_percentage', 0):.2f}%
+Number of Change Regions: {stats.get('num_change_regions', 0)}
+Average Region Size: {stats.get('mean_region_size', 0):.1f} pixels"""
+
+
+def build_prompt(stats: Dict, detection_method: str) -> str:
+    """
+    Prompt asking for a summary of one change detection result
+    """
+    return f"""{PROMPT_INTRO} Analyze the following change detection results and provide a clear, concise summary in 3-4 sentences for non-technical users.
+
+{_describe_result(stats, detection_method)}
+
+{PROMPT_GUIDANCE}
+
+Summary:"""
+
+
+def build_batch_prompt(records: List[Tuple[Dict, str]]) -> str:
+    """
+    Prompt asking for summaries of several results at once, answered as a
+    JSON array of {"id": <result number>, "summary": <text>} objects
+    """
+    results = "\n\n".join(f"Result {number}:\n{_describe_result(stats, method)}"
+                           for number, (stats, method) in enumerate(records, 1))
+    return f"""{PROMPT_INTRO} Analyze each of the following {len(records)} change detection results separately and provide a clear, concise summary in 3-4 sentences for non-technical users for each one.
+
+{results}
+
+For each result, {PROMPT_GUIDANCE[0].lower()}{PROMPT_GUIDANCE[1:]}
+
+Respond with a JSON array containing one object per result: {{"id": <result number>, "summary": "<summary>"}}"""
+
+
+class TransientError(Exception):
+    """A request failed in a way that may succeed when retried"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiBackend:
+    """
+    Gemini text generation with a client created once and reused
+
+    Each backend builds its own GenerativeServiceClient from its key rather
+    than going through genai.configure, whose key is process-wide, so
+    concurrent sessions with different keys never send requests with each
+    other's key.
+    """
+
+    def __init__(self, api_key: str, model_name: str = SUMMARY_MODEL):
+        """
+        Initialize the backend
+
+        Args:
+            api_key: Google AI Studio API key
+            model_name: Gemini model to use
+        """
+        if glm is None:
+            raise ImportError("Gemini summaries require google-generativeai "
+                              "(pip install google-generativeai)")
+        self.api_key = api_key
+        self.model_name = model_name
+        self.cache_key = ('gemini', model_name, api_key)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def generate(self, prompt: str, timeout: float = DEFAULT_TIMEOUT,
+                 json_output: bool = False) -> str:
+        """
+        Text generated for a prompt
+
+        Args:
+            prompt: Prompt text
+            timeout: Seconds the request may take
+            json_output: Ask for a JSON response
+
+        Raises:
+            ValueError: If the response carries no text
+            Whatever the client raises on errors and timeouts
+        """
+        with self._client_lock:
+            if self._client is None:
+                self._client = glm.GenerativeServiceClient(
+                    client_options={'api_key': self.api_key})
+
+        request = glm.GenerateContentRequest(
+            model=f'models/{self.model_name}',
+            contents=[glm.Content(role='user', parts=[glm.Part(text=prompt)])])
+        if json_output:
+            request.generation_config = glm.GenerationConfig(
+                response_mime_type='application/json')
+        # Retries are left to the caller, so the timeout bounds the whole call
+        response = self._client.generate_content(request=request, timeout=timeout, retry=None)
+        if not response.candidates:
+            raise ValueError(f"Response without text: {response.prompt_feedback}")
+        return ''.join(part.text for part in response.candidates[0].content.parts).strip()
+
+
+class GeminiRestBackend:
+    """
+    Gemini text generation through the REST generateContent endpoint, using
+    only the standard library; base_url may point at a local fake server
+    """
+
+    def __init__(self, api_key: str, model_name: str = SUMMARY_MODEL,
+                 base_url: str = GEMINI_API_URL):
+        """
+        Initialize the backend
+
+        Args:
+            api_key: Google AI Studio API key
+            model_name: Gemini model to use
+            base_url: Scheme and host of the API
+        """
+        self.api_key = api_key
+        self.model_name = model_name
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.cache_key = ('gemini-rest', self.url, api_key)
+
+    def generate(self, prompt: str, timeout: float = DEFAULT_TIMEOUT,
+                 json_output: bool = False) -> str:
+        """
+        Text generated for a prompt
+
+        Args:
+            prompt: Prompt text
+            timeout: Seconds the request may take
+            json_output: Ask for a JSON response
+
+        Raises:
+            TransientError: On throttling, server errors and connection failures
+            urllib.error.HTTPError: On other HTTP errors
+        """
+        body = {'contents': [{'parts': [{'text': prompt}]}]}
+        if json_output:
+            body['generationConfig'] = {'responseMimeType': 'application/json'}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(), method='POST',
+            headers={'Content-Type': 'application/json', 'x-goog-api-key': self.api_key})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES:
+                raise
+            retry_after = e.headers.get('Retry-After')
+            raise TransientError(f"HTTP {e.code} from {self.url}",
+                                 float(retry_after) if retry_after else None) from e
+        except urllib.error.URLError as e:
+            raise TransientError(f"Cannot reach {self.url}: {e.reason}") from e
+
+        try:
+            parts = data['candidates'][0]['content']['parts']
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"Response without text: {json.dumps(data)[:200]}") from e
+        return ''.join(part.get('text', '') for part in parts).strip()
+
+
+class StubBackend:
+    """
+    Offline stand-in for Gemini: deterministic summaries built from the
+    numbers in the prompt, with an optional artificial delay
+    """
+
+    cache_key = ('stub',)
+
+    def __init__(self, delay: float = 0.0):
+        """
+        Initialize the backend
+
+        Args:
+            delay: Seconds each request takes, to mimic network latency
+        """
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt: str, timeout: float = DEFAULT_TIMEOUT,
+                 json_output: bool = False) -> str:
+        """
+        Text generated for a prompt; batch prompts (see build_batch_prompt)
+        are answered with a JSON array when json_output is set
+
+        Raises:
+            TimeoutError: If delay exceeds timeout
+        """
+        self.calls += 1
+        if self.delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub request exceeded {timeout}s")
+        time.sleep(self.delay)
+        return stub_response(prompt, json_output)
 
 
-def generate_summary(stats: Dict, detection_method: str, api_key: Optional[str] = None) -> str:
+def _stub_summary(text: str) -> str:
+    fields = dict(re.findall(r'^([A-Z][\w ]+): (.+)$', text, flags=re.MULTILINE))
+    percentage = float(fields.get('Change Percentage', '0').rstrip('%'))
+    return (f"{get_quick_insight(percentage)} {fields.get('Number of Change Regions', '0')} "
+            f"change regions cover {percentage:.2f}% of the "
+            f"{fields.get('Total Pixels Analyzed', '0')} pixels analyzed with "
+            f"{fields.get('Detection Method', 'an unknown method')}. (offline stub summary)")
+
+
+def stub_response(prompt: str, json_output: bool = False) -> str:
+    """
+    Deterministic offline answer to a single or batch prompt, shared by
+    StubBackend and fake servers
+    """
+    sections = re.split(r'^Result (\d+):$', prompt, flags=re.MULTILINE)
+    if not json_output or len(sections) < 3:
+        return _stub_summary(prompt)
+    return json.dumps([{'id': int(number), 'summary': _stub_summary(text)}
+                       for number, text in zip(sections[1::2], sections[2::2])])
+
+
+SummaryBackend = Union[GeminiBackend, GeminiRestBackend, StubBackend]
+
+_backends: Dict[Hashable, SummaryBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(api_key: Optional[str] = None, name: Optional[str] = None) -> SummaryBackend:
+    """
+    Shared backend instance
+
+    Args:
+        api_key: Google AI Studio API key (Gemini only)
+        name: 'gemini', 'gemini-rest' or 'stub'; defaults to the
+            SUMMARY_BACKEND environment variable, then 'gemini'. The REST
+            backend talks to SUMMARY_API_URL when that variable is set.
+
+    Returns:
+        The backend, created on first use
+    """
+    name = name or os.getenv('SUMMARY_BACKEND', 'gemini')
+    if name not in ('gemini', 'gemini-rest', 'stub'):
+        raise ValueError(f"Unknown summary backend: {name}")
+    base_url = os.getenv('SUMMARY_API_URL', GEMINI_API_URL) if name == 'gemini-rest' else None
+    key = (name, None if name == 'stub' else api_key, base_url)
+    with _backends_lock:
+        if key not in _backends:
+            if name == 'stub':
+                _backends[key] = StubBackend()
+            elif name == 'gemini-rest':
+                _backends[key] = GeminiRestBackend(api_key, base_url=base_url)
+            else:
+                _backends[key] = GeminiBackend(api_key)
+        return _backends[key]
+
+
+def _resolve_backend(api_key: Optional[str],
+                     backend: Union[str, SummaryBackend, None]) -> Optional[SummaryBackend]:
+    """Backend to use, or None when Gemini is requested without a key"""
+    if backend is not None and not isinstance(backend, str):
+        return backend
+    name = backend or os.getenv('SUMMARY_BACKEND', 'gemini')
+    if name != 'stub' and not api_key:
+        return None
+    return get_backend(api_key, name)
+
+
+class _SummaryMemo:
+    """Thread-safe LRU of generated summaries"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, summary: str):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_memo = _SummaryMemo(SUMMARY_CACHE_SIZE)
+
+
+def generate_summary(stats: Dict, detection_method: str, api_key: Optional[str] = None,
+                     backend: Union[str, SummaryBackend, None] = None,
+                     timeout: float = DEFAULT_TIMEOUT) -> str:
     """
     Generate natural language summary of change detection results
-    
+
+    Summaries are memoized per backend, statistics and method; errors are
+    not, so a failed request is retried on the next call.
+
     Args:
         stats: Dictionary containing change detection statistics
         detection_method: Name of the detection method used
         api_key: Google AI Studio API key
-    
+        backend: Backend instance or name ('gemini', 'gemini-rest', 'stub');
+            defaults to the SUMMARY_BACKEND environment variable, then Gemini
+        timeout: Seconds the request may take
+
     Returns:
         Natural language summary string
     """
-    if not api_key:
-        return "⚠️ API key not provided. Please add your Google AI Studio API key in the sidebar."
-    
+    resolved = _resolve_backend(api_key, backend)
+    if resolved is None:
+        return MISSING_KEY_MESSAGE
+
+    prompt = build_prompt(stats, detection_method)
+    key = (resolved.cache_key, prompt)
+    summary = _memo.get(key)
+    if summary is not None:
+        return summary
+
     try:
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Create prompt
-        prompt = f"""You are an expert satellite imagery analyst. Analyze the following change detection results and provide a clear, concise summary in 3-4 sentences for non-technical users.
-
-Detection Method: {detection_method}
-Total Pixels Analyzed: {stats.get('total_pixels', 0):,}
-Changed Pixels: {stats.get('changed_pixels', 0):,}
-Change Percentage: {stats.get('change_percentage', 0):.2f}%
-Number of Change Regions: {stats.get('num_change_regions', 0)}
-Average Region Size: {stats.get('mean_region_size', 0):.1f} pixels
+        summary = resolved.generate(prompt, timeout)
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {str(e)}\n\nPlease check your API key and internet connection."
 
-Provide a professional summary that:
-1. Describes the magnitude of change (minor, moderate, significant, dramatic)
-2. Interprets what this might indicate (urban development, vegetation loss, natural changes, etc.)
-3. Highlights key patterns or concerns
-4. Keeps it simple and actionable for business intelligence purposes
+    _memo.put(key, summary)
+    return summary
 
-Summary:"""
-        
-        # Generate response
-        response = model.generate_content(prompt)
-        return response.text.strip()
-        
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='summary')
+_in_flight: Dict[Hashable, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def submit_summary(stats: Dict, detection_method: str, api_key: Optional[str] = None,
+                   backend: Union[str, SummaryBackend, None] = None,
+                   timeout: float = DEFAULT_TIMEOUT) -> Future:
+    """
+    Generate a summary on a background thread
+
+    Memoized summaries come back as already completed futures, and repeated
+    submissions of a request still in flight share its future.
+
+    Args:
+        stats: Dictionary containing change detection statistics
+        detection_method: Name of the detection method used
+        api_key: Google AI Studio API key
+        backend: Backend instance or name (see generate_summary)
+        timeout: Seconds the request may take
+
+    Returns:
+        Future resolving to the summary string (never raises)
+    """
+    resolved = _resolve_backend(api_key, backend)
+    key = None if resolved is None else (resolved.cache_key,
+                                         build_prompt(stats, detection_method))
+    summary = MISSING_KEY_MESSAGE if key is None else _memo.get(key)
+    if summary is not None:
+        future = Future()
+        future.set_result(summary)
+        return future
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        future = _executor.submit(generate_summary, stats, detection_method,
+                                  backend=resolved, timeout=timeout)
+        _in_flight[key] = future
+    # Registered outside the lock: a finished future runs the callback at once
+    future.add_done_callback(lambda _: _forget(key))
+    return future
+
+
+def _forget(key: Hashable):
+    with _in_flight_lock:
+        _in_flight.pop(key, None)
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly so that at most requests_per_minute start per minute
+    """
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        """
+        Initialize the limiter
+
+        Args:
+            requests_per_minute: Allowed request rate (None or 0 for no limit)
+        """
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may start its next request"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed request is worth retrying"""
+    if isinstance(error, (TransientError, TimeoutError, ConnectionError)):
+        return True
+    # google.api_core exceptions carry the HTTP status as an int code
+    return getattr(error, 'code', None) in RETRY_STATUSES
+
+
+def _generate_with_retries(backend: SummaryBackend, prompt: str, json_output: bool,
+                           limiter: RateLimiter, max_retries: int, backoff: float,
+                           timeout: float) -> str:
+    """
+    Generate text, retrying transient failures with exponential backoff
+
+    Every attempt waits for the rate limiter; a server's Retry-After hint
+    replaces the computed delay when it is longer.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return backend.generate(prompt, timeout, json_output=json_output)
+        except Exception as e:
+            if attempt == max_retries or not _is_transient(e):
+                raise
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            time.sleep(max(delay, getattr(e, 'retry_after', None) or 0))
+
+
+def parse_batch_response(text: str, count: int) -> Dict[int, str]:
+    """
+    Summaries of a batch response, by 1-based result number
+
+    Accepts the JSON array asked for by build_batch_prompt, also when
+    wrapped in a Markdown code fence; entries that are missing, malformed or
+    out of range are left out.
+    """
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    try:
+        entries = json.loads(text)
+    except ValueError:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+    summaries = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get('summary'), str):
+            continue
+        try:
+            number = int(entry.get('id'))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= number <= count and entry['summary'].strip():
+            summaries[number] = entry['summary'].strip()
+    return summaries
+
+
+def _summarize_group(backend: SummaryBackend, group: List[Tuple[int, Dict, str]],
+                     limiter: RateLimiter, max_retries: int, backoff: float,
+                     timeout: float) -> List[Tuple[int, str]]:
+    """
+    Summaries of one group of records, sent as a single prompt
+
+    Records the batch answer leaves out are asked for one by one. Errors
+    become error strings, like in generate_summary.
+    """
+    def request(prompt, json_output=False):
+        return _generate_with_retries(backend, prompt, json_output, limiter,
+                                      max_retries, backoff, timeout)
+
+    results = []
+    try:
+        summaries = {}
+        if len(group) > 1:
+            text = request(build_batch_prompt([(stats, method) for _, stats, method in group]),
+                           json_output=True)
+            summaries = parse_batch_response(text, len(group))
+        for number, (index, stats, method) in enumerate(group, 1):
+            prompt = build_prompt(stats, method)
+            summary = summaries.get(number)
+            if summary is None:
+                summary = request(prompt)
+            _memo.put((backend.cache_key, prompt), summary)
+            results.append((index, summary))
     except Exception as e:
-        return f"⚠️ Error generating summary: {str(e)}\n\nPlease check your API key and internet connection."
+        done = {index for index, _ in results}
+        message = f"{ERROR_PREFIX}: {str(e)}"
+        results += [(index, message) for index, _, _ in group if index not in done]
+    return results
+
+
+def summarize_batch(records: Iterable[Tuple[Dict, str]], api_key: Optional[str] = None,
+                    backend: Union[str, SummaryBackend, None] = None,
+                    records_per_prompt: int = 8, max_concurrency: int = 4,
+                    requests_per_minute: Optional[float] = 60, max_retries: int = 4,
+                    backoff: float = 1.0,
+                    timeout: float = DEFAULT_TIMEOUT) -> Iterator[Tuple[int, str]]:
+    """
+    Summarize many change detection results, yielding summaries as they finish
+
+    Records are grouped records_per_prompt at a time into one prompt each;
+    groups run on up to max_concurrency threads, request starts are spaced
+    to requests_per_minute, and throttled (HTTP 429), failed (5xx) and
+    timed-out requests are retried with exponential backoff. Summaries are
+    memoized like generate_summary's, so memoized records are yielded
+    straight away without a request.
+
+    Args:
+        records: (stats, detection_method) pairs
+        api_key: Google AI Studio API key
+        backend: Backend instance or name (see generate_summary)
+        records_per_prompt: Results packed into a single prompt (1 disables
+            packing)
+        max_concurrency: Requests in flight at once
+        requests_per_minute: Request rate limit (None for no limit)
+        max_retries: Retries per request after the first attempt
+        backoff: Base delay in seconds, doubled on every retry
+        timeout: Seconds each request may take
+
+    Yields:
+        (index, summary) pairs in completion order, where index is the
+        position of the record in records; failures yield an error string
+    """
+    records = list(records)
+    resolved = _resolve_backend(api_key, backend)
+    if resolved is None:
+        for index in range(len(records)):
+            yield index, MISSING_KEY_MESSAGE
+        return
+
+    pending = []
+    for index, (stats, method) in enumerate(records):
+        summary = _memo.get((resolved.cache_key, build_prompt(stats, method)))
+        if summary is not None:
+            yield index, summary
+        else:
+            pending.append((index, stats, method))
+    if not pending:
+        return
+
+    size = max(1, records_per_prompt)
+    limiter = RateLimiter(requests_per_minute)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency),
+                                  thread_name_prefix='summary-batch')
+    try:
+        futures = [executor.submit(_summarize_group, resolved, pending[start:start + size],
+                                   limiter, max_retries, backoff, timeout)
+                   for start in range(0, len(pending), size)]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        # Stop queued groups when the caller abandons the generator early
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def get_quick_insight(change_percentage: float) -> str:
     """
     Get quick insight without API call (fallback)
-    
+
     Args:
         change_percentage: Percentage of changed area
-    
+
     Returns:
         Simple insight string
     """
@@ -0,0 +1,175 @@
+"""
+Common footprint of an image pair
+The analysis grid is the part of the first image's pixel grid that the
+second image covers. The first image is read through a window of that grid.
+So is the second, when its pixels line up with the first's (same CRS, same
+resolution, whole-pixel offset); otherwise it is resampled onto the grid
+tile by tile through a warped VRT. Either way only the overlap is decoded,
+so the work scales with the overlap area rather than with the input sizes.
+A resampled image need not cover the whole grid (its footprint's bounding
+box is, not the footprint itself); valid_on_grid marks the grid pixels it
+actually has data for.
+"""
+
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+from tiling import iter_tiles
+
+# Edge length of the tiles resampled at a time
+RESAMPLING_TILE = 1024
+
+# Tolerance, in pixels, for treating two grids as aligned
+ALIGNMENT_TOLERANCE = 1e-6
+
+
+def _pixel_extent(transform, corners) -> Window:
+    """Smallest window of a grid containing the given map coordinates"""
+    inverse = ~transform
+    cols, rows = zip(*(inverse * corner for corner in corners))
+    col0, row0 = int(round(min(cols))), int(round(min(rows)))
+    return Window(col0, row0, int(round(max(cols))) - col0, int(round(max(rows))) - row0)
+
+
+def _is_integer(value: float) -> bool:
+    return abs(value - round(value)) < ALIGNMENT_TOLERANCE
+
+
+def overlap_grid(metadata1: Dict, metadata2: Dict) -> Dict:
+    """
+    Grid of the overlap of two rasters, on the pixel grid of the first
+
+    Args:
+        metadata1: 'crs', 'transform', 'width' and 'height' of the first image
+        metadata2: The same for the second image
+
+    Returns:
+        Dictionary with the grid's 'crs', 'transform', 'bounds', 'width' and
+        'height', the 'windows' of the grid in each image (None for the
+        second image when it has to be resampled) and 'full', whether the
+        grid is all of both images
+
+    Raises:
+        ValueError: If the images do not overlap, or their grids differ but
+            they cannot be resampled for lack of a CRS
+    """
+    crs1, crs2 = metadata1['crs'], metadata2['crs']
+    transform1, transform2 = metadata1['transform'], metadata2['transform']
+    same_crs = crs1 is None or crs2 is None or crs1 == crs2
+
+    # Footprint of the second image in pixel coordinates of the first
+    if same_crs:
+        corners = [transform2 * (col, row) for col in (0, metadata2['width'])
+                   for row in (0, metadata2['height'])]
+    else:
+        left, bottom, right, top = transform_bounds(crs2, crs1, *metadata2['bounds'])
+        corners = [(x, y) for x in (left, right) for y in (bottom, top)]
+    extent = _pixel_extent(transform1, corners)
+
+    col0, row0 = max(extent.col_off, 0), max(extent.row_off, 0)
+    col1 = min(extent.col_off + extent.width, metadata1['width'])
+    row1 = min(extent.row_off + extent.height, metadata1['height'])
+    if col1 <= col0 or row1 <= row0:
+        raise ValueError("The images do not overlap")
+    window1 = Window(col0, row0, col1 - col0, row1 - row0)
+
+    # The second image is read directly when the grid maps onto whole pixels of it
+    window2 = None
+    if same_crs:
+        offset = ~transform2 * transform1
+        if (abs(offset.a - 1) < ALIGNMENT_TOLERANCE and abs(offset.e - 1) < ALIGNMENT_TOLERANCE
+                and abs(offset.b) < ALIGNMENT_TOLERANCE and abs(offset.d) < ALIGNMENT_TOLERANCE
+                and _is_integer(offset.c) and _is_integer(offset.f)):
+            window2 = Window(col0 + int(round(offset.c)), row0 + int(round(offset.f)),
+                             window1.width, window1.height)
+        elif crs1 is None or crs2 is None:
+            raise ValueError("Images without a CRS must share their pixel grid")
+
+    full = (window1 == Window(0, 0, metadata1['width'], metadata1['height'])
+            and window2 == Window(0, 0, metadata2['width'], metadata2['height']))
+    return {
+        'crs': crs1 if crs1 is not None else crs2,
+        'transform': window_transform(window1, transform1),
+        'bounds': window_bounds(window1, transform1),
+        'width': int(window1.width),
+        'height': int(window1.height),
+        'windows': (window1, window2),
+        'full': full
+    }
+
+
+def read_on_grid(path: str, grid: Dict, window: Optional[Window],
+                 indexes: Optional[Sequence[int]] = None,
+                 resampling: Resampling = Resampling.bilinear,
+                 tile_size: int = RESAMPLING_TILE) -> np.ndarray:
+    """
+    Bands of a raster on an analysis grid
+
+    Args:
+        path: Raster file
+        grid: Grid from overlap_grid
+        window: Window of the grid in this raster, or None to resample
+        indexes: 1-based band indexes (None for every band)
+        resampling: Resampling method when window is None
+        tile_size: Edge length of the tiles resampled at a time
+
+    Returns:
+        Array of shape (bands, grid height, grid width)
+    """
+    with rasterio.open(path) as src:
+        indexes = list(indexes) if indexes is not None else list(src.indexes)
+        if window is not None:
+            return src.read(indexes, window=window)
+
+        height, width = grid['height'], grid['width']
+        data = np.zeros((len(indexes), height, width), dtype=src.dtypes[0])
+        with WarpedVRT(src, crs=grid['crs'], transform=grid['transform'], width=width,
+                       height=height, resampling=resampling) as vrt:
+            # The warper only fetches the source blocks each tile needs
+            for _, tile, _ in iter_tiles(height, width, (tile_size, tile_size)):
+                rows = slice(tile.row_off, tile.row_off + tile.height)
+                cols = slice(tile.col_off, tile.col_off + tile.width)
+                data[:, rows, cols] = vrt.read(indexes, window=tile)
+        return data
+
+
+def valid_on_grid(path: str, grid: Dict, window: Optional[Window],
+                  resampling: Resampling = Resampling.bilinear,
+                  tile_size: int = RESAMPLING_TILE) -> Optional[np.ndarray]:
+    """
+    Grid pixels a raster has data for
+
+    read_on_grid fills the pixels outside a resampled raster's footprint
+    (and its nodata pixels) with zeros; this is the mask telling them apart.
+
+    Args:
+        path: Raster file
+        grid: Grid from overlap_grid
+        window: Window of the grid in this raster, or None to resample
+        resampling: Resampling method when window is None
+        tile_size: Edge length of the tiles resampled at a time
+
+    Returns:
+        Boolean array of shape (grid height, grid width), or None when the
+        raster is read through a window and so covers every grid pixel
+    """
+    if window is not None:
+        return None
+
+    height, width = grid['height'], grid['width']
+    valid = np.empty((height, width), dtype=bool)
+    with rasterio.open(path) as src:
+        # The warper's alpha band is 0 where no source pixel contributes;
+        # rasterio does not report it through read(masked=True) or read_masks
+        with WarpedVRT(src, crs=grid['crs'], transform=grid['transform'], width=width,
+                       height=height, resampling=resampling, add_alpha=True) as vrt:
+            for _, tile, _ in iter_tiles(height, width, (tile_size, tile_size)):
+                rows = slice(tile.row_off, tile.row_off + tile.height)
+                cols = slice(tile.col_off, tile.col_off + tile.width)
+                valid[rows, cols] = vrt.read(vrt.count, window=tile) > 0
+    return valid
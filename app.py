@@ -6,9 +6,16 @@ import pandas as pd
 from pathlib import Path
 import rasterio
 from change_detector import ChangeDetector
-from ai_summarizer import generate_summary, get_quick_insight
+from raster_cache import RasterCache
+from result_cache import ResultCache, file_identity
+from display_pyramid import DisplayPyramid, colorbar_png
+from raster_export import geotiff_bytes
+from vector_export import geojson_bytes
+from stage_trace import StageTrace, chrome_trace, stage, traced
+from ai_summarizer import get_quick_insight, submit_summary
 from datetime import datetime
 import tempfile
+import json
 from typing import Dict
 import os
 from dotenv import load_dotenv
@@ -47,6 +54,42 @@ if 'analysis_results' not in st.session_state:
 if 'temp_files' not in st.session_state:
     st.session_state.temp_files = []
 
+# Decoded and normalized rasters persist across reruns and sessions here
+raster_cache = RasterCache(
+    os.getenv('RASTER_CACHE_DIR', str(Path(tempfile.gettempdir()) / 'satellite_change_cache')),
+    max_bytes=int(float(os.getenv('RASTER_CACHE_MAX_GB', '2')) * 2**30)
+)
+
+# Seconds an AI summary request may take before it is reported as failed
+AI_SUMMARY_TIMEOUT = float(os.getenv('AI_SUMMARY_TIMEOUT', '30'))
+
+# Change maps larger than this are only exported as GeoTIFF, never as CSV text
+CSV_EXPORT_MAX_PIXELS = 1_000_000
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """Analysis results shared by all reruns and sessions"""
+    return ResultCache(int(float(os.getenv('RESULT_CACHE_MAX_GB', '1')) * 2**30))
+
+@st.cache_resource
+def get_export_cache() -> ResultCache:
+    """Encoded GeoTIFF/GeoJSON downloads, kept apart from the analysis results"""
+    return ResultCache(int(float(os.getenv('EXPORT_CACHE_MAX_MB', '256')) * 2**20))
+
+def cached_export(result_key, kind, encode, stage_name: str) -> bytes:
+    """Bytes of an export of one analysis result, encoded on first request"""
+    export_cache = get_export_cache()
+    data = export_cache.get((result_key, kind))
+    if data is None:
+        with stage(stage_name):
+            data = export_cache.put((result_key, kind), encode())
+    return data
+
+@st.cache_resource
+def get_view_cache() -> ResultCache:
+    """Rendered PNG views, kept apart from the analysis results"""
+    return ResultCache(int(float(os.getenv('VIEW_CACHE_MAX_MB', '128')) * 2**20))
+
 # Helper functions
 def save_uploaded_file(uploaded_file) -> str:
     """Save uploaded file to temporary location and return path"""
@@ -59,8 +102,19 @@ def save_uploaded_file(uploaded_file) -> str:
     st.session_state.temp_files.append(str(temp_path))
     return str(temp_path)
 
+def file_mtime(file_path: str) -> float:
+    """Modification time used to invalidate cached per-file results"""
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return 0.0
+
 def get_image_info(file_path: str) -> Dict:
-    """Extract metadata from satellite image"""
+    """Extract metadata from satellite image (cached per path and mtime)"""
+    return _image_info(file_path, file_mtime(file_path))
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _image_info(file_path: str, mtime: float) -> Dict:
     try:
         with rasterio.open(file_path) as src:
             return {
@@ -82,44 +136,220 @@ def get_image_info(file_path: str) -> Dict:
             'error': str(e)
         }
 
-def create_thumbnail(file_path: str, max_size: int = 200) -> np.ndarray:
-    """Create thumbnail for image preview"""
+def build_overviews(file_path: str, min_size: int = 256):
+    """Write a .ovr file with average-resampled overviews next to the image"""
+    # External overviews leave the GeoTIFF itself (and its mtime) untouched
+    with rasterio.Env(TIFF_USE_OVR=True):
+        with rasterio.open(file_path, 'r+') as dst:
+            factors = []
+            factor = 2
+            while min(dst.height, dst.width) // factor >= min_size:
+                factors.append(factor)
+                factor *= 2
+            if factors:
+                dst.build_overviews(factors, rasterio.enums.Resampling.average)
+
+def overview_level(src, max_size: int):
+    """Index of the coarsest overview still at least max_size on each side"""
+    level = None
+    for i, factor in enumerate(src.overviews(1)):
+        if min(src.height, src.width) // factor >= max_size:
+            level = i
+    return level
+
+def create_thumbnail(file_path: str, max_size: int = 200,
+                     build_missing_overviews: bool = False) -> np.ndarray:
+    """Create thumbnail for image preview (cached per path and mtime)"""
     try:
-        with rasterio.open(file_path) as src:
-            # Read the image at lower resolution
-            out_shape = (
-                src.count,
-                max_size,
-                max_size
-            )
-            
-            data = src.read(
-                out_shape=out_shape,
-                resampling=rasterio.enums.Resampling.average
-            )
-            
-            # Normalize to 0-1
-            normalized = np.zeros_like(data, dtype=np.float32)
-            for i in range(data.shape[0]):
-                band = data[i].astype(np.float32)
-                band_min, band_max = band.min(), band.max()
-                if band_max > band_min:
-                    normalized[i] = (band - band_min) / (band_max - band_min)
-                else:
-                    normalized[i] = band
-            
-            # Create RGB composite
-            if normalized.shape[0] >= 3:
-                rgb = np.stack([normalized[0], normalized[1], normalized[2]], axis=2)
-            else:
-                gray = normalized[0]
-                rgb = np.stack([gray, gray, gray], axis=2)
-            
-            return np.clip(rgb, 0, 1)
+        return _thumbnail(file_path, file_mtime(file_path), max_size, build_missing_overviews)
     except Exception as e:
         st.error(f"Error creating thumbnail: {e}")
         return np.zeros((max_size, max_size, 3))
 
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _thumbnail(file_path: str, mtime: float, max_size: int,
+               build_missing_overviews: bool) -> np.ndarray:
+    with rasterio.open(file_path) as src:
+        has_overviews = bool(src.overviews(1))
+    if not has_overviews and build_missing_overviews:
+        try:
+            build_overviews(file_path)
+        except rasterio.errors.RasterioError:
+            pass  # read-only location; fall back to the full-resolution read
+    
+    with rasterio.open(file_path) as src:
+        level = overview_level(src, max_size)
+    
+    # Reading from an overview touches only a small fraction of the pixels
+    open_options = {} if level is None else {'overview_level': level}
+    with rasterio.open(file_path, **open_options) as src:
+        # Read the image at lower resolution
+        out_shape = (
+            src.count,
+            max_size,
+            max_size
+        )
+        
+        data = src.read(
+            out_shape=out_shape,
+            resampling=rasterio.enums.Resampling.average
+        )
+    
+    # Normalize to 0-1
+    normalized = np.zeros_like(data, dtype=np.float32)
+    for i in range(data.shape[0]):
+        band = data[i].astype(np.float32)
+        band_min, band_max = band.min(), band.max()
+        if band_max > band_min:
+            normalized[i] = (band - band_min) / (band_max - band_min)
+        else:
+            normalized[i] = band
+    
+    # Create RGB composite
+    if normalized.shape[0] >= 3:
+        rgb = np.stack([normalized[0], normalized[1], normalized[2]], axis=2)
+    else:
+        gray = normalized[0]
+        rgb = np.stack([gray, gray, gray], axis=2)
+    
+    return np.clip(rgb, 0, 1)
+
+def create_display_image(img: np.ndarray) -> np.ndarray:
+    """RGB (or gray) composite of a normalized image stack, as a channels-last view"""
+    # DisplayPyramid clips and converts to 8 bits, so no float copy is made here
+    if img.shape[0] >= 3:
+        return np.moveaxis(img[:3], 0, -1)
+    return np.broadcast_to(img[0][..., np.newaxis], img.shape[1:] + (3,))
+
+def run_analysis(image1_path: str, image2_path: str, detection_method: str,
+                 threshold) -> Dict:
+    """Run change detection and prepare everything the results view renders"""
+    detector = ChangeDetector(image1_path, image2_path, disk_cache=raster_cache)
+    # Bands are decoded on demand, so each method only reads what it uses
+    detector.open_images()
+    
+    # Run analysis
+    if detection_method == "Threshold-based":
+        change_map = detector.detect_changes_threshold(threshold)
+        veg_results = None
+    elif detection_method == "Otsu Auto-threshold":
+        change_map = detector.detect_changes_otsu()
+        veg_results = None
+    elif detection_method == "Change Vector Detection":
+        change_map = detector.detect_changes_cvd(threshold)
+        veg_results = None
+    else:  # Vegetation Analysis
+        veg_results = detector.detect_vegetation_change()
+        if veg_results:
+            change_map = veg_results.get('vegetation_loss', np.zeros((100, 100)))
+        else:
+            change_map = np.zeros((100, 100))
+    
+    stats = detector.analyze_change_statistics(change_map)
+    
+    # Render-ready image pyramids, built once per analysis
+    img1_norm, img2_norm = detector.normalize_images(detector.display_bands())
+    if veg_results:
+        # NDVI runs show the NDVI change magnitude, which needs no other bands
+        intensity_view = 'NDVI Change Magnitude'
+        diff = np.abs(veg_results['ndvi_change'])
+    else:
+        intensity_view = 'Change Intensity'
+        diff = detector.calculate_difference('absolute')
+    with stage('display pyramids'):
+        later = DisplayPyramid(create_display_image(img2_norm))
+        changes = DisplayPyramid(change_map.astype(np.uint8), reduce='max',
+                                 cmap='RdYlGn_r', vmin=0, vmax=1)
+        views = {
+            'Earlier Image': DisplayPyramid(create_display_image(img1_norm)),
+            'Later Image': later,
+            'Change Overlay': later.with_overlay(changes),  # Red for changes
+            'Binary Change Map': changes,
+            intensity_view: DisplayPyramid(diff, cmap='hot')
+        }
+        if veg_results:
+            views['NDVI - Earlier'] = DisplayPyramid(veg_results['ndvi1'], cmap='RdYlGn', vmin=-1, vmax=1)
+            views['NDVI - Later'] = DisplayPyramid(veg_results['ndvi2'], cmap='RdYlGn', vmin=-1, vmax=1)
+            views['NDVI Change'] = DisplayPyramid(veg_results['ndvi_change'], cmap='RdBu',
+                                                  vmin=-0.5, vmax=0.5)
+    
+    return {
+        'change_map': change_map,
+        'stats': stats,
+        'veg_results': veg_results,
+        'views': views,
+        'intensity_view': intensity_view,
+        'georef': {'crs': detector.grid['crs'],
+                   'transform': detector.grid['transform']}
+    }
+
+@traced('render view')
+def show_view(result_key, views: Dict[str, DisplayPyramid], name: str, size: int,
+              caption: str = None, colorbar_label: str = None, window=None):
+    """Show a cached PNG rendering of a pyramid view, with an optional colorbar"""
+    view = views[name]
+    view_cache = get_view_cache()
+    key = (result_key, name, view.view_key(size, window))
+    png = view_cache.get(key)
+    if png is None:
+        png = view_cache.put(key, view.render(size, window))
+    st.image(png, caption=caption, width='stretch')
+    if colorbar_label is not None:
+        st.image(colorbar_png(view.cmap, view.vmin, view.vmax, colorbar_label))
+
+def show_ai_summary(summary_future):
+    """Show an AI summary generated in the background, polling until it is ready"""
+    pending = not summary_future.done()
+    
+    @st.fragment(run_every=1.0 if pending else None)
+    def summary_box():
+        if summary_future.done():
+            if pending:
+                # Full rerun to redraw the box without polling
+                st.rerun()
+            # Display summary in a nice box
+            st.info(f"**📝 Summary:**\n\n{summary_future.result()}")
+        else:
+            st.caption("⏳ Generating natural language summary in the background...")
+    
+    summary_box()
+
+def show_performance_panel(*traces: StageTrace):
+    """Per-stage timings of the given traces, with JSON and Chrome trace downloads"""
+    st.markdown("---")
+    st.markdown("### ⏱️ Performance")
+    for trace in traces:
+        st.markdown(f"##### {trace.name.capitalize()}")
+        records = trace.to_dict()['records']
+        if not records:
+            st.caption("No stages recorded")
+            continue
+        table = pd.DataFrame({
+            'Stage': ['\u2003' * r['depth'] + r['name'] for r in records],
+            'Wall (ms)': [r['wall'] * 1e3 for r in records],
+            'CPU (ms)': [r['cpu'] * 1e3 for r in records],
+            'Allocated (MB)': [r['allocated'] / 2**20 if 'allocated' in r else None for r in records],
+            'Peak (MB)': [r['peak'] / 2**20 if 'peak' in r else None for r in records]
+        })
+        st.dataframe(table.round(2), hide_index=True, width='stretch')
+    st.caption("Analysis stages come from the run that computed the (possibly cached) result")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📥 Download Trace (JSON)",
+            data=json.dumps({trace.name: trace.to_dict() for trace in traces}, indent=2),
+            file_name=f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+    with col2:
+        st.download_button(
+            label="📥 Download Chrome Trace",
+            data=chrome_trace(list(traces)),
+            file_name=f"chrome_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+
 def remove_image(index: int):
     """Remove image from session state"""
     if 0 <= index < len(st.session_state.uploaded_images):
@@ -245,6 +475,12 @@ else:  # Use existing files
     else:
         st.sidebar.warning("No TIF files found in directory")
 
+build_missing_overviews = st.sidebar.checkbox(
+    "Build missing overviews",
+    value=False,
+    help="Write a .ovr file next to images without overviews so thumbnails load instantly"
+)
+
 # Display loaded images count
 st.sidebar.markdown("---")
 st.sidebar.metric("Loaded Images", len(st.session_state.uploaded_images))
@@ -306,6 +542,18 @@ if len(st.session_state.uploaded_images) >= 2:
     
     show_overlay = st.sidebar.checkbox("Show Change Overlay", value=True)
     show_heatmap = st.sidebar.checkbox("Show Intensity Heatmap", value=True)
+    display_size = st.sidebar.select_slider(
+        "Display Resolution",
+        options=[512, 768, 1024, 1536, 2048],
+        value=768,
+        help="Longest side of the rendered images in pixels; views come from a downsampled pyramid"
+    )
+    
+    show_performance = st.sidebar.checkbox(
+        "Show Performance Panel",
+        value=False,
+        help="Time every stage (wall time, CPU time, allocated memory) and export the trace"
+    )
     
     # Analysis button
     st.sidebar.markdown("---")
@@ -344,7 +592,8 @@ with tab1:
         col1, col2 = st.columns([1, 2])
         
         with col1:
-            thumbnail = create_thumbnail(st.session_state.uploaded_images[0])
+            thumbnail = create_thumbnail(st.session_state.uploaded_images[0],
+                                         build_missing_overviews=build_missing_overviews)
             fig, ax = plt.subplots(figsize=(6, 6))
             ax.imshow(thumbnail)
             ax.axis('off')
@@ -360,37 +609,32 @@ with tab1:
     else:
         # We have enough images for analysis
         if analyze_button or (st.session_state.analysis_results and image1_idx == st.session_state.analysis_results.get('image1_idx') and image2_idx == st.session_state.analysis_results.get('image2_idx')):
-            with st.spinner("🔄 Processing satellite images..."):
+            # Stages of this rerun are timed for the optional Performance panel
+            rerun_trace = StageTrace('dashboard rerun', track_memory=show_performance)
+            with rerun_trace.activate():
                 try:
-                    # Create detector
-                    detector = ChangeDetector(
-                        st.session_state.uploaded_images[image1_idx],
-                        st.session_state.uploaded_images[image2_idx]
-                    )
-                    detector.load_images()
-                    
-                    # Run analysis
-                    if detection_method == "Threshold-based":
-                        change_map = detector.detect_changes_threshold(threshold)
-                        veg_results = None
-                    elif detection_method == "Otsu Auto-threshold":
-                        change_map = detector.detect_changes_otsu()
-                        veg_results = None
-                    elif detection_method == "Change Vector Detection":
-                        change_map = detector.detect_changes_cvd(threshold)
-                        veg_results = None
-                    else:  # Vegetation Analysis
-                        veg_results = detector.detect_vegetation_change()
-                        if veg_results:
-                            change_map = veg_results.get('vegetation_loss', np.zeros((100, 100)))
-                        else:
-                            change_map = np.zeros((100, 100))
-                    
-                    stats = detector.analyze_change_statistics(change_map)
-                    
+                    # Serve repeat runs (e.g. a toggled checkbox) from the result cache
+                    image1_path = st.session_state.uploaded_images[image1_idx]
+                    image2_path = st.session_state.uploaded_images[image2_idx]
+                    result_key = (file_identity(image1_path), file_identity(image2_path),
+                                  detection_method, threshold)
+                    result_cache = get_result_cache()
+                    results = result_cache.get(result_key)
+                    if results is None:
+                        analysis_trace = StageTrace('analysis', track_memory=show_performance)
+                        with st.spinner("🔄 Processing satellite images..."), stage('analysis'):
+                            with analysis_trace.activate():
+                                results = run_analysis(image1_path, image2_path,
+                                                       detection_method, threshold)
+                            results['trace'] = analysis_trace
+                            result_cache.put(result_key, results)
+                
+                    change_map = results['change_map']
+                    stats = results['stats']
+                    veg_results = results['veg_results']
+                
                     # Store results
                     st.session_state.analysis_results = {
-                        'detector': detector,
                         'change_map': change_map,
                         'stats': stats,
                         'veg_results': veg_results,
@@ -398,178 +642,128 @@ with tab1:
                         'image1_idx': image1_idx,
                         'image2_idx': image2_idx
                     }
-                    
+                
                     st.success("✅ Analysis completed successfully!")
-                    
+                
                     # Display results
                     st.markdown("---")
                     st.markdown("### 📊 Key Performance Indicators")
-                    
+                
                     col1, col2, col3, col4 = st.columns(4)
-                    
+                
                     with col1:
                         st.metric(
                             label="Total Area Analyzed",
                             value=f"{stats['total_pixels']:,}",
                             delta="pixels"
                         )
-                    
+                
                     with col2:
                         st.metric(
                             label="Changed Area",
                             value=f"{stats['changed_pixels']:,}",
                             delta=f"{stats['change_percentage']:.2f}%"
                         )
-                    
+                
                     with col3:
                         st.metric(
                             label="Change Regions",
                             value=f"{stats['num_change_regions']:,}",
                             delta="detected"
                         )
-                    
+                
                     with col4:
                         st.metric(
                             label="Avg Region Size",
                             value=f"{stats['mean_region_size']:.0f}",
                             delta="pixels"
                         )
-                    
+                
                     # AI-Powered Summary
                     if enable_ai_summary:
                         st.markdown("---")
                         st.markdown("### 🤖 AI-Powered Insight")
-                        
-                        with st.spinner("🔄 Generating natural language summary..."):
-                            summary = generate_summary(stats, detection_method, gemini_api_key)
-                        
-                        # Display summary in a nice box
-                        st.info(f"**📝 Summary:**\n\n{summary}")
-                        
-                        # Quick insight (no API needed)
+                    
+                        # Quick insight (no API needed) shows while the summary is generated
                         quick_insight = get_quick_insight(stats['change_percentage'])
                         st.caption(f"**Quick Insight:** {quick_insight}")
                     
+                        with stage('AI summary request'):
+                            summary_future = submit_summary(stats, detection_method, gemini_api_key,
+                                                            timeout=AI_SUMMARY_TIMEOUT)
+                        show_ai_summary(summary_future)
+                
                     # Visualizations
                     st.markdown("---")
                     st.markdown("### 🗺️ Change Detection Visualizations")
-                    
-                    # Get normalized images for display
-                    img1_norm, img2_norm = detector.normalize_images()
-                    
-                    # Create display images
-                    def create_display_image(img):
-                        if img.shape[0] >= 3:
-                            rgb = np.stack([img[0], img[1], img[2]], axis=2)
-                        else:
-                            gray = img[0]
-                            rgb = np.stack([gray, gray, gray], axis=2)
-                        return np.clip(rgb, 0, 1)
-                    
-                    display_img1 = create_display_image(img1_norm)
-                    display_img2 = create_display_image(img2_norm)
-                    
-                    # Create overlay
-                    overlay = display_img2.copy()
-                    overlay[change_map == 1] = [1, 0, 0]  # Red for changes
-                    
+                
+                    views = results['views']
+                
                     # Display images
                     col1, col2, col3 = st.columns(3)
-                    
+                
                     with col1:
                         st.markdown("##### 📅 Earlier Image")
-                        fig1, ax1 = plt.subplots(figsize=(8, 8))
-                        ax1.imshow(display_img1)
-                        ax1.axis('off')
-                        ax1.set_title(st.session_state.image_metadata[image1_idx]['name'], fontsize=10)
-                        st.pyplot(fig1)
-                        plt.close()
-                    
+                        show_view(result_key, views, 'Earlier Image', display_size,
+                                  st.session_state.image_metadata[image1_idx]['name'])
+                
                     with col2:
                         st.markdown("##### 📅 Later Image")
-                        fig2, ax2 = plt.subplots(figsize=(8, 8))
-                        ax2.imshow(display_img2)
-                        ax2.axis('off')
-                        ax2.set_title(st.session_state.image_metadata[image2_idx]['name'], fontsize=10)
-                        st.pyplot(fig2)
-                        plt.close()
-                    
+                        show_view(result_key, views, 'Later Image', display_size,
+                                  st.session_state.image_metadata[image2_idx]['name'])
+                
                     with col3:
                         if show_overlay:
                             st.markdown("##### 🔴 Change Detection")
-                            fig3, ax3 = plt.subplots(figsize=(8, 8))
-                            ax3.imshow(overlay)
-                            ax3.axis('off')
-                            ax3.set_title("Changes Highlighted in Red", fontsize=10)
-                            st.pyplot(fig3)
-                            plt.close()
-                    
+                            show_view(result_key, views, 'Change Overlay', display_size,
+                                      "Changes Highlighted in Red")
+                
                     # Additional visualizations
                     if show_heatmap or show_overlay:
                         st.markdown("---")
                         cols = st.columns(2)
-                        
+                    
                         if show_overlay:
                             with cols[0]:
                                 st.markdown("##### 🗺️ Binary Change Map")
-                                fig4, ax4 = plt.subplots(figsize=(10, 8))
-                                im = ax4.imshow(change_map, cmap='RdYlGn_r', interpolation='nearest')
-                                ax4.axis('off')
-                                ax4.set_title("Red = Changed, Green = Unchanged", fontsize=12)
-                                plt.colorbar(im, ax=ax4)
-                                st.pyplot(fig4)
-                                plt.close()
-                        
+                                show_view(result_key, views, 'Binary Change Map', display_size,
+                                          "Red = Changed, Green = Unchanged")
+                    
                         if show_heatmap:
                             with cols[1]:
-                                st.markdown("##### 📈 Change Intensity Heatmap")
-                                diff = detector.calculate_difference('absolute')
-                                fig5, ax5 = plt.subplots(figsize=(10, 8))
-                                im = ax5.imshow(diff, cmap='hot', interpolation='bilinear')
-                                ax5.axis('off')
-                                ax5.set_title("Intensity of Changes", fontsize=12)
-                                plt.colorbar(im, ax=ax5, label='Change Magnitude')
-                                st.pyplot(fig5)
-                                plt.close()
-                    
+                                intensity_view = results['intensity_view']
+                                st.markdown(f"##### 📈 {intensity_view} Heatmap")
+                                if intensity_view == 'Change Intensity':
+                                    show_view(result_key, views, intensity_view, display_size,
+                                              "Intensity of Changes", colorbar_label='Change Magnitude')
+                                else:
+                                    show_view(result_key, views, intensity_view, display_size,
+                                              "Absolute NDVI change between the dates",
+                                              colorbar_label='|NDVI Δ|')
+                
                     # Vegetation analysis
                     if veg_results and detection_method == "Vegetation Analysis":
                         st.markdown("---")
                         st.markdown("### 🌿 Vegetation Change Analysis")
-                        
+                    
                         col1, col2, col3 = st.columns(3)
-                        
+                    
                         with col1:
                             st.markdown("##### NDVI - Earlier")
-                            fig, ax = plt.subplots(figsize=(8, 8))
-                            im = ax.imshow(veg_results['ndvi1'], cmap='RdYlGn', vmin=-1, vmax=1)
-                            ax.axis('off')
-                            plt.colorbar(im, ax=ax, label='NDVI')
-                            st.pyplot(fig)
-                            plt.close()
-                        
+                            show_view(result_key, views, 'NDVI - Earlier', display_size, colorbar_label='NDVI')
+                    
                         with col2:
                             st.markdown("##### NDVI - Later")
-                            fig, ax = plt.subplots(figsize=(8, 8))
-                            im = ax.imshow(veg_results['ndvi2'], cmap='RdYlGn', vmin=-1, vmax=1)
-                            ax.axis('off')
-                            plt.colorbar(im, ax=ax, label='NDVI')
-                            st.pyplot(fig)
-                            plt.close()
-                        
+                            show_view(result_key, views, 'NDVI - Later', display_size, colorbar_label='NDVI')
+                    
                         with col3:
                             st.markdown("##### NDVI Change")
-                            fig, ax = plt.subplots(figsize=(8, 8))
-                            im = ax.imshow(veg_results['ndvi_change'], cmap='RdBu', vmin=-0.5, vmax=0.5)
-                            ax.axis('off')
-                            plt.colorbar(im, ax=ax, label='NDVI Δ')
-                            st.pyplot(fig)
-                            plt.close()
-                        
+                            show_view(result_key, views, 'NDVI Change', display_size, colorbar_label='NDVI Δ')
+                    
                         # Vegetation stats
                         veg_loss_pixels = np.sum(veg_results['vegetation_loss'])
                         veg_gain_pixels = np.sum(veg_results['vegetation_gain'])
-                        
+                    
                         col1, col2 = st.columns(2)
                         with col1:
                             st.metric(
@@ -583,24 +777,81 @@ with tab1:
                                 f"{veg_gain_pixels:,} pixels",
                                 f"+{(veg_gain_pixels/stats['total_pixels']*100):.2f}%"
                             )
+                
+                    # Zoom & pan: finer pyramid levels are only rendered on request
+                    st.markdown("---")
+                    if st.checkbox("🔍 Zoom & Pan", value=False):
+                        height, width = change_map.shape
+                        zcol1, zcol2, zcol3, zcol4 = st.columns(4)
+                        with zcol1:
+                            zoom_view = st.selectbox("Layer", list(views.keys()), index=2)
+                        with zcol2:
+                            zoom = st.select_slider("Zoom", options=[1, 2, 4, 8, 16, 32], value=4)
+                        with zcol3:
+                            center_x = st.slider("Center X (%)", 0, 100, 50)
+                        with zcol4:
+                            center_y = st.slider("Center Y (%)", 0, 100, 50)
                     
+                        span_rows, span_cols = max(1, height // zoom), max(1, width // zoom)
+                        row0 = min(max(0, height * center_y // 100 - span_rows // 2), height - span_rows)
+                        col0 = min(max(0, width * center_x // 100 - span_cols // 2), width - span_cols)
+                        window = (row0, row0 + span_rows, col0, col0 + span_cols)
+                        show_view(result_key, views, zoom_view, display_size,
+                                  f"{zoom_view} - rows {row0}-{row0 + span_rows}, "
+                                  f"columns {col0}-{col0 + span_cols}", window=window)
+                
                     # Export section
                     st.markdown("---")
                     st.markdown("### 💾 Export Results")
-                    
+                
                     col1, col2 = st.columns(2)
-                    
+                
                     with col1:
-                        # Export change map
-                        change_df = pd.DataFrame(change_map)
-                        csv = change_df.to_csv(index=False)
+                        # Export change map as a compressed, georeferenced 1-bit GeoTIFF
+                        export_format = st.radio("Change map format", ["GeoTIFF", "Cloud-Optimized GeoTIFF"],
+                                                 horizontal=True)
+                        cog = export_format == "Cloud-Optimized GeoTIFF"
+                        geotiff_data = cached_export(
+                            result_key, ('geotiff', cog),
+                            lambda: geotiff_bytes(change_map, nbits=1, cog=cog,
+                                                  **results['georef']),
+                            'export GeoTIFF')
                         st.download_button(
-                            label="📥 Download Change Map (CSV)",
-                            data=csv,
-                            file_name=f"change_map_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv"
+                            label=f"📥 Download Change Map ({export_format})",
+                            data=geotiff_data,
+                            file_name=f"change_map_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tif",
+                            mime="image/tiff"
                         )
                     
+                        # Dense CSV text only stays practical for small maps
+                        if change_map.size <= CSV_EXPORT_MAX_PIXELS:
+                            if st.checkbox("Also offer CSV", value=False):
+                                st.download_button(
+                                    label="📥 Download Change Map (CSV)",
+                                    data=pd.DataFrame(change_map).to_csv(index=False),
+                                    file_name=f"change_map_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                                    mime="text/csv"
+                                )
+                        else:
+                            st.caption(f"CSV export is limited to maps of up to "
+                                       f"{CSV_EXPORT_MAX_PIXELS:,} pixels")
+                    
+                        # Change regions as simplified polygons in longitude/latitude
+                        if st.checkbox("Prepare change polygons (GeoJSON)", value=False):
+                            min_area = st.number_input("Minimum region area (map units²)",
+                                                       min_value=0.0, value=0.0)
+                            geojson_data = cached_export(
+                                result_key, ('geojson', min_area),
+                                lambda: geojson_bytes(change_map, min_area=min_area,
+                                                      **results['georef']),
+                                'export polygons')
+                            st.download_button(
+                                label="📥 Download Change Polygons (GeoJSON)",
+                                data=geojson_data,
+                                file_name=f"change_polygons_{datetime.now().strftime('%Y%m%d_%H%M%S')}.geojson",
+                                mime="application/geo+json"
+                            )
+                
                     with col2:
                         # Export statistics
                         stats_df = pd.DataFrame({
@@ -614,6 +865,9 @@ with tab1:
                             file_name=f"statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                             mime="text/csv"
                         )
+                
+                    if show_performance:
+                        show_performance_panel(results['trace'], rerun_trace)
                     
                 except Exception as e:
                     st.error(f"❌ Error during analysis: {str(e)}")
@@ -637,7 +891,9 @@ with tab2:
                 if idx < len(st.session_state.uploaded_images):
                     with col:
                         # Image preview
-                        thumbnail = create_thumbnail(st.session_state.uploaded_images[idx])
+                        thumbnail = create_thumbnail(
+                            st.session_state.uploaded_images[idx],
+                            build_missing_overviews=build_missing_overviews)
                         fig, ax = plt.subplots(figsize=(6, 6))
                         ax.imshow(thumbnail)
                         ax.axis('off')
@@ -0,0 +1,462 @@
+"""
+Headless batch change detection over a manifest of image pairs
+Every job runs in its own worker process, under an optional address-space
+limit, and writes its change map and statistics to a directory of its own.
+Pairs on the same pixel grid go through the streaming TiledChangeDetector;
+other pairs (another CRS, resolution, offset or extent) go through
+ChangeDetector, which analyzes their overlap in memory. Finished jobs record the identity of
+their inputs, so rerunning the same manifest only redoes jobs that failed,
+never ran or whose inputs changed. A machine-readable summary.json is
+updated as jobs finish. With --summarize, finished jobs also get an AI
+summary, requested in packed, rate-limited batches once the detection jobs
+are done (the API key comes from GEMINI_API_KEY, the backend from
+SUMMARY_BACKEND).
+
+Manifests are CSV files with a header, or JSON lists of objects, with the
+fields image1, image2 and optionally id, method and threshold. Relative
+image paths are resolved against the manifest's directory.
+
+Usage:
+    python batch.py manifest.csv --output-dir results --workers 8 --memory-limit-gb 4
+    python batch.py manifest.csv --output-dir results --summarize --summary-rpm 30
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import logging
+
+import numpy as np
+import rasterio
+
+from alignment import overlap_grid
+from change_detector import ChangeDetector
+from raster_export import geotiff_profile
+from result_cache import file_identity
+from tiled_detector import TiledChangeDetector
+from tiling import init_worker, pool_context
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_METHODS = ('threshold', 'otsu', 'cvd', 'vegetation')
+
+DEFAULT_THRESHOLDS = {'threshold': 0.15, 'cvd': 0.1}
+
+# Method names as the dashboard shows them, used in summary prompts
+METHOD_NAMES = {'threshold': 'Threshold-based', 'otsu': 'Otsu Auto-threshold',
+                'cvd': 'Change Vector Detection', 'vegetation': 'Vegetation Analysis'}
+
+
+def read_manifest(path: str, default_method: str = 'threshold') -> List[Dict]:
+    """
+    Read the jobs of a CSV or JSON manifest
+
+    Args:
+        path: Manifest file
+        default_method: Method of jobs that do not name one
+
+    Returns:
+        Job dictionaries with absolute image paths, a unique id, a method and
+        a threshold (None for methods without one)
+    """
+    path = Path(path)
+    with open(path, newline='') as f:
+        if path.suffix.lower() == '.json':
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs, seen = [], set()
+    for number, row in enumerate(rows, 1):
+        if not row.get('image1') or not row.get('image2'):
+            raise ValueError(f"Manifest entry {number} needs image1 and image2")
+        image1 = (path.parent / row['image1']).resolve()
+        image2 = (path.parent / row['image2']).resolve()
+        method = row.get('method') or default_method
+        if method not in BATCH_METHODS:
+            raise ValueError(f"Manifest entry {number}: unknown method {method}")
+        threshold = row.get('threshold')
+        threshold = float(threshold) if threshold not in (None, '') else DEFAULT_THRESHOLDS.get(method)
+
+        job_id = str(row.get('id') or f"{image1.stem}__{image2.stem}__{method}")
+        if job_id in seen:
+            raise ValueError(f"Duplicate job id in manifest: {job_id}")
+        seen.add(job_id)
+        jobs.append({'id': job_id, 'image1': str(image1), 'image2': str(image2),
+                     'method': method, 'threshold': threshold})
+    return jobs
+
+
+def job_spec(job: Dict) -> Dict:
+    """
+    Everything a job's result depends on, including the identity of its inputs
+    """
+    return {
+        'image1': job['image1'],
+        'image2': job['image2'],
+        'method': job['method'],
+        'threshold': job['threshold'],
+        'tile_size': job['tile_size'],
+        'inputs': [list(file_identity(job['image1'])), list(file_identity(job['image2']))]
+    }
+
+
+def _result_path(job: Dict) -> Path:
+    return Path(job['output_dir']) / 'result.json'
+
+
+def is_complete(job: Dict) -> Optional[Dict]:
+    """
+    Stored result of a job that already finished with the same inputs
+
+    Returns:
+        The result, or None if the job has to run
+    """
+    try:
+        with open(_result_path(job)) as f:
+            result = json.load(f)
+        spec = json.loads(json.dumps(job_spec(job)))
+    except (OSError, ValueError):
+        return None
+    if result.get('status') == 'done' and result.get('job') == spec:
+        return result
+    return None
+
+
+def _write_json(path: Path, data: Dict):
+    """Write JSON atomically so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def memory_limit(max_bytes: Optional[int]):
+    """
+    Cap the address space of the current process while the block runs
+
+    Allocations beyond the cap raise MemoryError. Has no effect when
+    max_bytes is None or the platform has no resource limits.
+    """
+    if max_bytes is None or resource is None:
+        yield
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = max_bytes if hard == resource.RLIM_INFINITY else min(max_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def shares_grid(image1: str, image2: str) -> bool:
+    """
+    Whether two rasters cover the same pixel grid
+
+    Raises:
+        ValueError: If they do not overlap or cannot be aligned
+    """
+    with rasterio.open(image1) as src1, rasterio.open(image2) as src2:
+        metadata1 = ChangeDetector._read_metadata(src1)
+        metadata2 = ChangeDetector._read_metadata(src2)
+    return overlap_grid(metadata1, metadata2)['full']
+
+
+def _run_tiled(job: Dict, change_map: str):
+    """Stream a pair on a shared grid; returns (statistics, threshold)"""
+    detector = TiledChangeDetector(job['image1'], job['image2'],
+                                   tile_size=job['tile_size'], workers=1)
+    method, threshold = job['method'], job['threshold']
+    if method == 'threshold':
+        detector.detect_changes_threshold(change_map, threshold)
+    elif method == 'otsu':
+        detector.detect_changes_otsu(change_map)
+        threshold = int(detector.otsu_threshold())
+    elif method == 'cvd':
+        detector.detect_changes_cvd(change_map, threshold)
+    elif detector.detect_vegetation_change(change_map) is None:
+        raise ValueError("Not enough bands for vegetation analysis")
+
+    # Band 1 holds the change map (vegetation loss for NDVI jobs)
+    return detector.analyze_change_statistics(change_map), threshold
+
+
+def _run_on_overlap(job: Dict, change_map: str):
+    """
+    Analyze the overlap of a pair on different grids; returns (statistics,
+    threshold). The outputs match the tiled ones, on the overlap grid.
+    """
+    detector = ChangeDetector(job['image1'], job['image2'])
+    detector.open_images()
+    method, threshold = job['method'], job['threshold']
+    if method == 'vegetation':
+        veg_results = detector.detect_vegetation_change()
+        if not veg_results:
+            raise ValueError("Not enough bands for vegetation analysis")
+        grid = detector.grid
+        profile = geotiff_profile(grid['height'], grid['width'], grid['crs'],
+                                  grid['transform'], count=2)
+        with rasterio.open(change_map, 'w', **profile) as dst:
+            dst.set_band_description(1, 'vegetation_loss')
+            dst.set_band_description(2, 'vegetation_gain')
+            dst.write(np.stack([veg_results['vegetation_loss'], veg_results['vegetation_gain']]))
+        change = veg_results['vegetation_loss']
+    else:
+        if method == 'otsu':
+            change = detector.detect_changes_otsu()
+            threshold = int(detector.otsu_threshold())
+        else:
+            change = getattr(detector, f'detect_changes_{method}')(threshold)
+        detector.export_change_map(change, change_map)
+    return detector.analyze_change_statistics(change, tile_size=job['tile_size']), threshold
+
+
+def run_job(job: Dict) -> Dict:
+    """
+    Run one job and store its outputs; errors are recorded, not raised
+
+    Returns:
+        Result dictionary with 'id', 'status' ('done' or 'failed'),
+        'seconds' and either 'stats', 'outputs' and 'aligned' (whether the
+        pair shared its pixel grid) or 'error'
+    """
+    output_dir = Path(job['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result = {'id': job['id']}
+    start = time.perf_counter()
+    try:
+        result['job'] = job_spec(job)
+        with memory_limit(job['memory_limit']):
+            change_map = str(output_dir / 'change_map.tif')
+            aligned = shares_grid(job['image1'], job['image2'])
+            run = _run_tiled if aligned else _run_on_overlap
+            stats, threshold = run(job, change_map)
+        result.update(status='done', threshold=threshold, stats=stats, aligned=aligned,
+                      outputs={'change_map': change_map})
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {e}",
+                      traceback=traceback.format_exc())
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    _write_json(output_dir / 'result.json', result)
+    return result
+
+
+def _run_isolated(func: Callable, job: Dict) -> Dict:
+    """Run one job in a fresh single-worker pool, surviving a worker crash"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=pool_context(),
+                             initializer=init_worker) as executor:
+        try:
+            return executor.submit(func, job).result()
+        except BrokenProcessPool:
+            return {'id': job['id'], 'status': 'failed', 'error': 'Worker process died'}
+
+
+def run_jobs(func: Callable, jobs: Iterable[Dict], workers: int = 1) -> Iterator[Dict]:
+    """
+    Run jobs in a process pool, yielding results in completion order
+
+    A worker that dies outright (e.g. a native allocation failed or the OOM
+    killer stepped in) breaks the whole pool, and every job in flight fails
+    with it. Those jobs are retried one by one, each in a pool of its own,
+    so only the job that crashes is marked as failed; the jobs not started
+    yet continue in a fresh pool of the full size.
+
+    Args:
+        func: Module-level function running one job and returning its result
+        jobs: Picklable job dictionaries with an 'id'
+        workers: Number of jobs run at once
+
+    Yields:
+        The result of every job
+    """
+    if workers <= 1:
+        yield from map(func, jobs)
+        return
+
+    queue = deque(jobs)
+    while queue:
+        crashed = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                                 initializer=init_worker) as executor:
+            # Submit no more jobs than workers, so every job in flight is running
+            running = {}
+            while queue or running:
+                while queue and len(running) < workers and not crashed:
+                    job = queue.popleft()
+                    running[executor.submit(func, job)] = job
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        crashed.append(job)
+
+        if crashed:
+            logger.error(f"A worker process died; retrying {len(crashed)} jobs in isolation")
+            for job in crashed:
+                yield _run_isolated(func, job)
+
+
+def summarize_results(jobs: List[Dict], results: Dict[str, Dict], on_update=None,
+                      **batch_options) -> int:
+    """
+    Add AI summaries to finished jobs that do not have one yet
+
+    Summaries are stored as 'ai_summary' in each job's result.json as they
+    arrive; failed requests are left out, so a rerun asks for them again.
+
+    Args:
+        jobs: Jobs of the batch
+        results: Results by job id, updated in place
+        on_update: Called after every stored summary
+        **batch_options: Passed on to ai_summarizer.summarize_batch
+
+    Returns:
+        Number of summaries stored
+    """
+    # Imported here so worker processes do not load the Gemini client
+    from ai_summarizer import ERROR_PREFIX, MISSING_KEY_MESSAGE, summarize_batch
+
+    todo = [job for job in jobs
+            if results.get(job['id'], {}).get('status') in ('done', 'skipped')
+            and 'ai_summary' not in results[job['id']]]
+    records = [(results[job['id']]['stats'], METHOD_NAMES[job['method']]) for job in todo]
+    stored = 0
+    for index, summary in summarize_batch(records, **batch_options):
+        if summary.startswith(ERROR_PREFIX) or summary == MISSING_KEY_MESSAGE:
+            logger.warning(f"No summary for job {todo[index]['id']}: {summary.splitlines()[0]}")
+            continue
+        result = results[todo[index]['id']]
+        result['ai_summary'] = summary
+        _write_json(_result_path(todo[index]), dict(result, status='done'))
+        stored += 1
+        if on_update is not None:
+            on_update()
+    return stored
+
+
+def run_batch(manifest: str, output_dir: str, workers: Optional[int] = None,
+              memory_limit_gb: Optional[float] = None, tile_size: int = 1024,
+              default_method: str = 'threshold', force: bool = False,
+              summarize: bool = False, summary_options: Optional[Dict] = None) -> Dict:
+    """
+    Run every job of a manifest, skipping jobs that already completed
+
+    Args:
+        manifest: CSV or JSON manifest of image pairs
+        output_dir: Directory for per-job outputs and summary.json
+        workers: Number of jobs run at once (None uses every core)
+        memory_limit_gb: Address-space limit of each job in GiB
+        tile_size: Tile edge length of the streaming detector
+        default_method: Method of manifest entries that do not name one
+        force: Rerun jobs that already completed
+        summarize: Add AI summaries to finished jobs
+        summary_options: Keyword arguments of summarize_batch, e.g. api_key,
+            requests_per_minute or max_concurrency
+
+    Returns:
+        The summary, as written to summary.json
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    memory_bytes = int(memory_limit_gb * 2**30) if memory_limit_gb else None
+    if memory_bytes and resource is None:
+        logger.warning("Memory limits are not supported on this platform")
+
+    jobs = read_manifest(manifest, default_method)
+    for job in jobs:
+        job.update(output_dir=str(output_dir / job['id']), tile_size=tile_size,
+                   memory_limit=memory_bytes)
+
+    results = {}
+    pending = []
+    for job in jobs:
+        previous = None if force else is_complete(job)
+        if previous is not None:
+            results[job['id']] = dict(previous, status='skipped')
+        else:
+            pending.append(job)
+    logger.info(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already complete")
+
+    summary = {'manifest': str(Path(manifest).resolve()), 'started': datetime.now().isoformat()}
+
+    def write_summary():
+        records = [results.get(job['id'], {'id': job['id'], 'status': 'pending'}) for job in jobs]
+        counts = {}
+        for record in records:
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+        summary.update(updated=datetime.now().isoformat(), counts=counts,
+                       jobs=[{key: value for key, value in record.items() if key != 'traceback'}
+                             for record in records])
+        _write_json(output_dir / 'summary.json', summary)
+
+    for result in run_jobs(run_job, pending, workers or os.cpu_count() or 1):
+        results[result['id']] = result
+        logger.info(f"Job {result['id']}: {result['status']} in {result.get('seconds', 0)}s")
+        write_summary()
+    if summarize:
+        stored = summarize_results(jobs, results, write_summary, **(summary_options or {}))
+        logger.info(f"Stored {stored} AI summaries")
+    write_summary()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch change detection over a manifest "
+                                                 "of image pairs")
+    parser.add_argument('manifest', help="CSV or JSON manifest (image1, image2[, id, method, threshold])")
+    parser.add_argument('--output-dir', '-o', default='batch_results')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Jobs run at once (default: every core)")
+    parser.add_argument('--memory-limit-gb', type=float, default=None,
+                        help="Address-space limit of each job")
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--method', default='threshold', choices=BATCH_METHODS,
+                        help="Method of manifest entries that do not name one")
+    parser.add_argument('--force', action='store_true', help="Rerun completed jobs too")
+    parser.add_argument('--summarize', action='store_true',
+                        help="Add AI summaries to finished jobs (key from GEMINI_API_KEY)")
+    parser.add_argument('--summary-rpm', type=float, default=60,
+                        help="Summary requests per minute")
+    parser.add_argument('--summary-concurrency', type=int, default=4,
+                        help="Summary requests in flight at once")
+    parser.add_argument('--summary-per-prompt', type=int, default=8,
+                        help="Results packed into one summary prompt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    summary_options = {'api_key': os.getenv('GEMINI_API_KEY'),
+                       'requests_per_minute': args.summary_rpm,
+                       'max_concurrency': args.summary_concurrency,
+                       'records_per_prompt': args.summary_per_prompt}
+    summary = run_batch(args.manifest, args.output_dir, args.workers, args.memory_limit_gb,
+                        args.tile_size, args.method, args.force, args.summarize,
+                        summary_options)
+    print(json.dumps(summary['counts']))
+    sys.exit(1 if summary['counts'].get('failed') else 0)
+
+
+if __name__ == "__main__":
+    main()
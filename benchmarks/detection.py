@@ -0,0 +1,235 @@
+"""
+Stage-by-stage benchmark of ChangeDetector for every detection method
+
+Generates synthetic GeoTIFF pairs and times each stage of every method
+(load, normalize, difference, threshold, morphology, labelling,
+visualization, plus the end-to-end detect call) in a fresh process per
+method, so the reported peak RSS belongs to that method alone. Results can
+be saved as a baseline and later runs compared against it; any stage that
+got slower (or a peak RSS that grew) beyond the tolerance fails the
+comparison with exit code 1.
+
+Usage:
+    python -m benchmarks.detection --sizes 2048 --save-baseline baseline.json
+    python -m benchmarks.detection --sizes 2048 --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import make_synthetic_pair
+from change_detector import ChangeDetector, clean_change_map
+from raster_stats import OtsuHistogram
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METHODS = ('threshold', 'otsu', 'cvd', 'vegetation')
+
+STAGES = ('load', 'normalize', 'difference', 'threshold', 'morphology',
+          'labelling', 'visualization', 'detect')
+
+DEFAULT_THRESHOLDS = {'threshold': 0.15, 'cvd': 0.1}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MiB (None if unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def run_case(case: Dict) -> Dict:
+    """
+    Time every stage of one method on one image pair (run in a fresh process)
+
+    Returns:
+        Dictionary with the best time per stage, peak RSS and whether the
+        staged change map matches the detector's own detect call
+    """
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    logging.disable(logging.INFO)
+    method = case['method']
+    threshold = DEFAULT_THRESHOLDS.get(method)
+    timings = {}
+
+    @contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    consistent = True
+    for _ in range(case['repeat']):
+        detector = ChangeDetector(case['image1'], case['image2'],
+                                  morphology_backend=case['morphology_backend'],
+                                  kernel_backend=case['kernel_backend'])
+        with stage('load'):
+            detector.load_images()
+        with stage('normalize'):
+            detector.normalize_images()
+
+        if method == 'vegetation':
+            # NDVI differencing and classification happen in one call
+            with stage('difference'):
+                change_map = detector.detect_vegetation_change()['vegetation_loss']
+        else:
+            with stage('difference'):
+                if method == 'cvd':
+                    diff = detector.calculate_change_magnitude()
+                else:
+                    diff = detector.calculate_difference('absolute')
+            with stage('threshold'):
+                if method == 'otsu':
+                    diff = OtsuHistogram.scale(diff)
+                    histogram = OtsuHistogram()
+                    histogram.update(diff)
+                    threshold = histogram.threshold()
+                raw = (diff > threshold).astype(np.uint8)
+            with stage('morphology'):
+                change_map = clean_change_map(raw, closing=method != 'cvd',
+                                              backend=detector.morphology_backend)
+
+        with stage('labelling'):
+            detector.analyze_change_statistics(change_map)
+        with stage('visualization'):
+            detector.create_change_visualization(change_map)
+
+        # End to end from the loaded images, without cached intermediates
+        detector.clear_cache()
+        with stage('detect'):
+            if method == 'vegetation':
+                reference = detector.detect_vegetation_change()['vegetation_loss']
+            elif method == 'otsu':
+                reference = detector.detect_changes_otsu()
+            else:
+                reference = getattr(detector, f'detect_changes_{method}')(threshold)
+        consistent &= np.array_equal(change_map, reference)
+
+    return {
+        'method': method,
+        'stages': {name: min(values) for name, values in timings.items()},
+        'peak_rss_mb': peak_rss_mb(),
+        'consistent': bool(consistent)
+    }
+
+
+def case_key(record: Dict) -> str:
+    return (f"{record['size']}x{record['size']}x{record['bands']} {record['dtype']} "
+            f"density={record['density']} {record['method']}")
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float,
+            min_seconds: float) -> List[str]:
+    """
+    Regressions of results against a baseline
+
+    A stage regresses when it is more than tolerance (relative) and
+    min_seconds (absolute) slower than in the baseline; peak RSS regresses
+    when it grew by more than tolerance.
+
+    Returns:
+        One message per regression
+    """
+    reference = {case_key(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        key = case_key(record)
+        if key not in reference:
+            continue
+        old = reference[key]
+        for name, seconds in record['stages'].items():
+            before = old['stages'].get(name)
+            if before is not None and seconds > before * (1 + tolerance) \
+                    and seconds - before > min_seconds:
+                regressions.append(f"{key} {name}: {before:.4f}s -> {seconds:.4f}s")
+        if record['peak_rss_mb'] and old.get('peak_rss_mb') \
+                and record['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key} peak RSS: {old['peak_rss_mb']:.0f} MiB -> "
+                               f"{record['peak_rss_mb']:.0f} MiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChangeDetector stage benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048])
+    parser.add_argument('--bands', type=int, default=4)
+    parser.add_argument('--dtype', default='uint16')
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.05])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--morphology-backend', default='skimage')
+    parser.add_argument('--kernel-backend', default='auto')
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--save-baseline', help="Store the results as a baseline file")
+    parser.add_argument('--baseline', help="Compare against this baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown before a stage counts as regressed")
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = []
+    header = f"{'case':>44} " + ' '.join(f"{name[:9]:>9}" for name in STAGES) + \
+             f" {'RSS MiB':>8} {'ok':>5}"
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for size in args.sizes:
+            for density in args.densities:
+                image1, image2 = make_synthetic_pair(
+                    str(tmp / 'before.tif'), str(tmp / 'after.tif'), height=size, width=size,
+                    bands=args.bands, dtype=args.dtype, change_density=density)
+                for method in args.methods:
+                    case = {'image1': image1, 'image2': image2, 'method': method,
+                            'repeat': args.repeat,
+                            'morphology_backend': args.morphology_backend,
+                            'kernel_backend': args.kernel_backend}
+                    # A fresh process per case keeps peak RSS per method
+                    with ProcessPoolExecutor(max_workers=1,
+                                             mp_context=multiprocessing.get_context('spawn')) as executor:
+                        record = executor.submit(run_case, case).result()
+                    record.update(size=size, bands=args.bands, dtype=args.dtype, density=density)
+                    results.append(record)
+
+                    stages = ' '.join(f"{record['stages'][name]:>9.4f}" if name in record['stages']
+                                      else f"{'-':>9}" for name in STAGES)
+                    rss = f"{record['peak_rss_mb']:>8.0f}" if record['peak_rss_mb'] else f"{'-':>8}"
+                    print(f"{case_key(record):>44} {stages} {rss} {str(record['consistent']):>5}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the pixel kernel backends
+
+Times the NumPy and numba kernels for every difference method, the fused
+threshold and NDVI change, and checks the backends give identical results.
+log_ratio always runs on NumPy and is listed for reference.
+
+Usage:
+    python -m benchmarks.kernel_backends --sizes 1024 4096 --bands 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from kernels import DIFFERENCE_METHODS, fused_difference, fused_ndvi_change, \
+    fused_threshold, resolve_kernel_backend
+
+
+def make_stack(bands: int, size: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 10000, size=(bands, size, size), dtype=np.uint16)
+
+
+def best_of(func, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def identical(reference, result) -> bool:
+    if isinstance(reference, tuple):
+        return all(np.array_equal(r, x) for r, x in zip(reference, result))
+    return np.array_equal(reference, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pixel kernel backend benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 4096])
+    parser.add_argument('--bands', type=int, default=4)
+    parser.add_argument('--threshold', type=float, default=0.15)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if resolve_kernel_backend('auto') != 'numba':
+        print("numba is not installed - only the NumPy backend is available")
+        return
+
+    print(f"{'size':>6} {'kernel':>18} {'numpy s':>9} {'numba s':>9} {'speedup':>8} {'identical':>10}")
+    for size in args.sizes:
+        image1 = make_stack(args.bands, size, seed=1)
+        image2 = make_stack(args.bands, size, seed=2)
+        ranges1 = (image1.min(axis=(1, 2)), image1.max(axis=(1, 2)))
+        ranges2 = (image2.min(axis=(1, 2)), image2.max(axis=(1, 2)))
+
+        kernels = {f"difference/{method}": (
+            lambda backend, method=method: fused_difference(
+                image1, image2, ranges1, ranges2, method, backend=backend))
+            for method in DIFFERENCE_METHODS}
+        kernels['threshold/absolute'] = lambda backend: fused_threshold(
+            image1, image2, ranges1, ranges2, 'absolute', args.threshold, backend=backend)
+        kernels['ndvi_change'] = lambda backend: fused_ndvi_change(
+            image1[0], image1[1], image2[0], image2[1], backend=backend)
+
+        for name, kernel in kernels.items():
+            # Compile outside the timed runs
+            kernel('numba')
+            numpy_time, reference = best_of(lambda: kernel('numpy'), args.repeat)
+            numba_time, result = best_of(lambda: kernel('numba'), args.repeat)
+            print(f"{size:>6} {name:>18} {numpy_time:>9.4f} {numba_time:>9.4f} "
+                  f"{numpy_time / numba_time:>7.1f}x {str(identical(reference, result)):>10}")
+
+
+if __name__ == '__main__':
+    main()
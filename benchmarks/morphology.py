@@ -0,0 +1,59 @@
+"""
+Benchmark of the morphology backends used for change map cleanup
+
+Times opening + closing with disk(2) for every backend across map sizes and
+change densities, and checks each backend is bit-identical to skimage.
+
+Usage:
+    python -m benchmarks.morphology --sizes 1024 4096 8192 --densities 0.01 0.1 0.5
+"""
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+
+from morphology_ops import MORPHOLOGY_BACKENDS, clean_binary
+
+
+def make_change_map(size: int, density: float, seed: int = 0) -> np.ndarray:
+    """Random blobby binary map with roughly the given fraction of set pixels"""
+    rng = np.random.default_rng(seed)
+    cell = 4
+    coarse = rng.random((size // cell + 1, size // cell + 1)) < density
+    blobs = np.repeat(np.repeat(coarse, cell, axis=0), cell, axis=1)[:size, :size]
+    # Sprinkle single-pixel speckle for the opening to remove
+    return blobs ^ (rng.random((size, size)) < density / 10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Morphology backend benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 2048, 4096])
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.01, 0.1, 0.5])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', category=FutureWarning)
+
+    print(f"{'size':>6} {'density':>8} {'backend':>11} {'seconds':>9} {'speedup':>8} {'identical':>10}")
+    for size in args.sizes:
+        for density in args.densities:
+            change_map = make_change_map(size, density)
+            reference, baseline = None, None
+            for backend in MORPHOLOGY_BACKENDS:
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    result = clean_binary(change_map, closing=True, backend=backend)
+                    timings.append(time.perf_counter() - start)
+                elapsed = min(timings)
+                if reference is None:
+                    reference, baseline = result, elapsed
+                identical = np.array_equal(result, reference)
+                print(f"{size:>6} {density:>8.2f} {backend:>11} {elapsed:>9.4f} "
+                      f"{baseline / elapsed:>7.1f}x {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
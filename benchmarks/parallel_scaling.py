@@ -0,0 +1,63 @@
+"""
+Scaling benchmark for the parallel tile engine
+
+Times TiledChangeDetector on a synthetic scene for an increasing number of
+worker processes, reports the speedup over one worker and checks that every
+run writes the same change map.
+
+Usage:
+    python -m benchmarks.parallel_scaling --size 8192 --workers 1 2 4 8 16 32
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from benchmarks.synthetic import make_synthetic_pair
+from tiled_detector import TiledChangeDetector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel tile engine scaling benchmark")
+    parser.add_argument('--size', type=int, default=4096, help="Scene edge length in pixels")
+    parser.add_argument('--bands', type=int, default=4)
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--method', default='threshold', choices=['threshold', 'otsu', 'cvd'])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        image1, image2 = make_synthetic_pair(str(tmp / 'before.tif'), str(tmp / 'after.tif'),
+                                             height=args.size, width=args.size,
+                                             bands=args.bands)
+
+        reference = None
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'identical':>10}")
+        for workers in args.workers:
+            detector = TiledChangeDetector(image1, image2, tile_size=args.tile_size,
+                                           workers=workers)
+            output = str(tmp / f'change_{workers}.tif')
+
+            start = time.perf_counter()
+            getattr(detector, f'detect_changes_{args.method}')(output)
+            elapsed = time.perf_counter() - start
+
+            with rasterio.open(output) as src:
+                change_map = src.read(1)
+            if reference is None:
+                reference, baseline = change_map, elapsed
+            identical = np.array_equal(change_map, reference)
+
+            print(f"{workers:>8} {elapsed:>9.2f} {baseline / elapsed:>7.2f}x {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark of batched AI summaries against a local fake Gemini server
+
+FakeGeminiServer speaks the REST generateContent protocol on localhost and
+answers with the offline stub summaries, after an artificial latency and,
+for a configurable share of requests, with HTTP 429 throttling instead. It
+counts requests and the most it saw in flight at once, so the batch API's
+rate limit, concurrency cap and retries can be checked without network
+access or an API key. The benchmark summarizes synthetic statistics with
+summarize_batch for several records-per-prompt settings.
+
+Usage:
+    python -m benchmarks.summaries --records 200 --per-prompt 1 8 --throttle-rate 0.1
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import ai_summarizer
+from ai_summarizer import ERROR_PREFIX, GeminiRestBackend, stub_response, summarize_batch
+
+
+class FakeGeminiServer:
+    """
+    Local HTTP server imitating Gemini's generateContent endpoint
+
+    Use as a context manager; url is the base URL to give GeminiRestBackend.
+    """
+
+    def __init__(self, latency: float = 0.05, throttle_rate: float = 0.0,
+                 retry_after: float = 0.0, seed: int = 0):
+        """
+        Initialize the server
+
+        Args:
+            latency: Seconds each answered request takes
+            throttle_rate: Share of requests answered with HTTP 429
+            retry_after: Retry-After seconds sent with 429 answers (0 sends none)
+            seed: Random seed of the throttling
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    throttle = server._random.random() < server.throttle_rate
+                    server.throttled += throttle
+                try:
+                    if throttle:
+                        self.send_response(429)
+                        if server.retry_after:
+                            self.send_header('Retry-After', str(server.retry_after))
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    time.sleep(server.latency)
+                    prompt = body['contents'][0]['parts'][0]['text']
+                    json_output = body.get('generationConfig', {}).get(
+                        'responseMimeType') == 'application/json'
+                    answer = {'candidates': [{'content': {
+                        'parts': [{'text': stub_response(prompt, json_output)}],
+                        'role': 'model'}}]}
+                    data = json.dumps(answer).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> 'FakeGeminiServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def synthetic_records(count: int, seed: int = 0) -> List[Tuple[Dict, str]]:
+    """Distinct (stats, method) records shaped like analyze_change_statistics output"""
+    rng = random.Random(seed)
+    methods = ('Threshold-based', 'Otsu Auto-threshold', 'Change Vector Detection',
+               'Vegetation Analysis')
+    records = []
+    for number in range(count):
+        total = 1024 * 1024
+        changed = rng.randint(0, total // 3)
+        regions = rng.randint(1, 500)
+        records.append(({'total_pixels': total, 'changed_pixels': changed,
+                          'change_percentage': 100 * changed / total,
+                          'num_change_regions': regions,
+                          'mean_region_size': changed / regions},
+                         methods[number % len(methods)]))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched summary benchmark against a "
+                                                 "local fake Gemini server")
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--per-prompt', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rpm', type=float, default=600, help="Requests per minute")
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="Seconds the fake server takes per request")
+    parser.add_argument('--throttle-rate', type=float, default=0.1,
+                        help="Share of requests the fake server rejects with HTTP 429")
+    parser.add_argument('--backoff', type=float, default=0.2)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records)
+    print(f"{'per prompt':>10} {'seconds':>8} {'requests':>8} {'429s':>6} "
+          f"{'max in flight':>13} {'first result s':>14} {'errors':>6}")
+    for per_prompt in args.per_prompt:
+        # Every run starts cold so memoized summaries do not skew the timing
+        ai_summarizer._memo.clear()
+        with FakeGeminiServer(args.latency, args.throttle_rate) as server:
+            backend = GeminiRestBackend('fake-key', base_url=server.url)
+            start = time.perf_counter()
+            first, seen, errors = None, set(), 0
+            for index, summary in summarize_batch(records, backend=backend,
+                                                  records_per_prompt=per_prompt,
+                                                  max_concurrency=args.concurrency,
+                                                  requests_per_minute=args.rpm,
+                                                  backoff=args.backoff):
+                first = first if first is not None else time.perf_counter() - start
+                seen.add(index)
+                errors += summary.startswith(ERROR_PREFIX)
+            seconds = time.perf_counter() - start
+        if len(seen) != len(records):
+            raise RuntimeError(f"Expected {len(records)} summaries, got {len(seen)}")
+        print(f"{per_prompt:>10} {seconds:>8.2f} {server.requests:>8} {server.throttled:>6} "
+              f"{server.max_in_flight:>13} {first:>14.2f} {errors:>6}")
+
+
+if __name__ == '__main__':
+    main()
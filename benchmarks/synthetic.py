@@ -0,0 +1,73 @@
+"""
+Synthetic GeoTIFF pairs for benchmarking the change detectors
+"""
+
+import rasterio
+from rasterio.transform import from_origin
+import numpy as np
+from typing import Tuple
+
+
+def make_synthetic_pair(image1_path: str, image2_path: str, height: int = 2048,
+                        width: int = 2048, bands: int = 4, dtype: str = 'uint16',
+                        change_density: float = 0.05, seed: int = 0,
+                        block_size: int = 256) -> Tuple[str, str]:
+    """
+    Write a pair of co-registered multi-band GeoTIFFs with rectangular changes
+
+    The earlier image is smooth, blocky texture plus noise. The later image
+    copies it and overwrites random rectangles until roughly change_density of
+    the pixels differ.
+
+    Args:
+        image1_path: Output path of the earlier image
+        image2_path: Output path of the later image
+        height: Raster height in pixels
+        width: Raster width in pixels
+        bands: Number of bands
+        dtype: Pixel data type
+        change_density: Approximate fraction of changed pixels (0-1)
+        seed: Random seed
+        block_size: Internal tile size of the written GeoTIFFs
+
+    Returns:
+        The two written paths
+    """
+    rng = np.random.default_rng(seed)
+    max_value = np.iinfo(dtype).max if np.issubdtype(np.dtype(dtype), np.integer) else 1.0
+
+    profile = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': bands,
+        'dtype': dtype,
+        'crs': 'EPSG:32645',
+        'transform': from_origin(300000, 3100000, 10, 10),
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size
+    }
+
+    cell = 16
+    coarse = rng.random((bands, height // cell + 1, width // cell + 1))
+    texture = np.repeat(np.repeat(coarse, cell, axis=1), cell, axis=2)[:, :height, :width]
+    texture = 0.8 * texture + 0.2 * rng.random((bands, height, width))
+    before = (texture * max_value).astype(dtype)
+    del texture
+
+    after = before.copy()
+    target = int(change_density * height * width)
+    changed = 0
+    while changed < target:
+        h, w = rng.integers(4, 64, size=2)
+        row, col = rng.integers(0, max(1, height - h)), rng.integers(0, max(1, width - w))
+        after[:, row:row + h, col:col + w] = (rng.random((bands, 1, 1)) * max_value).astype(dtype)
+        changed += h * w
+
+    with rasterio.open(image1_path, 'w', **profile) as dst:
+        dst.write(before)
+    with rasterio.open(image2_path, 'w', **profile) as dst:
+        dst.write(after)
+
+    return image1_path, image2_path
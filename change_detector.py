@@ -1,127 +1,528 @@
 import rasterio
+from rasterio.enums import Resampling
 import numpy as np
-from skimage import filters, morphology
 from scipy import ndimage
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Hashable, List, Optional, Sequence
 import logging
 
+from alignment import overlap_grid, read_on_grid, valid_on_grid
+from kernels import (PRECISIONS, dequantize, fused_difference, fused_difference_reduced,
+                     fused_ndvi_change, quantize, resolve_kernel_backend, storage_threshold)
+from labeling import tiled_change_statistics
+from morphology_ops import MORPHOLOGY_BACKENDS, clean_binary
+from raster_cache import RasterCache
+from raster_export import write_geotiff
+from raster_stats import BandStatistics, OtsuHistogram, normalize_stack
+from stage_trace import stage, traced
+from vector_export import export_change_vectors
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@traced('morphology')
+def clean_change_map(change_map: np.ndarray, closing: bool = True,
+                     backend: str = 'skimage') -> np.ndarray:
+    """
+    Remove speckle from a binary change map with morphological filtering
+
+    Args:
+        change_map: Binary change map
+        closing: Also apply a closing after the opening
+        backend: Morphology backend (see morphology_ops.MORPHOLOGY_BACKENDS);
+            all backends give identical output
+
+    Returns:
+        Cleaned change map
+    """
+    return clean_binary(change_map, closing, backend)
+
+
 class ChangeDetector:
     """
     Main class for detecting changes between two satellite images
+    
+    Bands are decoded lazily and one at a time: every method reads only the
+    bands it needs (NDVI the red and NIR bands, visualization the display
+    bands), and the full stacks image1 and image2 are assembled on first
+    access by the methods that use every band.
+    
+    With a reduced precision, normalized stacks and the absolute difference
+    and change magnitude rasters are kept as float16 or quantized uint8
+    instead of float32; precision_report shows how far the change maps
+    drift from the float32 path.
+    
+    Pairs that only partly overlap, or lie on different grids, are analyzed
+    on the overlap (see grid): only that window is read from each file, and
+    the second image is resampled onto the first image's pixel grid tile by
+    tile when their grids differ.
     """
     
-    def __init__(self, image1_path: str, image2_path: str):
+    def __init__(self, image1_path: str, image2_path: str,
+                 cache_max_bytes: Optional[int] = None,
+                 clip_percentiles: Optional[Tuple[float, float]] = None,
+                 morphology_backend: str = 'skimage',
+                 kernel_backend: str = 'auto',
+                 disk_cache: Optional[RasterCache] = None,
+                 precision: str = 'float32',
+                 resampling: str = 'bilinear'):
         """
         Initialize the change detector with two image paths
         
         Args:
             image1_path: Path to the first (earlier) satellite image
             image2_path: Path to the second (later) satellite image
+            cache_max_bytes: Optional memory cap for cached intermediate
+                rasters (None means unbounded)
+            clip_percentiles: Optional (low, high) percentiles for robust
+                normalization, e.g. (2, 98); values outside are clipped
+            morphology_backend: Backend for the speckle cleanup ('skimage',
+                'decomposed' or 'bitpacked'; all give identical maps)
+            kernel_backend: Pixel kernel backend ('auto', 'numpy' or 'numba');
+                'auto' uses numba when installed and NumPy otherwise
+            disk_cache: Optional persistent cache; decoded and normalized
+                stacks are then memory-mapped from it on repeat runs
+            precision: Storage precision of normalized stacks and difference
+                rasters: 'float32', 'float16' (half the memory) or 'uint8'
+                (a quarter, quantized to 256 levels)
+            resampling: Resampling method ('nearest', 'bilinear', 'cubic', ...)
+                for a second image whose pixel grid differs from the first's
         """
+        if morphology_backend not in MORPHOLOGY_BACKENDS:
+            raise ValueError(f"Unknown morphology backend: {morphology_backend}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        if resampling not in Resampling.__members__:
+            raise ValueError(f"Unknown resampling method: {resampling}")
+        
         self.image1_path = image1_path
         self.image2_path = image2_path
-        self.image1 = None
-        self.image2 = None
         self.metadata1 = None
         self.metadata2 = None
+        # Analysis grid: the overlap of both images on the first image's grid
+        self.grid = None
+        self.cache_max_bytes = cache_max_bytes
+        self.clip_percentiles = clip_percentiles
+        self.morphology_backend = morphology_backend
+        self.kernel_backend = resolve_kernel_backend(kernel_backend)
+        self.disk_cache = disk_cache
+        self.precision = precision
+        self.resampling = resampling
+        self._cache = {}
+        self._cache_bytes = 0
+        # Full decoded stacks and, until those exist, single decoded bands
+        self._stacks = [None, None]
+        self._bands = [{}, {}]
+        # Grid pixels a resampled second image has data for
+        self._valid = None
+    
+    @property
+    def image1(self) -> Optional[np.ndarray]:
+        """Full decoded stack of the first image (read on first access)"""
+        return self._stack(0) if self.metadata1 is not None else None
+    
+    @property
+    def image2(self) -> Optional[np.ndarray]:
+        """Full decoded stack of the second image (read on first access)"""
+        return self._stack(1) if self.metadata2 is not None else None
+        
+    def clear_cache(self):
+        """
+        Drop all cached normalized images and difference rasters
+        """
+        self._cache.clear()
+        self._cache_bytes = 0
+    
+    @staticmethod
+    def _entry_nbytes(value) -> int:
+        if isinstance(value, tuple):
+            return sum(v.nbytes for v in value)
+        return value.nbytes
+    
+    def _cache_get(self, key: Hashable):
+        return self._cache.get(key)
+    
+    def _cache_put(self, key: Hashable, value):
+        """
+        Store an intermediate result, evicting the largest entries first when
+        the memory cap would be exceeded
+        
+        Cached arrays are made read-only so callers cannot corrupt them.
+        """
+        arrays = value if isinstance(value, tuple) else (value,)
+        for array in arrays:
+            array.flags.writeable = False
+        
+        size = self._entry_nbytes(value)
+        if self.cache_max_bytes is not None:
+            if size > self.cache_max_bytes:
+                return value
+            while self._cache and self._cache_bytes + size > self.cache_max_bytes:
+                largest = max(self._cache, key=lambda k: self._entry_nbytes(self._cache[k]))
+                self._cache_bytes -= self._entry_nbytes(self._cache.pop(largest))
+        
+        self._cache[key] = value
+        self._cache_bytes += size
+        return value
+    
+    def _disk_key(self, index: int, kind: str, **params) -> str:
+        """Disk cache key of an array derived from one image on the analysis grid"""
+        if not self.grid['full']:
+            window = self.grid['windows'][index]
+            if window is not None:
+                params['window'] = [window.col_off, window.row_off, window.width, window.height]
+            else:
+                params.update(grid=[str(self.grid['crs']), tuple(self.grid['transform'])[:6],
+                                    self.grid['width'], self.grid['height']],
+                              resampling=self.resampling)
+            if index == 0 and self.grid['windows'][1] is None and kind != 'decoded':
+                # Statistics of the first image only cover the second's footprint
+                params['footprint'] = self._disk_key(1, 'valid')
+        return self.disk_cache.key(self._path(index), kind, **params)
+    
+    def _disk_cached(self, index: int, kind: str, compute, **params) -> np.ndarray:
+        """
+        Array derived from one of the images, memory-mapped from the disk
+        cache when present and computed (then stored) otherwise
+        """
+        if self.disk_cache is None:
+            return compute()
+        return self.disk_cache.get_or_compute(self._disk_key(index, kind, **params), compute)
+    
+    @staticmethod
+    def _read_metadata(src) -> Dict:
+        return {
+            'crs': src.crs,
+            'transform': src.transform,
+            'bounds': src.bounds,
+            'width': src.width,
+            'height': src.height,
+            'count': src.count,
+            'dtype': src.dtypes[0]
+        }
+    
+    def open_images(self) -> Dict:
+        """
+        Read the metadata of both images without decoding any bands
+        
+        Bands are then decoded on demand by the methods that need them.
+        
+        Returns:
+            Metadata dictionary (see get_metadata)
+        """
+        self.clear_cache()
+        self._stacks = [None, None]
+        self._bands = [{}, {}]
+        self._valid = None
+        with rasterio.open(self.image1_path) as src1:
+            self.metadata1 = self._read_metadata(src1)
+        with rasterio.open(self.image2_path) as src2:
+            self.metadata2 = self._read_metadata(src2)
+        
+        self.grid = overlap_grid(self.metadata1, self.metadata2)
+        if not self.grid['full']:
+            logger.info(f"Analyzing the {self.grid['width']}x{self.grid['height']} overlap"
+                        + ("" if self.grid['windows'][1] is not None
+                           else f", resampling image 2 ({self.resampling})"))
+        return self.get_metadata()
+    
+    def _ensure_open(self):
+        if self.metadata1 is None or self.metadata2 is None:
+            self.open_images()
+    
+    def _path(self, index: int) -> str:
+        return (self.image1_path, self.image2_path)[index]
+    
+    def _metadata(self, index: int) -> Dict:
+        return (self.metadata1, self.metadata2)[index]
+    
+    def _read(self, index: int, indexes: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Bands (1-based indexes, None for all) of an image on the analysis grid"""
+        return read_on_grid(self._path(index), self.grid, self.grid['windows'][index],
+                            indexes, Resampling[self.resampling])
+    
+    def valid_mask(self) -> Optional[np.ndarray]:
+        """
+        Grid pixels the second image has data for
         
+        A resampled second image leaves the grid pixels outside its footprint
+        zero-filled; they are left out of normalization statistics, Otsu
+        histograms, change maps and change statistics.
+        
+        Returns:
+            Boolean (height, width) array (read-only), or None when the
+            second image covers every grid pixel
+        """
+        self._ensure_open()
+        if self.grid['windows'][1] is not None:
+            return None
+        if self._valid is None:
+            valid = self._disk_cached(1, 'valid', lambda: valid_on_grid(
+                self.image2_path, self.grid, None, Resampling[self.resampling]))
+            valid.flags.writeable = False
+            self._valid = valid
+        return self._valid
+    
+    def _mask_invalid(self, change_map: np.ndarray) -> np.ndarray:
+        """Clear the pixels of a change map outside the footprint, in place"""
+        valid = self.valid_mask()
+        if valid is not None:
+            change_map[~valid] = 0
+        return change_map
+    
+    def _footprint_pixels(self, change_map: np.ndarray) -> int:
+        """Number of pixels of a change map inside the footprint"""
+        if self.grid is not None and change_map.shape == (self.grid['height'], self.grid['width']):
+            valid = self.valid_mask()
+            if valid is not None:
+                return int(np.count_nonzero(valid))
+        return change_map.size
+    
+    def _band(self, index: int, band: int) -> np.ndarray:
+        """
+        One decoded band (0-based) of an image, read from disk on first use
+        """
+        self._ensure_open()
+        if self._stacks[index] is not None:
+            return self._stacks[index][band]
+        bands = self._bands[index]
+        if band not in bands:
+            if not 0 <= band < self._metadata(index)['count']:
+                raise IndexError(f"Band {band} out of range for {self._path(index)}")
+            # A cached full stack serves single bands without decoding
+            full = None
+            if self.disk_cache is not None:
+                full = self.disk_cache.get(self._disk_key(index, 'decoded'))
+            if full is not None:
+                bands[band] = full[band]
+            else:
+                bands[band] = self._disk_cached(index, 'decoded',
+                                                lambda: self._read(index, [band + 1])[0],
+                                                band=band)
+        return bands[band]
+    
+    def _stack(self, index: int) -> np.ndarray:
+        """
+        Full decoded stack of an image, reusing bands already decoded
+        """
+        self._ensure_open()
+        if self._stacks[index] is None:
+            metadata, bands = self._metadata(index), self._bands[index]
+            
+            def decode():
+                if not bands:
+                    return self._read(index)
+                stack = np.empty((metadata['count'], self.grid['height'], self.grid['width']),
+                                 dtype=metadata['dtype'])
+                for band in range(metadata['count']):
+                    stack[band] = bands[band] if band in bands else self._read(index, [band + 1])[0]
+                return stack
+            
+            self._stacks[index] = self._disk_cached(index, 'decoded', decode)
+            # Single bands are served from the stack from now on
+            self._bands[index] = {}
+            logger.info(f"Image {index + 1} shape: {self._stacks[index].shape}")
+        return self._stacks[index]
+    
+    def read_bands(self, bands: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decoded bands of both images, reading only the bands not read yet
+        
+        Args:
+            bands: 0-based band indices (None for every band)
+            
+        Returns:
+            Tuple of two (len(bands), height, width) arrays
+        """
+        return self._image_bands(0, bands), self._image_bands(1, bands)
+    
+    def _image_bands(self, index: int, bands: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Decoded bands (0-based, None for all) of one image"""
+        if bands is None:
+            return self._stack(index)
+        return np.stack([self._band(index, band) for band in bands])
+    
+    def display_bands(self) -> List[int]:
+        """
+        Bands shown in RGB composites: the first three, or the first one as
+        grayscale for images with fewer than three bands
+        """
+        self._ensure_open()
+        count = min(self.metadata1['count'], self.metadata2['count'])
+        return [0, 1, 2] if count >= 3 else [0]
+    
+    @traced('load')
     def load_images(self) -> Tuple[np.ndarray, np.ndarray]:
         """
         Load the satellite images and their metadata
         
+        Reads every band; call open_images instead to let each method decode
+        only the bands it uses.
+        
         Returns:
             Tuple of two numpy arrays containing the image data
         """
         logger.info(f"Loading image 1: {self.image1_path}")
-        with rasterio.open(self.image1_path) as src1:
-            self.image1 = src1.read()
-            self.metadata1 = {
-                'crs': src1.crs,
-                'transform': src1.transform,
-                'bounds': src1.bounds,
-                'width': src1.width,
-                'height': src1.height,
-                'count': src1.count
-            }
-            
         logger.info(f"Loading image 2: {self.image2_path}")
-        with rasterio.open(self.image2_path) as src2:
-            self.image2 = src2.read()
-            self.metadata2 = {
-                'crs': src2.crs,
-                'transform': src2.transform,
-                'bounds': src2.bounds,
-                'width': src2.width,
-                'height': src2.height,
-                'count': src2.count
-            }
-            
-        logger.info(f"Image 1 shape: {self.image1.shape}")
-        logger.info(f"Image 2 shape: {self.image2.shape}")
-        
-        return self.image1, self.image2
+        self.open_images()
+        return self._stack(0), self._stack(1)
     
-    def normalize_images(self) -> Tuple[np.ndarray, np.ndarray]:
+    def _band_range(self, index: int, band: int) -> np.ndarray:
         """
-        Normalize images to 0-1 range for consistent processing
+        (low, high) normalization bound of one band, cached until reload
+        """
+        key = ('range', index, band)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        def band_range():
+            data = self._band(index, band)
+            valid = self.valid_mask()
+            # Footprint pixels as a (1, 1, pixels) block
+            data = data[np.newaxis] if valid is None else data[valid][np.newaxis, np.newaxis]
+            stats = BandStatistics.from_array(data, self.clip_percentiles is not None)
+            return np.concatenate(stats.normalization_range(self.clip_percentiles))
+        
+        bounds = self._disk_cached(index, 'ranges', band_range, band=band,
+                                   clip_percentiles=self.clip_percentiles)
+        return self._cache_put(key, np.asarray(bounds))
+    
+    def _normalization_ranges(self, bands: Optional[Sequence[int]] = None
+                              ) -> Tuple[np.ndarray, ...]:
+        """
+        Per-band (lows, highs) of both images
+        
+        Args:
+            bands: 0-based band indices (None for every band)
         
         Returns:
-            Tuple of normalized images
+            Tuple of (lows1, highs1, lows2, highs2)
         """
-        def normalize(img):
-            img = img.astype(np.float32)
-            # Handle each band separately
-            normalized = np.zeros_like(img, dtype=np.float32)
-            for i in range(img.shape[0]):
-                band = img[i]
-                band_min, band_max = band.min(), band.max()
-                if band_max > band_min:
-                    normalized[i] = (band - band_min) / (band_max - band_min)
-                else:
-                    normalized[i] = band
-            return normalized
+        self._ensure_open()
+        ranges = ()
+        for index, metadata in enumerate((self.metadata1, self.metadata2)):
+            indices = range(metadata['count']) if bands is None else bands
+            bounds = np.array([self._band_range(index, band) for band in indices])
+            ranges += (bounds[:, 0], bounds[:, 1])
+        return ranges
+    
+    @traced('normalize')
+    def normalize_images(self, bands: Optional[Sequence[int]] = None
+                         ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Normalize images to 0-1 range for consistent processing
+        
+        The result is cached until the images are reloaded, and across runs
+        in the disk cache when one is configured.
         
-        img1_norm = normalize(self.image1)
-        img2_norm = normalize(self.image2)
+        Args:
+            bands: 0-based band indices to normalize (None for every band);
+                only these bands are decoded
         
-        return img1_norm, img2_norm
+        Returns:
+            Tuple of normalized images (read-only), in the detector's
+            precision; uint8 stacks hold the normalized value times 255
+        """
+        bands = None if bands is None else list(bands)
+        key = ('normalized', None if bands is None else tuple(bands))
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        # Handle each band separately
+        # Bands are only decoded when the disk cache misses
+        lows1, highs1, lows2, highs2 = self._normalization_ranges(bands)
+        clip = self.clip_percentiles is not None
+        img1_norm = self._disk_cached(
+            0, 'normalized',
+            lambda: self._normalize_stack(self._image_bands(0, bands), lows1, highs1, clip),
+            clip_percentiles=self.clip_percentiles, bands=bands, precision=self.precision)
+        img2_norm = self._disk_cached(
+            1, 'normalized',
+            lambda: self._normalize_stack(self._image_bands(1, bands), lows2, highs2, clip),
+            clip_percentiles=self.clip_percentiles, bands=bands, precision=self.precision)
+        
+        return self._cache_put(key, (img1_norm, img2_norm))
     
-    def calculate_difference(self, method: str = 'absolute') -> np.ndarray:
+    def _normalize_stack(self, image: np.ndarray, lows: np.ndarray, highs: np.ndarray,
+                         clip: bool) -> np.ndarray:
+        """Normalized stack in the detector's precision, one band at a time"""
+        if self.precision == 'float32':
+            return normalize_stack(image, lows, highs, clip=clip)
+        normalized = np.empty(image.shape, dtype=PRECISIONS[self.precision])
+        for i in range(image.shape[0]):
+            band = normalize_stack(image[i:i + 1], lows[i:i + 1], highs[i:i + 1], clip=clip)
+            quantize(band[0], self.precision, out=normalized[i])
+        return normalized
+    
+    @traced('difference')
+    def calculate_difference(self, method: str = 'absolute',
+                             out: Optional[np.ndarray] = None) -> np.ndarray:
         """
         Calculate pixel-wise difference between images
         
+        Normalization, differencing and the band mean are fused into one pass
+        over the raw bands, so no normalized copies are materialized.
+        
         Args:
             method: Method to use ('absolute', 'ratio', 'log_ratio')
+            out: Optional float32 (height, width) buffer to write into; the
+                result is then not cached
             
         Returns:
-            Difference image
-        """
-        img1_norm, img2_norm = self.normalize_images()
-        
-        if method == 'absolute':
-            # Absolute difference
-            diff = np.abs(img2_norm - img1_norm)
-        elif method == 'ratio':
-            # Ratio (avoid division by zero)
-            diff = np.divide(img2_norm, img1_norm + 1e-10)
-        elif method == 'log_ratio':
-            # Log ratio
-            diff = np.log(np.divide(img2_norm + 1e-10, img1_norm + 1e-10))
-        else:
+            Difference image (read-only and cached per method unless out is
+            given). The absolute difference is stored in the detector's
+            precision (uint8 holds the difference times 255); ratios are
+            unbounded and always float32.
+        """
+        if out is None:
+            cached = self._cache_get(('difference', method))
+            if cached is not None:
+                return cached
+        
+        if method not in ('absolute', 'ratio', 'log_ratio'):
             raise ValueError(f"Unknown method: {method}")
         
-        # Aggregate across bands (mean)
-        if len(diff.shape) == 3:
-            diff_aggregated = np.mean(diff, axis=0)
-        else:
-            diff_aggregated = diff
-            
-        return diff_aggregated
+        diff = self._fused_difference(method, out)
+        if out is not None:
+            return diff
+        
+        return self._cache_put(('difference', method), diff)
+    
+    def _fused_difference(self, method: str, out: Optional[np.ndarray] = None,
+                          precision: Optional[str] = None) -> np.ndarray:
+        lows1, highs1, lows2, highs2 = self._normalization_ranges()
+        precision = precision or self._storage_precision(method)
+        if out is not None or precision == 'float32':
+            return fused_difference(self.image1, self.image2, (lows1, highs1), (lows2, highs2),
+                                    method, clip=self.clip_percentiles is not None, out=out,
+                                    backend=self.kernel_backend)
+        return fused_difference_reduced(self.image1, self.image2, (lows1, highs1),
+                                        (lows2, highs2), method, precision,
+                                        self._value_scale(method),
+                                        clip=self.clip_percentiles is not None,
+                                        backend=self.kernel_backend)
+    
+    def _storage_precision(self, method: str) -> str:
+        """Precision a difference raster is kept in; ratios are unbounded"""
+        return self.precision if method in ('absolute', 'cvd') else 'float32'
+    
+    def _value_scale(self, method: str) -> float:
+        """
+        Largest value of a difference raster, the range of uint8 storage:
+        1 for the absolute difference, sqrt(bands) for the change magnitude
+        """
+        if method == 'cvd':
+            self._ensure_open()
+            return float(np.sqrt(self.metadata1['count']))
+        return 1.0
     
+    def _otsu_scaled(self, diff: np.ndarray) -> np.ndarray:
+        # uint8 storage truncates like OtsuHistogram.scale, so it already is the scaled raster
+        return diff if diff.dtype == np.uint8 else OtsuHistogram.scale(diff)
+    
+    @traced('detect (threshold)')
     def detect_changes_threshold(self, threshold: float = 0.15) -> np.ndarray:
         """
         Detect changes using simple thresholding
@@ -133,15 +534,39 @@ class ChangeDetector:
             Binary change map
         """
         diff = self.calculate_difference('absolute')
-        change_map = (diff > threshold).astype(np.uint8)
+        with stage('threshold'):
+            limit = storage_threshold(threshold, self.precision)
+            change_map = self._mask_invalid((diff > limit).astype(np.uint8))
         
         # Apply morphological operations to reduce noise
-        kernel = morphology.disk(2)
-        change_map = morphology.binary_opening(change_map, kernel)
-        change_map = morphology.binary_closing(change_map, kernel)
+        change_map = clean_change_map(change_map, backend=self.morphology_backend)
         
-        return change_map
+        return self._mask_invalid(change_map)
     
+    def otsu_threshold(self) -> int:
+        """
+        Otsu threshold of the absolute difference scaled to 0-255
+        
+        The threshold comes from a 256-bin histogram of the cached difference
+        raster. The histogram is cached too, so later calls are instant.
+        
+        Returns:
+            Threshold on the 0-255 scale
+        """
+        return self._otsu_threshold()
+    
+    def _otsu_threshold(self, diff_scaled: Optional[np.ndarray] = None) -> int:
+        counts = self._cache_get('otsu_histogram')
+        if counts is None:
+            if diff_scaled is None:
+                diff_scaled = self._otsu_scaled(self.calculate_difference('absolute'))
+            valid = self.valid_mask()
+            if valid is not None:
+                diff_scaled = diff_scaled[valid]
+            counts = self._cache_put('otsu_histogram', OtsuHistogram.block_counts(diff_scaled))
+        return OtsuHistogram(counts).threshold()
+    
+    @traced('detect (otsu)')
     def detect_changes_otsu(self) -> np.ndarray:
         """
         Detect changes using Otsu's automatic thresholding
@@ -151,20 +576,35 @@ class ChangeDetector:
         """
         diff = self.calculate_difference('absolute')
         
-        # Normalize to 0-255 for Otsu
-        diff_scaled = (diff * 255).astype(np.uint8)
-        
-        # Apply Otsu's thresholding
-        threshold = filters.threshold_otsu(diff_scaled)
-        change_map = (diff_scaled > threshold).astype(np.uint8)
+        with stage('threshold'):
+            # Normalize to 0-255 for Otsu
+            diff_scaled = self._otsu_scaled(diff)
+            
+            # Apply Otsu's threshold from the (cached) histogram
+            threshold = self._otsu_threshold(diff_scaled)
+            change_map = self._mask_invalid((diff_scaled > threshold).astype(np.uint8))
         
         # Clean up noise
-        kernel = morphology.disk(2)
-        change_map = morphology.binary_opening(change_map, kernel)
-        change_map = morphology.binary_closing(change_map, kernel)
+        change_map = clean_change_map(change_map, backend=self.morphology_backend)
         
-        return change_map
+        return self._mask_invalid(change_map)
     
+    @traced('difference')
+    def calculate_change_magnitude(self) -> np.ndarray:
+        """
+        Change vector magnitude: Euclidean norm of the per-band differences
+        of the normalized images
+        
+        Returns:
+            Magnitude image (read-only and cached), in the detector's
+            precision; uint8 holds the magnitude times 255 / sqrt(bands)
+        """
+        magnitude = self._cache_get('magnitude')
+        if magnitude is None:
+            magnitude = self._cache_put('magnitude', self._fused_difference('cvd'))
+        return magnitude
+    
+    @traced('detect (cvd)')
     def detect_changes_cvd(self, threshold: float = 0.1) -> np.ndarray:
         """
         Change Vector Detection - detects magnitude of change across all bands
@@ -175,22 +615,22 @@ class ChangeDetector:
         Returns:
             Binary change map
         """
-        img1_norm, img2_norm = self.normalize_images()
-        
         # Calculate change vector magnitude
-        diff_vector = img2_norm - img1_norm
-        magnitude = np.sqrt(np.sum(diff_vector ** 2, axis=0))
+        magnitude = self.calculate_change_magnitude()
         
         # Threshold
-        change_map = (magnitude > threshold).astype(np.uint8)
+        with stage('threshold'):
+            limit = storage_threshold(threshold, self.precision, self._value_scale('cvd'))
+            change_map = self._mask_invalid((magnitude > limit).astype(np.uint8))
         
         # Clean up
-        kernel = morphology.disk(2)
-        change_map = morphology.binary_opening(change_map, kernel)
+        change_map = clean_change_map(change_map, closing=False,
+                                      backend=self.morphology_backend)
         
-        return change_map
+        return self._mask_invalid(change_map)
     
-    def calculate_vegetation_index(self, image: np.ndarray, 
+    @staticmethod
+    def calculate_vegetation_index(image: np.ndarray, 
                                    red_band: int = 0, 
                                    nir_band: int = 1) -> np.ndarray:
         """
@@ -216,25 +656,38 @@ class ChangeDetector:
         
         return ndvi
     
-    def detect_vegetation_change(self) -> Dict[str, np.ndarray]:
+    @traced('detect (vegetation)')
+    def detect_vegetation_change(self, red_band: int = 0,
+                                 nir_band: int = 1) -> Dict[str, np.ndarray]:
         """
         Detect vegetation changes using NDVI
         
+        Args:
+            red_band: Index of red band
+            nir_band: Index of near-infrared band
+            
         Returns:
             Dictionary with NDVI maps and change detection
         """
-        ndvi1 = self.calculate_vegetation_index(self.image1)
-        ndvi2 = self.calculate_vegetation_index(self.image2)
-        
-        if ndvi1 is None or ndvi2 is None:
+        self._ensure_open()
+        if min(self.metadata1['count'], self.metadata2['count']) <= max(red_band, nir_band):
             logger.warning("Cannot calculate vegetation change - insufficient bands")
             return {}
         
-        ndvi_change = ndvi2 - ndvi1
+        # Only the red and NIR bands are decoded
+        with stage('difference'):
+            ndvi1, ndvi2, ndvi_change = fused_ndvi_change(
+                self._band(0, red_band), self._band(0, nir_band),
+                self._band(1, red_band), self._band(1, nir_band),
+                backend=self.kernel_backend)
+            valid = self.valid_mask()
+            if valid is not None:
+                ndvi_change[~valid] = 0
         
         # Classify changes
-        vegetation_loss = (ndvi_change < -0.1).astype(np.uint8)
-        vegetation_gain = (ndvi_change > 0.1).astype(np.uint8)
+        with stage('threshold'):
+            vegetation_loss = (ndvi_change < -0.1).astype(np.uint8)
+            vegetation_gain = (ndvi_change > 0.1).astype(np.uint8)
         
         return {
             'ndvi1': ndvi1,
@@ -244,17 +697,28 @@ class ChangeDetector:
             'vegetation_gain': vegetation_gain
         }
     
-    def analyze_change_statistics(self, change_map: np.ndarray) -> Dict[str, float]:
+    @traced('labelling')
+    def analyze_change_statistics(self, change_map: np.ndarray,
+                                  tile_size: Optional[int] = None) -> Dict[str, float]:
         """
         Calculate statistics about detected changes
         
         Args:
             change_map: Binary change map
+            tile_size: Label the map tile by tile with this tile size instead
+                of in one piece, which avoids a full-size label image
             
         Returns:
             Dictionary of statistics
         """
-        total_pixels = change_map.size
+        total_pixels = self._footprint_pixels(change_map)
+        if tile_size is not None:
+            stats = tiled_change_statistics(change_map, tile_size)
+            stats.update(total_pixels=total_pixels,
+                         unchanged_pixels=total_pixels - stats['changed_pixels'],
+                         change_percentage=stats['changed_pixels'] / total_pixels * 100)
+            return stats
+        
         changed_pixels = np.sum(change_map)
         unchanged_pixels = total_pixels - changed_pixels
         
@@ -263,8 +727,8 @@ class ChangeDetector:
         # Label connected components
         labeled_array, num_features = ndimage.label(change_map)
         
-        # Calculate sizes of change regions
-        sizes = ndimage.sum(change_map, labeled_array, range(num_features + 1))
+        # Calculate sizes of change regions (pixel count per label)
+        sizes = np.bincount(labeled_array.ravel(), minlength=num_features + 1)
         
         stats = {
             'total_pixels': int(total_pixels),
@@ -278,6 +742,71 @@ class ChangeDetector:
         
         return stats
     
+    @traced('region properties')
+    def region_properties(self, change_map: np.ndarray,
+                          intensity: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Properties of every change region as a columnar table
+        
+        All columns are computed in one vectorized pass over the label image
+        and the intensity raster, so maps with millions of regions are fine.
+        Pass the result to pd.DataFrame for a table view.
+        
+        Args:
+            change_map: Binary change map
+            intensity: Change magnitude per pixel (defaults to the absolute
+                difference)
+            
+        Returns:
+            Dictionary of equal-length arrays with one entry per region:
+            label, area, bounding box (min_row, min_col, max_row, max_col,
+            max exclusive), centroid_row/centroid_col, centroid_x/centroid_y
+            in the images' CRS (when metadata is loaded) and
+            mean_change/max_change
+        """
+        precision = 'float32'
+        if intensity is None:
+            intensity = self.calculate_difference('absolute')
+            precision = self.precision
+        
+        labeled_array, num_features = ndimage.label(change_map)
+        
+        # Pixels of all regions, grouped by label (raster order within a label)
+        rows, cols = np.nonzero(labeled_array)
+        labels = labeled_array[rows, cols]
+        order = np.argsort(labels, kind='stable')
+        rows, cols, labels = rows[order], cols[order], labels[order]
+        values = intensity[rows, cols]
+        if precision != 'float32':
+            values = dequantize(values, precision)
+        values = values.astype(np.float64)
+        
+        area = np.bincount(labels, minlength=num_features + 1)[1:]
+        starts = np.concatenate([[0], np.cumsum(area)[:-1]])
+        
+        table = {
+            'label': np.arange(1, num_features + 1),
+            'area': area,
+            'min_row': rows[starts] if num_features else rows,
+            'min_col': np.minimum.reduceat(cols, starts) if num_features else cols,
+            'max_row': rows[starts + area - 1] + 1 if num_features else rows,
+            'max_col': np.maximum.reduceat(cols, starts) + 1 if num_features else cols,
+            'centroid_row': np.bincount(labels, weights=rows, minlength=num_features + 1)[1:] / area,
+            'centroid_col': np.bincount(labels, weights=cols, minlength=num_features + 1)[1:] / area,
+            'mean_change': np.bincount(labels, weights=values, minlength=num_features + 1)[1:] / area,
+            'max_change': np.maximum.reduceat(values, starts) if num_features else values
+        }
+        
+        if self.grid is not None:
+            # Pixel centers to map coordinates through the affine transform
+            t = self.grid['transform']
+            col_center, row_center = table['centroid_col'] + 0.5, table['centroid_row'] + 0.5
+            table['centroid_x'] = t.a * col_center + t.b * row_center + t.c
+            table['centroid_y'] = t.d * col_center + t.e * row_center + t.f
+        
+        return table
+    
+    @traced('visualization')
     def create_change_visualization(self, change_map: np.ndarray) -> np.ndarray:
         """
         Create an RGB visualization of changes overlaid on original images
@@ -288,7 +817,8 @@ class ChangeDetector:
         Returns:
             RGB visualization array
         """
-        img1_norm, img2_norm = self.normalize_images()
+        # Only the display bands are decoded and normalized
+        img1_norm, img2_norm = self.normalize_images(self.display_bands())
         
         # Create RGB composite (use first 3 bands if available)
         def create_rgb(img):
@@ -301,6 +831,8 @@ class ChangeDetector:
             return rgb
         
         rgb2 = create_rgb(img2_norm)
+        if self.precision != 'float32':
+            rgb2 = dequantize(rgb2, self.precision)
         
         # Create change overlay (red for changes)
         overlay = rgb2.copy()
@@ -308,14 +840,137 @@ class ChangeDetector:
         
         return overlay
     
+    @traced('export (GeoTIFF)')
+    def export_change_map(self, change_map: np.ndarray, output_path: str,
+                          cog: bool = False, nbits: Optional[int] = 1) -> str:
+        """
+        Write a change map as a georeferenced, tiled and compressed GeoTIFF
+        
+        Args:
+            change_map: Change map on the analysis grid (see grid)
+            output_path: Path of the GeoTIFF to write
+            cog: Write a Cloud-Optimized GeoTIFF with internal overviews
+            nbits: Bits per pixel (1 for binary maps, None for full uint8)
+            
+        Returns:
+            output_path
+        """
+        self._ensure_open()
+        if change_map.shape != (self.grid['height'], self.grid['width']):
+            raise ValueError(f"Change map shape {change_map.shape} does not match the images")
+        
+        return write_geotiff(change_map, output_path, self.grid['crs'],
+                             self.grid['transform'], nbits=nbits, cog=cog)
+    
+    @traced('export (polygons)')
+    def export_change_polygons(self, change_map: np.ndarray, output_path: str,
+                               min_area: float = 0.0, simplify_tolerance: float = 1.0,
+                               tile_size: int = 1024) -> int:
+        """
+        Vectorize change regions to GeoJSON (.geojson) or GeoPackage (.gpkg)
+        
+        Polygons are built and written tile by tile, in the CRS of the
+        analysis grid for GeoPackages and in EPSG:4326 for GeoJSON.
+        
+        Args:
+            change_map: Binary change map on the analysis grid
+            output_path: Path of the vector file; its extension picks the format
+            min_area: Drop regions smaller than this, in squared map units
+            simplify_tolerance: Polygon simplification tolerance in pixels
+            tile_size: Tile edge length for labelling and polygonizing
+            
+        Returns:
+            Number of polygons written
+        """
+        self._ensure_open()
+        
+        return export_change_vectors(change_map, output_path, self.grid['transform'],
+                                     self.grid['crs'], tile_size=tile_size,
+                                     simplify_tolerance=simplify_tolerance, min_area=min_area)
+    
+    def precision_report(self, threshold: float = 0.15,
+                         cvd_threshold: float = 0.1) -> Dict[str, Dict[str, float]]:
+        """
+        Drift of the reduced-precision change maps from the float32 path
+        
+        Runs threshold, Otsu and CVD detection in the detector's precision
+        and again with float32 rasters, and compares the results.
+        
+        Args:
+            threshold: Threshold of the threshold method
+            cvd_threshold: Threshold of the CVD method
+            
+        Returns:
+            Per method ('threshold', 'otsu', 'cvd'): 'max_abs_error' and
+            'mean_abs_error' of the difference raster, 'mismatched_pixels'
+            and 'mismatch_percentage' between the change maps,
+            'change_percentage' and 'change_percentage_float32', 'bytes' and
+            'bytes_float32' of the difference raster, and for Otsu the
+            'otsu_threshold' and 'otsu_threshold_float32'; like the change
+            maps themselves, all of them leave out the pixels outside the
+            footprint of a resampled second image
+        """
+        valid = self.valid_mask()
+        
+        def expected_map(binary: np.ndarray, closing: bool = True) -> np.ndarray:
+            # Masked before and after cleaning, as the detectors do
+            change_map = clean_change_map(self._mask_invalid(binary.astype(np.uint8)),
+                                          closing=closing, backend=self.morphology_backend)
+            return self._mask_invalid(change_map)
+        
+        report = {}
+        for method, kind in (('threshold', 'absolute'), ('otsu', 'absolute'), ('cvd', 'cvd')):
+            reduced = (self.calculate_change_magnitude() if kind == 'cvd'
+                       else self.calculate_difference('absolute'))
+            reference = self._fused_difference(kind, precision='float32')
+            error = np.abs(dequantize(reduced, self.precision, self._value_scale(kind)) - reference)
+            if valid is not None:
+                error = error[valid]
+            entry = {
+                'max_abs_error': float(error.max()),
+                'mean_abs_error': float(error.mean()),
+                'bytes': int(reduced.nbytes),
+                'bytes_float32': int(reference.nbytes)
+            }
+            del error
+            
+            if method == 'threshold':
+                change_map = self.detect_changes_threshold(threshold)
+                expected = expected_map(reference > threshold)
+            elif method == 'otsu':
+                change_map = self.detect_changes_otsu()
+                scaled = OtsuHistogram.scale(reference)
+                counts = OtsuHistogram.block_counts(scaled[valid] if valid is not None else scaled)
+                otsu = OtsuHistogram(counts).threshold()
+                expected = expected_map(scaled > otsu)
+                entry.update(otsu_threshold=int(self.otsu_threshold()),
+                             otsu_threshold_float32=int(otsu))
+            else:
+                change_map = self.detect_changes_cvd(cvd_threshold)
+                expected = expected_map(reference > cvd_threshold, closing=False)
+            
+            pixels = self._footprint_pixels(change_map)
+            mismatched = int(np.count_nonzero(change_map != expected))
+            entry.update(mismatched_pixels=mismatched,
+                         mismatch_percentage=100 * mismatched / pixels,
+                         change_percentage=100 * np.count_nonzero(change_map) / pixels,
+                         change_percentage_float32=100 * np.count_nonzero(expected) / pixels)
+            report[method] = entry
+        return report
+    
     def get_metadata(self) -> Dict:
         """
         Get metadata information about the images
         
         Returns:
-            Dictionary containing metadata
+            Dictionary containing the metadata of each image and the
+            analysis 'grid' (crs, transform, bounds, width, height)
         """
+        grid = None
+        if self.grid is not None:
+            grid = {key: self.grid[key] for key in ('crs', 'transform', 'bounds', 'width', 'height')}
         return {
             'image1': self.metadata1,
-            'image2': self.metadata2
+            'image2': self.metadata2,
+            'grid': grid
         }
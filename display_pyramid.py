@@ -0,0 +1,300 @@
+"""
+Level-of-detail rendering of large rasters for the dashboard
+A DisplayPyramid halves the resolution level by level once per analysis.
+Views are cut from the coarsest level that still fills the requested size
+and encoded straight to PNG, so no full-resolution figure is ever
+rasterized. Levels are stored as 8-bit RGB, or as 8-bit colormap indices
+for single-band data; only the full-resolution level and the levels small
+enough to fill a viewport are kept, and windows of the levels in between
+are built when a zoomed view asks for them. Pyramids are not changed by
+rendering, so one can serve many sessions; callers cache the encoded views
+under view_key.
+"""
+
+import io
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+import matplotlib
+from typing import List, Optional, Tuple
+
+# Levels stop halving once their longest side is at or below this size
+MIN_LEVEL_SIZE = 256
+
+# Levels between full resolution and this longest side are built on demand
+MAX_EAGER_SIZE = 2048
+
+# Rows converted to colormap indices at a time
+INDEX_CHUNK_ROWS = 1024
+
+
+def _downsample(image: np.ndarray, reduce: str) -> np.ndarray:
+    """Halve the resolution of a uint8 (height, width[, channels]) array"""
+    height, width = image.shape[:2]
+    # Repeat the last row/column so odd sizes split into whole 2x2 blocks
+    pad = [(0, height % 2), (0, width % 2)] + [(0, 0)] * (image.ndim - 2)
+    padded = np.pad(image, pad, mode='edge') if any(p[1] for p in pad) else image
+    corners = (padded[0::2, 0::2], padded[1::2, 0::2], padded[0::2, 1::2], padded[1::2, 1::2])
+    if reduce == 'max':
+        # Keeps single changed pixels visible at coarse levels
+        return np.maximum(np.maximum(corners[0], corners[1]),
+                          np.maximum(corners[2], corners[3]))
+    # Rounded mean in integer arithmetic
+    total = corners[0].astype(np.uint16)
+    for corner in corners[1:]:
+        total += corner
+    total += 2
+    total >>= 2
+    return total.astype(np.uint8)
+
+
+def _to_indices(image: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    """Scale a 2D array to uint8 positions 0-255 on the color scale"""
+    span = (vmax - vmin) or 1
+    indices = np.empty(image.shape, dtype=np.uint8)
+    for row in range(0, image.shape[0], INDEX_CHUNK_ROWS):
+        chunk = image[row:row + INDEX_CHUNK_ROWS].astype(np.float32)
+        np.subtract(chunk, vmin, out=chunk)
+        np.multiply(chunk, 255 / span, out=chunk)
+        np.clip(np.nan_to_num(chunk, copy=False), 0, 255, out=chunk)
+        np.rint(chunk, out=chunk)
+        indices[row:row + INDEX_CHUNK_ROWS] = chunk
+    return indices
+
+
+def _to_rgb8(image: np.ndarray) -> np.ndarray:
+    """8-bit copy of an RGB array scaled to 0-1"""
+    if image.dtype == np.uint8:
+        return image
+    rgb = np.empty(image.shape, dtype=np.uint8)
+    for row in range(0, image.shape[0], INDEX_CHUNK_ROWS):
+        chunk = np.clip(image[row:row + INDEX_CHUNK_ROWS], 0, 1) * 255
+        rgb[row:row + INDEX_CHUNK_ROWS] = np.rint(chunk)
+    return rgb
+
+
+class DisplayPyramid:
+    """
+    Downsampled image pyramid rendered to PNG views
+
+    Level 0 is the full-resolution image; level k has 2**k times fewer
+    pixels per side. Levels that are neither full resolution nor small
+    enough to fill a viewport are None and built window by window.
+    """
+
+    def __init__(self, image: np.ndarray, reduce: str = 'mean',
+                 cmap: Optional[str] = None, vmin: Optional[float] = None,
+                 vmax: Optional[float] = None, min_size: int = MIN_LEVEL_SIZE,
+                 max_eager_size: int = MAX_EAGER_SIZE):
+        """
+        Build the pyramid
+
+        Args:
+            image: 2D array, or (height, width, 3) RGB array scaled to 0-1
+                (or already 8-bit)
+            reduce: 'mean' for continuous data, 'max' for binary maps
+            cmap: Matplotlib colormap for 2D arrays (gray if None)
+            vmin: Lower end of the color scale (data minimum if None)
+            vmax: Upper end of the color scale (data maximum if None)
+            min_size: Stop adding levels once the longest side fits this
+            max_eager_size: Levels with a longer side than this, other than
+                full resolution, are only built for the windows rendered
+        """
+        if reduce not in ('mean', 'max'):
+            raise ValueError(f"Unknown reduction: {reduce}")
+        self.reduce = reduce
+        self.cmap = cmap
+        if image.ndim == 2:
+            self.vmin = float(np.nanmin(image)) if vmin is None else vmin
+            self.vmax = float(np.nanmax(image)) if vmax is None else vmax
+            level = _to_indices(image, self.vmin, self.vmax)
+        else:
+            self.vmin, self.vmax = 0.0, 1.0
+            level = _to_rgb8(image)
+
+        self.levels: List[Optional[np.ndarray]] = [level]
+        while max(level.shape[:2]) > min_size:
+            level = _downsample(level, reduce)
+            self.levels.append(level if max(level.shape[:2]) <= max_eager_size else None)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """Full-resolution (height, width)"""
+        return self.levels[0].shape[:2]
+
+    def with_overlay(self, mask: 'DisplayPyramid',
+                     color: Tuple[float, float, float] = (1, 0, 0)) -> 'OverlayPyramid':
+        """
+        View of this pyramid with the pixels set in a mask pyramid painted
+        in a color
+
+        The overlay is painted level by level at render time, so with a 'max'
+        mask pyramid small changes stay visible at every zoom level, and no
+        levels are copied.
+        """
+        return OverlayPyramid(self, mask, color)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the stored levels"""
+        return sum(level.nbytes for level in self.levels if level is not None)
+
+    def level_for(self, size: int, window: Optional[Tuple[int, int, int, int]] = None) -> int:
+        """
+        Coarsest level at which a window still spans at least size pixels
+
+        Args:
+            size: Target length in screen pixels of the window's longest side
+            window: (row0, row1, col0, col1) in full-resolution pixels;
+                the whole image if None
+
+        Returns:
+            Level index
+        """
+        row0, row1, col0, col1 = window or (0, self.shape[0], 0, self.shape[1])
+        extent = max(row1 - row0, col1 - col0)
+        level = 0
+        while level + 1 < len(self.levels) and extent >> (level + 1) >= size:
+            level += 1
+        return level
+
+    def crop(self, level: int, rows: Tuple[int, int], cols: Tuple[int, int]) -> np.ndarray:
+        """
+        Part of a level, built from the full-resolution level if the level
+        is not stored
+
+        Args:
+            level: Level index
+            rows: (row0, row1) in pixels of that level
+            cols: (col0, col1) in pixels of that level
+
+        Returns:
+            uint8 array of the crop
+        """
+        if self.levels[level] is not None:
+            return self.levels[level][rows[0]:rows[1], cols[0]:cols[1]]
+        # Halving the matching full-resolution block gives the same pixels
+        # as halving the whole image, since the block starts on even rows
+        # and columns at every step
+        scale = 2 ** level
+        block = self.levels[0][rows[0] * scale:rows[1] * scale, cols[0] * scale:cols[1] * scale]
+        for _ in range(level):
+            block = _downsample(block, self.reduce)
+        return block
+
+    def view_key(self, size: int, window: Optional[Tuple[int, int, int, int]] = None
+                 ) -> Tuple[int, Tuple[int, int, int, int]]:
+        """
+        Level and crop a render call reads; calls with the same key return
+        the same PNG
+
+        Args:
+            size: Target length in screen pixels of the longest side
+            window: (row0, row1, col0, col1) in full-resolution pixels;
+                the whole image if None
+
+        Returns:
+            Tuple of (level, (row0, row1, col0, col1) in pixels of that level)
+        """
+        level = self.level_for(size, window)
+        row0, row1, col0, col1 = window or (0, self.shape[0], 0, self.shape[1])
+        scale = 2 ** level
+        return level, (row0 // scale, max(-(-row1 // scale), row0 // scale + 1),
+                       col0 // scale, max(-(-col1 // scale), col0 // scale + 1))
+
+    def render(self, size: int, window: Optional[Tuple[int, int, int, int]] = None) -> bytes:
+        """
+        PNG of the image (or a window of it) for a display of about size
+        pixels, read from the coarsest sufficient level
+
+        Args:
+            size: Target length in screen pixels of the longest side
+            window: (row0, row1, col0, col1) in full-resolution pixels;
+                the whole image if None
+
+        Returns:
+            PNG bytes
+        """
+        level, crop = self.view_key(size, window)
+        return self._encode(self.crop(level, crop[:2], crop[2:]))
+
+    def _encode(self, data: np.ndarray) -> bytes:
+        if data.ndim == 3:
+            image = Image.fromarray(data)
+        else:
+            # Compact 8-bit palette PNG of the colormap indices
+            image = Image.fromarray(data)
+            image.putpalette(_palette(self.cmap))
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+
+class OverlayPyramid(DisplayPyramid):
+    """
+    RGB pyramid with a mask pyramid painted over it when rendered
+
+    Shares the levels of both pyramids and holds no pixels of its own.
+    """
+
+    def __init__(self, base: DisplayPyramid, mask: DisplayPyramid,
+                 color: Tuple[float, float, float] = (1, 0, 0)):
+        """
+        Initialize the overlay
+
+        Args:
+            base: RGB pyramid
+            mask: Pyramid of the same shape whose nonzero pixels are painted
+            color: RGB color (0-1) of the painted pixels
+        """
+        if base.levels[0].ndim != 3:
+            raise ValueError("Overlays need an RGB base pyramid")
+        if base.shape != mask.shape or len(base.levels) != len(mask.levels):
+            raise ValueError(f"Mask shape {mask.shape} differs from {base.shape}")
+        self.base = base
+        self.mask = mask
+        self.color = np.rint(np.asarray(color) * 255).astype(np.uint8)
+        self.levels = base.levels
+        self.reduce = base.reduce
+        self.cmap, self.vmin, self.vmax = None, 0.0, 1.0
+
+    @property
+    def nbytes(self) -> int:
+        """None of the levels are its own; they belong to base and mask"""
+        return 0
+
+    def crop(self, level: int, rows: Tuple[int, int], cols: Tuple[int, int]) -> np.ndarray:
+        data = self.base.crop(level, rows, cols).copy()
+        data[self.mask.crop(level, rows, cols) > 0] = self.color
+        return data
+
+
+def _colormap(name: Optional[str]):
+    return matplotlib.colormaps[name or 'gray']
+
+
+@lru_cache(maxsize=32)
+def _palette(name: Optional[str]) -> List[int]:
+    """PNG palette of a colormap sampled at the 256 color indices"""
+    colors = _colormap(name)(np.linspace(0, 1, 256), bytes=True)
+    return colors[:, :3].ravel().tolist()
+
+
+@lru_cache(maxsize=32)
+def colorbar_png(cmap: str, vmin: float, vmax: float, label: str = '') -> bytes:
+    """
+    Small horizontal colorbar to show next to a rendered view
+
+    Returns:
+        PNG bytes
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(4, 0.6))
+    fig.colorbar(matplotlib.cm.ScalarMappable(matplotlib.colors.Normalize(vmin, vmax), cmap),
+                 cax=ax, orientation='horizontal', label=label)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
+    plt.close(fig)
+    return buffer.getvalue()
@@ -0,0 +1,97 @@
+"""
+Numba-compiled kernels
+Fuse normalize -> difference -> band aggregation (-> threshold) into one pass
+per pixel, parallel across rows. Only imported when numba is installed; see
+kernels.py for the NumPy reference implementation and backend selection.
+"""
+
+import numpy as np
+from numba import config, njit, prange
+
+# TBB hangs the interpreter at exit once kernels have run on a non-main
+# thread (e.g. a Streamlit script thread); OpenMP is thread-safe and, with
+# spawned tile workers, never forked. NUMBA_THREADING_LAYER still overrides.
+config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+
+# log_ratio stays on NumPy, whose vectorized log beats a compiled scalar loop
+METHOD_CODES = {'absolute': 0, 'ratio': 1, 'cvd': 3}
+
+EPSILON = np.float32(1e-10)
+
+
+@njit(inline='always')
+def _normalize_row(raw, low, high, clip, out):
+    """Scale one raw band row to 0-1 into a float32 buffer"""
+    width = raw.shape[0]
+    if high > low:
+        span = high - low
+        if clip:
+            for col in range(width):
+                out[col] = min(max((np.float32(raw[col]) - low) / span, np.float32(0)),
+                               np.float32(1))
+        else:
+            for col in range(width):
+                out[col] = (np.float32(raw[col]) - low) / span
+    else:
+        for col in range(width):
+            out[col] = np.float32(raw[col])
+
+
+@njit(inline='always')
+def _row_difference(image1, image2, lows1, highs1, lows2, highs2, method, clip, row, acc):
+    """Band-aggregated difference of one row into acc, one band row at a time"""
+    bands, width = image1.shape[0], image1.shape[2]
+    a = np.empty(width, dtype=np.float32)
+    b = np.empty(width, dtype=np.float32)
+    acc[:] = 0
+    for i in range(bands):
+        _normalize_row(image1[i, row], lows1[i], highs1[i], clip, a)
+        _normalize_row(image2[i, row], lows2[i], highs2[i], clip, b)
+        if method == 0:
+            for col in range(width):
+                acc[col] += abs(b[col] - a[col])
+        elif method == 1:
+            for col in range(width):
+                acc[col] += b[col] / (a[col] + EPSILON)
+        else:
+            for col in range(width):
+                acc[col] += (b[col] - a[col]) * (b[col] - a[col])
+    if method == 3:
+        for col in range(width):
+            acc[col] = np.sqrt(acc[col])
+    else:
+        divisor = np.float32(bands)
+        for col in range(width):
+            acc[col] = acc[col] / divisor
+
+
+@njit(parallel=True, cache=True)
+def difference_kernel(image1, image2, lows1, highs1, lows2, highs2, method, clip, out):
+    for row in prange(out.shape[0]):
+        _row_difference(image1, image2, lows1, highs1, lows2, highs2, method, clip,
+                        row, out[row])
+
+
+@njit(parallel=True, cache=True)
+def threshold_kernel(image1, image2, lows1, highs1, lows2, highs2, method, clip,
+                     threshold, out):
+    height, width = out.shape
+    for row in prange(height):
+        acc = np.empty(width, dtype=np.float32)
+        _row_difference(image1, image2, lows1, highs1, lows2, highs2, method, clip, row, acc)
+        for col in range(width):
+            out[row, col] = acc[col] > threshold
+
+
+@njit(parallel=True, cache=True)
+def ndvi_change_kernel(red1, nir1, red2, nir2, ndvi1, ndvi2, ndvi_change):
+    height, width = ndvi_change.shape
+    for row in prange(height):
+        for col in range(width):
+            r1, n1 = np.float32(red1[row, col]), np.float32(nir1[row, col])
+            r2, n2 = np.float32(red2[row, col]), np.float32(nir2[row, col])
+            v1 = (n1 - r1) / (n1 + r1 + EPSILON)
+            v2 = (n2 - r2) / (n2 + r2 + EPSILON)
+            ndvi1[row, col] = v1
+            ndvi2[row, col] = v2
+            ndvi_change[row, col] = v2 - v1
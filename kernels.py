@@ -0,0 +1,338 @@
+"""
+Fused difference kernels
+Normalize, difference and aggregate across bands in one pass over the raw
+bands, writing into a single preallocated output buffer instead of building
+full-size float32 copies and difference stacks.
+
+Two backends are available: 'numpy' (always) and 'numba' (compiled,
+parallel across cores, used when numba is installed). 'auto' picks numba
+when it can be imported and falls back to NumPy otherwise. log_ratio always
+runs on NumPy, whose vectorized logarithm is faster than a compiled loop.
+Both backends give identical results.
+
+Difference rasters can also be stored in reduced precision (float16, or
+uint8 quantized over a known value range); fused_difference_reduced then
+quantizes block by block, so no full-size float32 raster is ever allocated.
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+import logging
+
+try:
+    import jit_kernels
+except ImportError:
+    jit_kernels = None
+
+logger = logging.getLogger(__name__)
+
+DIFFERENCE_METHODS = ('absolute', 'ratio', 'log_ratio', 'cvd')
+
+KERNEL_BACKENDS = ('auto', 'numpy', 'numba')
+
+# Rows processed per chunk; keeps the per-band scratch buffers cache-sized
+CHUNK_ROWS = 256
+
+# Storage dtypes of the precision modes
+PRECISIONS = {'float32': np.float32, 'float16': np.float16, 'uint8': np.uint8}
+
+
+def resolve_kernel_backend(backend: str = 'auto') -> str:
+    """
+    Map a requested kernel backend to the one that will actually run
+
+    Args:
+        backend: 'auto', 'numpy' or 'numba'
+
+    Returns:
+        'numpy' or 'numba'
+    """
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {backend}")
+    if backend == 'numpy':
+        return 'numpy'
+    if jit_kernels is None:
+        if backend == 'numba':
+            logger.warning("numba is not installed - falling back to NumPy kernels")
+        return 'numpy'
+    return 'numba'
+
+
+def _use_jit(backend: str, method: str) -> bool:
+    return resolve_kernel_backend(backend) == 'numba' and method in jit_kernels.METHOD_CODES
+
+
+def _jit_ranges(ranges1, ranges2) -> Tuple[np.ndarray, ...]:
+    return tuple(np.asarray(r, dtype=np.float32) for r in (*ranges1, *ranges2))
+
+
+def _normalize_band_into(raw: np.ndarray, band_min: float, band_max: float,
+                         clip: bool, out: np.ndarray) -> np.ndarray:
+    """Scale one raw band chunk to 0-1 into a float32 scratch buffer"""
+    out[...] = raw
+    band_min, band_max = np.float32(band_min), np.float32(band_max)
+    if band_max > band_min:
+        np.subtract(out, band_min, out=out)
+        np.divide(out, band_max - band_min, out=out)
+        if clip:
+            np.clip(out, 0, 1, out=out)
+    return out
+
+
+def fused_difference(image1: np.ndarray, image2: np.ndarray,
+                     ranges1: Tuple[np.ndarray, np.ndarray],
+                     ranges2: Tuple[np.ndarray, np.ndarray],
+                     method: str = 'absolute', clip: bool = False,
+                     out: Optional[np.ndarray] = None,
+                     chunk_rows: int = CHUNK_ROWS,
+                     backend: str = 'numpy') -> np.ndarray:
+    """
+    Band-aggregated difference of two raw image stacks in a single pass
+
+    Gives the same values as normalizing both stacks, differencing them and
+    taking the band mean (or, for 'cvd', the change vector magnitude), but
+    only ever holds one output raster and a few row-chunk scratch buffers.
+
+    Args:
+        image1: Raw earlier image of shape (bands, height, width), any dtype
+        image2: Raw later image of the same shape
+        ranges1: (lows, highs) per-band normalization bounds of image1
+        ranges2: (lows, highs) per-band normalization bounds of image2
+        method: 'absolute', 'ratio', 'log_ratio' or 'cvd'
+        clip: Clip normalized values to 0-1
+        out: Optional float32 output buffer of shape (height, width) to reuse
+        chunk_rows: Number of rows processed at a time
+        backend: Kernel backend ('auto', 'numpy' or 'numba')
+
+    Returns:
+        Difference raster (out, if given)
+    """
+    if method not in DIFFERENCE_METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    if image1.shape != image2.shape:
+        raise ValueError(f"Image shapes differ: {image1.shape} vs {image2.shape}")
+
+    bands, height, width = image1.shape
+    if out is None:
+        out = np.empty((height, width), dtype=np.float32)
+    elif out.shape != (height, width) or out.dtype != np.float32:
+        raise ValueError(f"Output buffer must be float32 of shape {(height, width)}")
+
+    if _use_jit(backend, method):
+        jit_kernels.difference_kernel(image1, image2, *_jit_ranges(ranges1, ranges2),
+                                      jit_kernels.METHOD_CODES[method], clip, out)
+        return out
+
+    lows1, highs1 = ranges1
+    lows2, highs2 = ranges2
+    chunk_rows = min(chunk_rows, height) or 1
+    scratch1 = np.empty((chunk_rows, width), dtype=np.float32)
+    scratch2 = np.empty((chunk_rows, width), dtype=np.float32)
+
+    for row0 in range(0, height, chunk_rows):
+        row1 = min(row0 + chunk_rows, height)
+        acc = out[row0:row1]
+        for i in range(bands):
+            a = _normalize_band_into(image1[i, row0:row1], lows1[i], highs1[i], clip,
+                                     scratch1[:row1 - row0])
+            b = _normalize_band_into(image2[i, row0:row1], lows2[i], highs2[i], clip,
+                                     scratch2[:row1 - row0])
+
+            # Per-band term, computed in place in b
+            if method == 'absolute':
+                np.subtract(b, a, out=b)
+                np.abs(b, out=b)
+            elif method == 'ratio':
+                np.add(a, 1e-10, out=a)
+                np.divide(b, a, out=b)
+            elif method == 'log_ratio':
+                np.add(a, 1e-10, out=a)
+                np.add(b, 1e-10, out=b)
+                np.divide(b, a, out=b)
+                np.log(b, out=b)
+            else:
+                np.subtract(b, a, out=b)
+                np.square(b, out=b)
+
+            if i == 0:
+                acc[...] = b
+            else:
+                np.add(acc, b, out=acc)
+
+        if method == 'cvd':
+            np.sqrt(acc, out=acc)
+        else:
+            np.divide(acc, bands, out=acc)
+
+    return out
+
+
+def quantize(values: np.ndarray, precision: str, scale: float = 1.0,
+             out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Store float values in a precision mode's dtype
+
+    uint8 maps [0, scale] linearly onto 0-255, truncating like
+    OtsuHistogram.scale and clipping values outside the range; float16 and
+    float32 are plain casts.
+
+    Args:
+        values: Float values (a float32 input may be modified in place)
+        precision: 'float32', 'float16' or 'uint8'
+        scale: Largest representable value in uint8 mode
+        out: Optional output array of the precision's dtype
+
+    Returns:
+        Array of the precision's dtype (out, if given)
+    """
+    dtype = PRECISIONS[precision]
+    if out is None:
+        out = np.empty(values.shape, dtype=dtype)
+    if precision == 'uint8':
+        if values.dtype != np.float32:
+            values = values.astype(np.float32)
+        np.multiply(values, np.float32(255 / scale), out=values)
+        np.clip(values, 0, 255, out=values)
+    out[...] = values
+    return out
+
+
+def dequantize(values: np.ndarray, precision: str, scale: float = 1.0) -> np.ndarray:
+    """
+    Float32 values of an array stored by quantize
+    """
+    values = values.astype(np.float32)
+    if precision == 'uint8':
+        values *= np.float32(scale / 255)
+    return values
+
+
+def storage_threshold(threshold: float, precision: str, scale: float = 1.0) -> np.generic:
+    """
+    Threshold to compare stored values against, so that stored > result
+    approximates value > threshold
+
+    Float modes compare the stored values directly. uint8 values stand for
+    the bin [q, q + 1) * scale / 255, and a bin counts as above the
+    threshold when its center is, which keeps the change map unbiased.
+    """
+    if precision == 'uint8':
+        return np.float32(threshold * 255 / scale - 0.5)
+    return np.float32(threshold)
+
+
+def fused_difference_reduced(image1: np.ndarray, image2: np.ndarray,
+                             ranges1: Tuple[np.ndarray, np.ndarray],
+                             ranges2: Tuple[np.ndarray, np.ndarray],
+                             method: str = 'absolute', precision: str = 'float16',
+                             scale: float = 1.0, clip: bool = False,
+                             chunk_rows: int = CHUNK_ROWS,
+                             backend: str = 'numpy') -> np.ndarray:
+    """
+    fused_difference stored in reduced precision
+
+    Row blocks are computed in float32 into a small scratch buffer and
+    quantized into the output, which is all that stays in memory.
+
+    Args:
+        image1: Raw earlier image of shape (bands, height, width), any dtype
+        image2: Raw later image of the same shape
+        ranges1: (lows, highs) per-band normalization bounds of image1
+        ranges2: (lows, highs) per-band normalization bounds of image2
+        method: 'absolute', 'ratio', 'log_ratio' or 'cvd'
+        precision: 'float32', 'float16' or 'uint8'
+        scale: Largest representable value in uint8 mode
+        clip: Clip normalized values to 0-1
+        chunk_rows: Number of rows quantized at a time
+        backend: Kernel backend ('auto', 'numpy' or 'numba')
+
+    Returns:
+        Difference raster of the precision's dtype
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+    if precision == 'float32':
+        return fused_difference(image1, image2, ranges1, ranges2, method, clip,
+                                chunk_rows=chunk_rows, backend=backend)
+    if image1.shape != image2.shape:
+        raise ValueError(f"Image shapes differ: {image1.shape} vs {image2.shape}")
+
+    _, height, width = image1.shape
+    out = np.empty((height, width), dtype=PRECISIONS[precision])
+    block = np.empty((min(chunk_rows, height) or 1, width), dtype=np.float32)
+    for row0 in range(0, height, chunk_rows):
+        row1 = min(row0 + chunk_rows, height)
+        values = fused_difference(image1[:, row0:row1], image2[:, row0:row1], ranges1,
+                                  ranges2, method, clip, out=block[:row1 - row0],
+                                  chunk_rows=chunk_rows, backend=backend)
+        quantize(values, precision, scale, out=out[row0:row1])
+    return out
+
+
+def fused_threshold(image1: np.ndarray, image2: np.ndarray,
+                    ranges1: Tuple[np.ndarray, np.ndarray],
+                    ranges2: Tuple[np.ndarray, np.ndarray],
+                    method: str, threshold: float, clip: bool = False,
+                    backend: str = 'numpy') -> np.ndarray:
+    """
+    Binary map of where the band-aggregated difference exceeds a threshold
+
+    With the numba backend normalize -> difference -> threshold run in one
+    pass per pixel and no difference raster is stored.
+
+    Args:
+        image1: Raw earlier image of shape (bands, height, width)
+        image2: Raw later image of the same shape
+        ranges1: (lows, highs) per-band normalization bounds of image1
+        ranges2: (lows, highs) per-band normalization bounds of image2
+        method: 'absolute', 'ratio', 'log_ratio' or 'cvd'
+        threshold: Change threshold
+        clip: Clip normalized values to 0-1
+        backend: Kernel backend ('auto', 'numpy' or 'numba')
+
+    Returns:
+        Boolean change map
+    """
+    if method not in DIFFERENCE_METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    if _use_jit(backend, method):
+        out = np.empty(image1.shape[1:], dtype=bool)
+        jit_kernels.threshold_kernel(image1, image2, *_jit_ranges(ranges1, ranges2),
+                                     jit_kernels.METHOD_CODES[method], clip,
+                                     np.float32(threshold), out)
+        return out
+
+    return fused_difference(image1, image2, ranges1, ranges2, method, clip,
+                            backend=backend) > threshold
+
+
+def fused_ndvi_change(red1: np.ndarray, nir1: np.ndarray, red2: np.ndarray,
+                      nir2: np.ndarray, backend: str = 'numpy'
+                      ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    NDVI of both dates and their difference
+
+    Args:
+        red1: Red band of the earlier image
+        nir1: Near-infrared band of the earlier image
+        red2: Red band of the later image
+        nir2: Near-infrared band of the later image
+        backend: Kernel backend ('auto', 'numpy' or 'numba')
+
+    Returns:
+        Tuple of (ndvi1, ndvi2, ndvi_change)
+    """
+    if resolve_kernel_backend(backend) == 'numba':
+        ndvi1 = np.empty(red1.shape, dtype=np.float32)
+        ndvi2 = np.empty(red1.shape, dtype=np.float32)
+        change = np.empty(red1.shape, dtype=np.float32)
+        jit_kernels.ndvi_change_kernel(red1, nir1, red2, nir2, ndvi1, ndvi2, change)
+        return ndvi1, ndvi2, change
+
+    def ndvi(red, nir):
+        red = red.astype(np.float32)
+        nir = nir.astype(np.float32)
+        return np.divide(nir - red, nir + red + 1e-10)
+
+    ndvi1, ndvi2 = ndvi(red1, nir1), ndvi(red2, nir2)
+    return ndvi1, ndvi2, ndvi2 - ndvi1
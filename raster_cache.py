@@ -0,0 +1,221 @@
+"""
+Persistent on-disk cache of decoded and derived raster arrays
+Arrays are stored as .npy files keyed by the source file's content hash and
+the processing parameters, and are memory-mapped read-only on a hit so
+repeat analyses of the same scenes skip decoding entirely.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+from typing import Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Files are hashed in chunks of this size
+HASH_CHUNK_BYTES = 1 << 20
+
+
+class RasterCache:
+    """
+    Directory of memory-mappable .npy arrays with size-based LRU eviction
+
+    The modification time of each file records its last use; when the
+    directory grows past max_bytes the least recently used arrays are
+    deleted first.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Cache directory (created if missing)
+            max_bytes: Size limit of all cached arrays; None for no limit
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._index_path = self.directory / 'hashes.json'
+        # Content hashes by file stamp, loaded from hashes.json on first use
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path: str) -> str:
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def content_hash(self, path: str) -> str:
+        """
+        Hash of a file's content
+
+        Hashes are remembered per (path, size, mtime), so unchanged files are
+        only read once. The index is written back only when a new file is
+        hashed.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            Hex digest
+        """
+        stamp = self._stamp(path)
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            if stamp in self._index:
+                return self._index[stamp]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+                digest.update(chunk)
+
+        with self._lock:
+            self._index[stamp] = digest.hexdigest()
+            self._prune_index()
+            self._write_index()
+            return self._index[stamp]
+
+    @staticmethod
+    def _is_current(stamp: str) -> bool:
+        """Whether the file a stamp describes still exists unchanged"""
+        path = stamp.rsplit('|', 2)[0]
+        try:
+            return RasterCache._stamp(path) == stamp
+        except OSError:
+            return False
+
+    def _prune_index(self) -> bool:
+        """Drop hashes of files that were deleted or have changed since"""
+        stale = [stamp for stamp in self._index if not self._is_current(stamp)]
+        for stamp in stale:
+            del self._index[stamp]
+        return bool(stale)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        if self._prune_index():
+            self._write_index()
+
+    def _write_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def key(self, path: str, kind: str, **params) -> str:
+        """
+        Cache key of an array derived from a file
+
+        Args:
+            path: Source file
+            kind: What the array holds, e.g. 'decoded' or 'normalized'
+            **params: Processing parameters the array depends on
+
+        Returns:
+            Key usable with get and put
+        """
+        description = json.dumps([self.content_hash(path), kind, params],
+                                 sort_keys=True, default=str)
+        return hashlib.blake2b(description.encode(), digest_size=20).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Memory-map a cached array
+
+        Returns:
+            Read-only array backed by the cache file, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        # Plain ndarray view of the mapping; no data is copied
+        return np.asarray(array)
+
+    def put(self, key: str, array: np.ndarray) -> np.ndarray:
+        """
+        Store an array, then evict least recently used entries over the limit
+
+        Arrays larger than the whole limit are not stored.
+
+        Returns:
+            The array
+        """
+        if self.max_bytes is not None and array.nbytes > self.max_bytes:
+            return array
+
+        # Write to a temporary file first so readers never see partial arrays
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, self._entry_path(key))
+        self.evict()
+        return array
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Cached array if present, otherwise compute, store and return it
+        """
+        array = self.get(key)
+        if array is not None:
+            logger.info(f"Raster cache hit: {key}")
+            return array
+        return self.put(key, compute())
+
+    def size(self) -> int:
+        """
+        Total size of the cached arrays in bytes
+        """
+        return sum(path.stat().st_size for path in self.directory.glob('*.npy'))
+
+    def evict(self):
+        """
+        Delete least recently used arrays until the cache fits max_bytes
+        """
+        if self.max_bytes is None:
+            return
+        entries = []
+        for path in self.directory.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            logger.info(f"Evicted {path.name} from raster cache")
+
+    def clear(self):
+        """
+        Delete every cached array
+        """
+        for path in self.directory.glob('*.npy'):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._index = {}
+            self._index_path.unlink(missing_ok=True)
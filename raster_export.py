@@ -0,0 +1,131 @@
+"""
+Georeferenced export of change maps
+Maps are written as tiled, deflate-compressed GeoTIFFs (1-bit for binary
+maps) one strip of tiles at a time, so no text or full-size copy of the map
+is ever built. Cloud-Optimized GeoTIFFs add internal overviews for
+streaming viewers.
+"""
+
+import os
+import tempfile
+import rasterio
+from rasterio.shutil import copy as copy_dataset
+from rasterio.windows import Window
+import numpy as np
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Internal tile size of exported GeoTIFFs
+BLOCK_SIZE = 256
+
+
+def geotiff_profile(height: int, width: int, crs=None, transform=None, count: int = 1,
+                    dtype: str = 'uint8', nbits: Optional[int] = None,
+                    block_size: int = BLOCK_SIZE) -> Dict:
+    """
+    Profile of a tiled, deflate-compressed GeoTIFF
+
+    Args:
+        height: Raster height in pixels
+        width: Raster width in pixels
+        crs: Coordinate reference system (None for plain pixel grids)
+        transform: Affine pixel-to-map transform
+        count: Number of bands
+        dtype: Data type
+        nbits: Bits per sample for packed integer output (e.g. 1 for binary
+            maps); None for the full width of dtype
+        block_size: Tile size in pixels (multiple of 16)
+
+    Returns:
+        Keyword arguments for rasterio.open in write mode
+    """
+    profile = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': count,
+        'dtype': dtype,
+        'crs': crs,
+        'transform': transform,
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size,
+        'compress': 'deflate'
+    }
+    if nbits is not None:
+        profile['nbits'] = nbits
+    return profile
+
+
+def write_geotiff(array: np.ndarray, output_path: str, crs=None, transform=None,
+                  nbits: Optional[int] = None, cog: bool = False,
+                  block_size: int = BLOCK_SIZE) -> str:
+    """
+    Write a 2D map to a tiled, compressed GeoTIFF
+
+    Args:
+        array: 2D map; binary and boolean maps are stored as uint8
+        output_path: Path of the GeoTIFF to write
+        crs: Coordinate reference system
+        transform: Affine pixel-to-map transform
+        nbits: Bits per sample (1 for binary maps); None for full uint8
+        cog: Write a Cloud-Optimized GeoTIFF with internal overviews
+        block_size: Tile size in pixels
+
+    Returns:
+        output_path
+    """
+    if array.ndim != 2:
+        raise ValueError(f"Expected a 2D map, got shape {array.shape}")
+    height, width = array.shape
+    profile = geotiff_profile(height, width, crs, transform, nbits=nbits,
+                              block_size=block_size)
+
+    if not cog:
+        _write_strips(array, output_path, profile, block_size)
+        logger.info(f"Map written to {output_path}")
+        return output_path
+
+    # The COG driver only copies existing datasets: stream into a tiled
+    # GeoTIFF next to the output first, then reorganize it with overviews
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)),
+                                    suffix='.tif')
+    os.close(fd)
+    try:
+        _write_strips(array, tmp_path, profile, block_size)
+        options = {'nbits': nbits} if nbits is not None else {}
+        copy_dataset(tmp_path, output_path, driver='COG', compress='DEFLATE',
+                     blocksize=block_size, overview_resampling='nearest', **options)
+    finally:
+        os.remove(tmp_path)
+    logger.info(f"Cloud-Optimized GeoTIFF written to {output_path}")
+    return output_path
+
+
+def _write_strips(array: np.ndarray, output_path: str, profile: Dict, block_size: int):
+    """Write one row of tiles at a time, converting only that strip to uint8"""
+    height, width = array.shape
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        for row0 in range(0, height, block_size):
+            rows = min(block_size, height - row0)
+            strip = array[row0:row0 + rows].astype(profile['dtype'], copy=False)
+            dst.write(strip, 1, window=Window(0, row0, width, rows))
+
+
+def geotiff_bytes(array: np.ndarray, crs=None, transform=None,
+                  nbits: Optional[int] = None, cog: bool = False) -> bytes:
+    """
+    Encoded GeoTIFF of a 2D map, e.g. for a download button
+
+    Takes the same arguments as write_geotiff.
+
+    Returns:
+        File content
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_geotiff(array, os.path.join(directory, 'map.tif'), crs, transform,
+                             nbits=nbits, cog=cog)
+        with open(path, 'rb') as f:
+            return f.read()
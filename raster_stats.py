@@ -0,0 +1,369 @@
+"""
+Streaming per-band statistics for normalization
+Accumulates band minimum, maximum and histogram-based percentiles one block at
+a time so tiled and out-of-core processing scale every tile the same way
+"""
+
+import rasterio
+import numpy as np
+from skimage import filters
+from typing import Dict, Optional, Tuple
+import logging
+
+from tiling import aligned_tile_shape, iter_tiles, map_tiles
+
+logger = logging.getLogger(__name__)
+
+# Integer bands whose value span fits in this many bins get one bin per value,
+# which makes the percentiles exact
+MAX_HISTOGRAM_BINS = 65536
+
+
+def normalize_stack(img: np.ndarray, band_mins: np.ndarray,
+                    band_maxs: np.ndarray, clip: bool = False) -> np.ndarray:
+    """
+    Scale each band of an image stack to 0-1 using the given band ranges
+
+    Args:
+        img: Image array of shape (bands, height, width)
+        band_mins: Lower bound of each band (minimum or low percentile)
+        band_maxs: Upper bound of each band (maximum or high percentile)
+        clip: Clip values outside the bounds to 0-1
+
+    Returns:
+        Normalized float32 image
+    """
+    img = img.astype(np.float32)
+    normalized = np.zeros_like(img, dtype=np.float32)
+    for i in range(img.shape[0]):
+        band = img[i]
+        band_min, band_max = np.float32(band_mins[i]), np.float32(band_maxs[i])
+        if band_max > band_min:
+            normalized[i] = (band - band_min) / (band_max - band_min)
+            if clip:
+                np.clip(normalized[i], 0, 1, out=normalized[i])
+        else:
+            normalized[i] = band
+    return normalized
+
+
+class BandStatistics:
+    """
+    Mergeable per-band statistics of a raster, built from blocks
+
+    Statistics are gathered in two passes: the first finds each band's range,
+    the second fills a histogram over that range from which percentiles are
+    read.
+    """
+
+    def __init__(self, band_count: int, integer: bool = False, bins: int = 4096):
+        """
+        Initialize empty statistics
+
+        Args:
+            band_count: Number of bands
+            integer: Whether the raster has an integer data type
+            bins: Number of histogram bins for non-integer data
+        """
+        self.band_count = band_count
+        self.integer = integer
+        self.bins = bins
+        self.mins = np.full(band_count, np.inf)
+        self.maxs = np.full(band_count, -np.inf)
+        self.counts = None
+        self.bin_widths = None
+
+    def update_range(self, data: np.ndarray):
+        """
+        First pass: fold a block of shape (bands, height, width) into the ranges
+        """
+        self.merge_range(np.nanmin(data, axis=(1, 2)), np.nanmax(data, axis=(1, 2)))
+
+    def merge_range(self, mins: np.ndarray, maxs: np.ndarray):
+        """
+        Fold precomputed block ranges (e.g. from a worker) into the ranges
+        """
+        self.mins = np.fmin(self.mins, mins)
+        self.maxs = np.fmax(self.maxs, maxs)
+
+    def start_histogram(self):
+        """
+        Lay out histogram bins over the ranges found in the first pass
+        """
+        spans = self.maxs - self.mins
+        if self.integer and np.all(spans < MAX_HISTOGRAM_BINS):
+            nbins = int(spans.max()) + 1
+            self.bin_widths = np.ones(self.band_count)
+        else:
+            nbins = self.bins
+            self.bin_widths = np.where(spans > 0, spans / nbins, 1.0)
+        self.counts = np.zeros((self.band_count, nbins), dtype=np.int64)
+
+    def histogram_params(self) -> Dict:
+        """
+        Everything a worker needs to histogram a block on its own
+        """
+        return {
+            'mins': self.mins,
+            'bin_widths': self.bin_widths,
+            'nbins': self.counts.shape[1]
+        }
+
+    @staticmethod
+    def block_histogram(data: np.ndarray, mins: np.ndarray, bin_widths: np.ndarray,
+                        nbins: int) -> np.ndarray:
+        """
+        Histogram of one block with fixed bins
+
+        Args:
+            data: Block of shape (bands, height, width)
+            mins: Lower edge of the first bin of each band
+            bin_widths: Bin width of each band
+            nbins: Number of bins
+
+        Returns:
+            Counts of shape (bands, nbins)
+        """
+        counts = np.zeros((data.shape[0], nbins), dtype=np.int64)
+        for i in range(data.shape[0]):
+            band = data[i].ravel()
+            band = band[~np.isnan(band)] if band.dtype.kind == 'f' else band
+            idx = ((band.astype(np.float64) - mins[i]) / bin_widths[i]).astype(np.int64)
+            np.clip(idx, 0, nbins - 1, out=idx)
+            counts[i] = np.bincount(idx, minlength=nbins)
+        return counts
+
+    def update_histogram(self, data: np.ndarray):
+        """
+        Second pass: add a block of shape (bands, height, width) to the histogram
+        """
+        self.counts += self.block_histogram(data, **self.histogram_params())
+
+    def merge_histogram(self, counts: np.ndarray):
+        """
+        Add precomputed block counts (e.g. from a worker) to the histogram
+        """
+        self.counts += counts
+
+    def percentile(self, q: float) -> np.ndarray:
+        """
+        Per-band percentile from the accumulated histogram
+
+        Uses the same linear interpolation as np.percentile. For integer data
+        with one bin per value the result is exact; otherwise values are placed
+        at bin centers.
+
+        Args:
+            q: Percentile in the range 0-100
+
+        Returns:
+            Percentile of each band
+        """
+        if self.counts is None:
+            raise RuntimeError("Histogram pass has not been run")
+
+        offset = 0.0 if self.integer and np.all(self.bin_widths == 1) else 0.5
+        result = np.empty(self.band_count)
+        for i in range(self.band_count):
+            cumulative = np.cumsum(self.counts[i])
+            total = cumulative[-1]
+            if total == 0:
+                result[i] = np.nan
+                continue
+            rank = q / 100 * (total - 1)
+            lower, upper = int(np.floor(rank)), int(np.ceil(rank))
+            value_lower = np.searchsorted(cumulative, lower, side='right')
+            value_upper = np.searchsorted(cumulative, upper, side='right')
+            value_lower = self.mins[i] + (value_lower + offset) * self.bin_widths[i]
+            value_upper = self.mins[i] + (value_upper + offset) * self.bin_widths[i]
+            result[i] = value_lower + (rank - lower) * (value_upper - value_lower)
+        return result
+
+    def normalization_range(self, clip_percentiles: Optional[Tuple[float, float]] = None
+                            ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Band ranges to scale to 0-1
+
+        Args:
+            clip_percentiles: Optional (low, high) percentiles for robust
+                scaling; without it the full min-max range is used
+
+        Returns:
+            Tuple of per-band lower and upper bounds
+        """
+        if clip_percentiles is None:
+            return self.mins, self.maxs
+        low, high = clip_percentiles
+        return self.percentile(low), self.percentile(high)
+
+    @classmethod
+    def from_array(cls, img: np.ndarray, with_histogram: bool = False) -> 'BandStatistics':
+        """
+        Statistics of an in-memory image, treated as a single block
+
+        Args:
+            img: Image array of shape (bands, height, width)
+            with_histogram: Also run the histogram pass
+
+        Returns:
+            BandStatistics
+        """
+        stats = cls(img.shape[0], integer=np.issubdtype(img.dtype, np.integer))
+        stats.update_range(img)
+        if with_histogram:
+            stats.start_histogram()
+            stats.update_histogram(img)
+        return stats
+
+
+class OtsuHistogram:
+    """
+    Mergeable 256-bin histogram of a difference raster scaled to 0-255
+
+    Tiles or workers each add their counts; the Otsu threshold is computed
+    from the merged histogram and kept until more data is added.
+    """
+
+    def __init__(self, counts: Optional[np.ndarray] = None):
+        """
+        Initialize the histogram
+
+        Args:
+            counts: Optional initial pixel count for each value 0-255
+        """
+        self.counts = np.zeros(256, dtype=np.int64) if counts is None else counts.astype(np.int64)
+        self._threshold = None
+
+    @staticmethod
+    def scale(diff: np.ndarray) -> np.ndarray:
+        """
+        Scale a 0-1 difference raster to 0-255 the way Otsu detection does
+        """
+        return (diff * 255).astype(np.uint8)
+
+    @staticmethod
+    def block_counts(diff_scaled: np.ndarray) -> np.ndarray:
+        """
+        Histogram of one block of scaled difference values
+        """
+        return np.bincount(diff_scaled.ravel(), minlength=256)
+
+    def update(self, diff_scaled: np.ndarray):
+        """
+        Add a block of scaled (uint8) difference values
+        """
+        self.merge(self.block_counts(diff_scaled))
+
+    def merge(self, counts: np.ndarray):
+        """
+        Add precomputed block counts (e.g. from a worker)
+        """
+        self.counts += counts
+        self._threshold = None
+
+    def threshold(self) -> int:
+        """
+        Otsu threshold of the merged histogram
+
+        Gives the same threshold as filters.threshold_otsu on all the pixels
+        the histogram was built from.
+
+        Returns:
+            Threshold on the 0-255 scale
+        """
+        if self._threshold is None:
+            nonzero = np.flatnonzero(self.counts)
+            if len(nonzero) == 0:
+                self._threshold = 0
+            elif nonzero[0] == nonzero[-1]:
+                self._threshold = int(nonzero[0])
+            else:
+                lo, hi = nonzero[0], nonzero[-1]
+                bin_centers = np.arange(lo, hi + 1)
+                self._threshold = int(filters.threshold_otsu(
+                    hist=(self.counts[lo:hi + 1], bin_centers)))
+        return self._threshold
+
+
+def _range_tile(job: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-band min and max of one tile"""
+    with rasterio.open(job['path']) as src:
+        data = src.read(window=job['window'])
+    return np.nanmin(data, axis=(1, 2)), np.nanmax(data, axis=(1, 2))
+
+
+def _histogram_tile(job: Dict) -> np.ndarray:
+    """Per-band histogram of one tile"""
+    with rasterio.open(job['path']) as src:
+        data = src.read(window=job['window'])
+    return BandStatistics.block_histogram(data, **job['histogram'])
+
+
+def compute_band_statistics(path: str, with_histogram: bool = False,
+                            tile_size: int = 1024, workers: int = 1) -> BandStatistics:
+    """
+    Gather per-band statistics of a raster without loading it
+
+    Args:
+        path: Path of the raster
+        with_histogram: Also run the histogram pass needed for percentiles
+        tile_size: Approximate tile edge length in pixels
+        workers: Number of worker processes
+
+    Returns:
+        BandStatistics
+    """
+    with rasterio.open(path) as src:
+        stats = BandStatistics(src.count, integer=np.issubdtype(np.dtype(src.dtypes[0]), np.integer))
+        windows = [window for window, _, _ in
+                   iter_tiles(src.height, src.width, aligned_tile_shape(src, tile_size))]
+
+    logger.info(f"Computing band ranges of {path}")
+    jobs = ({'path': path, 'window': window} for window in windows)
+    for mins, maxs in map_tiles(_range_tile, jobs, workers):
+        stats.merge_range(mins, maxs)
+
+    if with_histogram:
+        logger.info(f"Computing band histograms of {path}")
+        stats.start_histogram()
+        params = stats.histogram_params()
+        jobs = ({'path': path, 'window': window, 'histogram': params} for window in windows)
+        for counts in map_tiles(_histogram_tile, jobs, workers):
+            stats.merge_histogram(counts)
+
+    return stats
+
+
+def normalize_raster(src_path: str, dst_path: str,
+                     clip_percentiles: Optional[Tuple[float, float]] = None,
+                     statistics: Optional[BandStatistics] = None,
+                     tile_size: int = 1024) -> BandStatistics:
+    """
+    Write a 0-1 float32 normalized copy of a raster, one tile at a time
+
+    Args:
+        src_path: Path of the input raster
+        dst_path: Path of the normalized GeoTIFF to write
+        clip_percentiles: Optional (low, high) percentiles for robust scaling
+        statistics: Precomputed statistics (gathered if not given)
+        tile_size: Approximate tile edge length in pixels
+
+    Returns:
+        The statistics used
+    """
+    if statistics is None:
+        statistics = compute_band_statistics(src_path, clip_percentiles is not None, tile_size)
+    lows, highs = statistics.normalization_range(clip_percentiles)
+
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        profile.update(dtype='float32', nodata=None, driver='GTiff')
+        with rasterio.open(dst_path, 'w', **profile) as dst:
+            tile_shape = aligned_tile_shape(src, tile_size)
+            for window, _, _ in iter_tiles(src.height, src.width, tile_shape):
+                normalized = normalize_stack(src.read(window=window), lows, highs,
+                                             clip=clip_percentiles is not None)
+                dst.write(normalized, window=window)
+
+    logger.info(f"Normalized raster written to {dst_path}")
+    return statistics
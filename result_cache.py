@@ -0,0 +1,109 @@
+"""
+Bounded in-memory cache of analysis results
+Entries are dictionaries of arrays, display pyramids and plain values, or
+encoded bytes. An entry's size is the sum of the nbytes of the objects it
+contains, counting bytes by their length, and the least recently used
+entries are evicted once the cache exceeds its memory budget.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def file_identity(path: str) -> Tuple[str, int, int]:
+    """
+    Identity of a file for cache keys: path, size and modification time
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def result_nbytes(value: Any) -> int:
+    """
+    Memory held by the arrays (or other objects reporting nbytes) and bytes
+    in a (nested) result
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(result_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(result_nbytes(v) for v in value)
+    return int(getattr(value, 'nbytes', 0))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a memory budget
+
+    Entries are measured once, when they are put, so they must not be
+    changed afterwards.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Memory budget for all cached results
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Cached result for key, or None
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        """
+        Store a result, evicting the oldest entries past the memory budget
+
+        Results larger than the whole budget are not stored.
+
+        Returns:
+            The result
+        """
+        size = result_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value
+            while self._entries and self._bytes + size > self.max_bytes:
+                old_key, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                logger.info(f"Evicted cached result {old_key}")
+            self._entries[key] = (value, size)
+            self._bytes += size
+        return value
+
+    def clear(self):
+        """
+        Drop all cached results
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by cached results in bytes
+        """
+        return self._bytes
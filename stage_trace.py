@@ -0,0 +1,221 @@
+"""
+Per-stage instrumentation of the detection pipeline
+Code marks its stages with the stage context manager or the traced
+decorator. While a StageTrace is active (see StageTrace.activate) every
+stage records its wall time, the process CPU time and, optionally, the bytes
+allocated through Python's tracemalloc (NumPy arrays included); with no
+active trace the hooks do nothing. Traces export to JSON and to the Chrome
+trace event format (chrome://tracing, Perfetto).
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+_active_trace: ContextVar[Optional['StageTrace']] = ContextVar('active_trace', default=None)
+
+
+class StageTrace:
+    """
+    Timeline of the stages run while the trace was active
+
+    Each record is a dictionary with 'name', 'depth' (nesting level),
+    'start' (seconds since the trace began), 'wall' and 'cpu' (seconds),
+    'thread', and, with memory tracking, 'allocated' (net bytes still held
+    at the end of the stage) and 'peak' (largest extra allocation during
+    the stage).
+    """
+
+    def __init__(self, name: str = 'trace', track_memory: bool = False):
+        """
+        Initialize an empty trace
+
+        Args:
+            name: Name shown for this trace in exports
+            track_memory: Record allocated bytes with tracemalloc (slows
+                Python-heavy code down; tracemalloc is process-wide)
+        """
+        self.name = name
+        self.track_memory = track_memory
+        self.records: List[Dict] = []
+        self._origin = time.perf_counter()
+        self._stack: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self) -> Iterator['StageTrace']:
+        """
+        Record the stages run inside the block (in this thread or context)
+        """
+        started_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        token = _active_trace.set(self)
+        try:
+            yield self
+        finally:
+            _active_trace.reset(token)
+            if started_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time one stage; stages may nest
+        """
+        memory = self.track_memory and tracemalloc.is_tracing()
+        frame = {'peak': 0}
+        if memory:
+            current_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            self._stack.pop()
+            record = {
+                'name': name,
+                'depth': len(self._stack),
+                'start': wall_start - self._origin,
+                'wall': wall,
+                'cpu': cpu,
+                'thread': threading.get_ident()
+            }
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                # Nested stages reset the peak, so fold in what they saw
+                peak = max(peak, frame['peak'])
+                record['allocated'] = current - current_start
+                record['peak'] = max(peak - current_start, 0)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            with self._lock:
+                self.records.append(record)
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """
+        Call count, wall time and CPU time summed per stage name
+
+        Returns:
+            {name: {'calls', 'wall', 'cpu'[, 'allocated', 'peak']}}
+        """
+        totals = {}
+        for record in self.records:
+            entry = totals.setdefault(record['name'], {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            entry['calls'] += 1
+            entry['wall'] += record['wall']
+            entry['cpu'] += record['cpu']
+            if 'allocated' in record:
+                entry['allocated'] = entry.get('allocated', 0) + record['allocated']
+                entry['peak'] = max(entry.get('peak', 0), record['peak'])
+        return totals
+
+    def to_dict(self) -> Dict:
+        """
+        Structured form of the trace, with records in start order
+        """
+        return {
+            'name': self.name,
+            'track_memory': self.track_memory,
+            'records': sorted(self.records, key=lambda r: r['start'])
+        }
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        """
+        JSON text of the trace, also written to path when given
+        """
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def chrome_events(self, tid: Optional[int] = None) -> List[Dict]:
+        """
+        Complete ('X') events of the Chrome trace event format
+
+        Args:
+            tid: Track to put every event on (the recording thread if None)
+        """
+        pid = os.getpid()
+        events = []
+        for record in sorted(self.records, key=lambda r: r['start']):
+            args = {'cpu_ms': round(record['cpu'] * 1e3, 3)}
+            if 'allocated' in record:
+                args.update(allocated_bytes=record['allocated'], peak_bytes=record['peak'])
+            events.append({
+                'name': record['name'],
+                'ph': 'X',
+                'ts': record['start'] * 1e6,
+                'dur': record['wall'] * 1e6,
+                'pid': pid,
+                'tid': record['thread'] if tid is None else tid,
+                'args': args
+            })
+        return events
+
+    def to_chrome_trace(self, path: Optional[str] = None) -> str:
+        """
+        Chrome trace JSON of the trace, also written to path when given
+        """
+        return chrome_trace([self], path)
+
+
+def chrome_trace(traces: List[StageTrace], path: Optional[str] = None) -> str:
+    """
+    Chrome trace JSON with one track per trace
+
+    Args:
+        traces: Traces to combine; each is shown as a named thread
+        path: Optional file to write
+
+    Returns:
+        The JSON text
+    """
+    events = []
+    for tid, trace in enumerate(traces, 1):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                       'args': {'name': trace.name}})
+        events.extend(trace.chrome_events(tid))
+    text = json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(text)
+    return text
+
+
+def active_trace() -> Optional[StageTrace]:
+    """The trace recording in the current context, if any"""
+    return _active_trace.get()
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage into the active trace (no-op without one)
+    """
+    trace = _active_trace.get()
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def traced(name: str):
+    """
+    Decorator timing every call of a function as a stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _active_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with trace.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,188 @@
+"""
+Multi-temporal change detection over an ordered stack of acquisitions
+Each date is read from disk once and its normalization range computed once;
+at most two dates are held in memory while stepping through the sequence.
+"""
+
+import rasterio
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+from change_detector import clean_change_map
+from kernels import fused_difference, fused_threshold, resolve_kernel_backend
+from morphology_ops import MORPHOLOGY_BACKENDS
+from raster_stats import BandStatistics, OtsuHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = {'threshold': 0.15, 'cvd': 0.1}
+
+
+class TemporalChangeDetector:
+    """
+    Change detection between consecutive dates of a time series
+
+    Every step gives the same change map as ChangeDetector on that pair, but
+    a stack of N dates takes N reads instead of 2(N - 1).
+    """
+
+    def __init__(self, image_paths: List[str],
+                 clip_percentiles: Optional[Tuple[float, float]] = None,
+                 morphology_backend: str = 'skimage',
+                 kernel_backend: str = 'auto'):
+        """
+        Initialize the detector
+
+        Args:
+            image_paths: Paths of the acquisitions, oldest first
+            clip_percentiles: Optional (low, high) percentiles for robust
+                normalization, e.g. (2, 98); values outside are clipped
+            morphology_backend: Backend for the speckle cleanup ('skimage',
+                'decomposed' or 'bitpacked'; all give identical maps)
+            kernel_backend: Pixel kernel backend ('auto', 'numpy' or 'numba')
+        """
+        if len(image_paths) < 2:
+            raise ValueError("At least two images are needed")
+        if morphology_backend not in MORPHOLOGY_BACKENDS:
+            raise ValueError(f"Unknown morphology backend: {morphology_backend}")
+
+        self.image_paths = list(image_paths)
+        self.clip_percentiles = clip_percentiles
+        self.morphology_backend = morphology_backend
+        self.kernel_backend = resolve_kernel_backend(kernel_backend)
+        self.metadata = [None] * len(self.image_paths)
+
+    def _load_date(self, index: int) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Read one date and its per-band normalization range
+
+        Returns:
+            Tuple of (image, (lows, highs))
+        """
+        path = self.image_paths[index]
+        logger.info(f"Loading date {index + 1}/{len(self.image_paths)}: {path}")
+        with rasterio.open(path) as src:
+            image = src.read()
+            self.metadata[index] = {
+                'crs': src.crs,
+                'transform': src.transform,
+                'bounds': src.bounds,
+                'width': src.width,
+                'height': src.height,
+                'count': src.count
+            }
+
+        stats = BandStatistics.from_array(image, self.clip_percentiles is not None)
+        return image, stats.normalization_range(self.clip_percentiles)
+
+    def _step_change_map(self, image1: np.ndarray, ranges1: Tuple[np.ndarray, np.ndarray],
+                         image2: np.ndarray, ranges2: Tuple[np.ndarray, np.ndarray],
+                         method: str, threshold: float) -> Tuple[np.ndarray, float]:
+        """
+        Cleaned change map of one pair of dates
+
+        Returns:
+            Tuple of (binary change map, threshold used)
+        """
+        clip = self.clip_percentiles is not None
+        if method == 'otsu':
+            diff = fused_difference(image1, image2, ranges1, ranges2, 'absolute', clip=clip,
+                                    backend=self.kernel_backend)
+            diff_scaled = OtsuHistogram.scale(diff)
+            del diff
+            histogram = OtsuHistogram()
+            histogram.update(diff_scaled)
+            threshold = histogram.threshold()
+            change_map = diff_scaled > threshold
+        elif method in ('threshold', 'cvd'):
+            change_map = fused_threshold(image1, image2, ranges1, ranges2,
+                                         'absolute' if method == 'threshold' else 'cvd',
+                                         threshold, clip=clip, backend=self.kernel_backend)
+        else:
+            raise ValueError(f"Unknown method: {method}")
+
+        change_map = clean_change_map(change_map.astype(np.uint8), closing=method != 'cvd',
+                                      backend=self.morphology_backend)
+        return change_map.astype(np.uint8), threshold
+
+    def iter_changes(self, method: str = 'threshold',
+                     threshold: Optional[float] = None) -> Iterator[Tuple[int, np.ndarray, float]]:
+        """
+        Stream the change map of every consecutive pair of dates
+
+        Args:
+            method: 'threshold', 'otsu' or 'cvd'
+            threshold: Change threshold (defaults to 0.15 for 'threshold' and
+                0.1 for 'cvd'; ignored for 'otsu')
+
+        Yields:
+            (step, change_map, threshold) where step i compares date i with
+            date i + 1
+        """
+        if method not in ('threshold', 'otsu', 'cvd'):
+            raise ValueError(f"Unknown method: {method}")
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLDS.get(method)
+
+        previous, previous_ranges = self._load_date(0)
+        for index in range(1, len(self.image_paths)):
+            current, current_ranges = self._load_date(index)
+            if current.shape != previous.shape:
+                raise ValueError(f"Date {index + 1} has shape {current.shape}, "
+                                 f"expected {previous.shape}")
+
+            change_map, used_threshold = self._step_change_map(
+                previous, previous_ranges, current, current_ranges, method, threshold)
+            yield index - 1, change_map, used_threshold
+
+            # The current date becomes the earlier date of the next step
+            previous, previous_ranges = current, current_ranges
+
+    def detect_changes(self, method: str = 'threshold',
+                       threshold: Optional[float] = None,
+                       keep_step_maps: bool = False) -> Dict:
+        """
+        Per-step and cumulative change over the whole stack
+
+        Only running summaries are kept, so memory does not grow with the
+        number of dates; use iter_changes to process each step map instead.
+
+        Args:
+            method: 'threshold', 'otsu' or 'cvd'
+            threshold: Change threshold (see iter_changes)
+            keep_step_maps: Also return every step map
+
+        Returns:
+            Dictionary with 'thresholds' (threshold used per step),
+            'change_count' (number of steps in which each pixel changed),
+            'cumulative_change' (pixels that changed in any step),
+            'first_change' and 'last_change' (first and last step in which
+            each pixel changed, -1 if never) and, with keep_step_maps,
+            'step_maps' (one binary map per consecutive pair)
+        """
+        step_maps, thresholds = [], []
+        change_count = first_change = last_change = None
+        for step, change_map, used_threshold in self.iter_changes(method, threshold):
+            if change_count is None:
+                change_count = np.zeros(change_map.shape, dtype=np.uint16)
+                first_change = np.full(change_map.shape, -1, dtype=np.int16)
+                last_change = np.full(change_map.shape, -1, dtype=np.int16)
+            changed = change_map.astype(bool)
+            change_count += change_map
+            first_change[changed & (first_change < 0)] = step
+            last_change[changed] = step
+            thresholds.append(used_threshold)
+            if keep_step_maps:
+                step_maps.append(change_map)
+
+        result = {
+            'thresholds': thresholds,
+            'change_count': change_count,
+            'cumulative_change': (change_count > 0).astype(np.uint8),
+            'first_change': first_change,
+            'last_change': last_change
+        }
+        if keep_step_maps:
+            result['step_maps'] = step_maps
+        return result
@@ -0,0 +1,71 @@
+"""
+Shared fixtures for the regression tests
+
+Run from the repository root with: python -m pytest
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import calculate_default_transform, reproject
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_synthetic_pair  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def synthetic_pair(tmp_path_factory):
+    """
+    Paths of a 3-band 300x270 GeoTIFF pair with 32-pixel blocks
+
+    Neither side is a multiple of the tile sizes used in the tests, so the
+    last row and column of tiles are partial.
+    """
+    directory = tmp_path_factory.mktemp('pair')
+    return make_synthetic_pair(str(directory / 'before.tif'), str(directory / 'after.tif'),
+                               height=300, width=270, bands=3, block_size=32,
+                               change_density=0.1)
+
+
+def reproject_crop(source: str, path: str, nodata) -> str:
+    """
+    Write a crop of an image reprojected to EPSG:4326
+
+    The crop's footprint is a rotated rectangle on the source grid. With
+    nodata=None the fill around it is written as data.
+    """
+    window = Window(20, 30, 200, 220)
+    with rasterio.open(source) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs, 'EPSG:4326', window.width, window.height,
+            *window_bounds(window, src.transform))
+        profile = src.profile.copy()
+        profile.update(crs='EPSG:4326', transform=transform, width=width, height=height,
+                       nodata=nodata)
+        with rasterio.open(path, 'w', **profile) as dst:
+            for index in src.indexes:
+                band = np.zeros((height, width), dtype=src.dtypes[0])
+                reproject(src.read(index, window=window), band,
+                          src_transform=window_transform(window, src.transform),
+                          src_crs=src.crs, dst_transform=transform, dst_crs='EPSG:4326',
+                          resampling=Resampling.bilinear)
+                dst.write(band, index)
+    return path
+
+
+@pytest.fixture(scope='session')
+def reprojected_pair(synthetic_pair, tmp_path_factory):
+    """
+    The first synthetic image and a crop of it reprojected to EPSG:4326
+
+    The corners of the analysis grid are outside the crop's footprint.
+    """
+    before, _ = synthetic_pair
+    directory = tmp_path_factory.mktemp('reprojected')
+    return before, reproject_crop(before, str(directory / 'reprojected.tif'), nodata=0)
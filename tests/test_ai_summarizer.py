@@ -0,0 +1,77 @@
+"""
+Gemini backends of different sessions must each send their own API key
+"""
+
+import threading
+
+import pytest
+
+glm = pytest.importorskip('google.ai.generativelanguage')
+
+from ai_summarizer import GeminiBackend  # noqa: E402
+
+
+class RecordingClient:
+    """GenerativeServiceClient that records requests with the key it was built with"""
+
+    created = []
+    sent = []
+
+    def __init__(self, client_options):
+        self.api_key = client_options['api_key']
+        RecordingClient.created.append(self.api_key)
+
+    def generate_content(self, request, timeout, retry):
+        assert retry is None
+        RecordingClient.sent.append((request, self.api_key, timeout))
+        return glm.GenerateContentResponse(candidates=[glm.Candidate(
+            content=glm.Content(parts=[glm.Part(text=' summary'), glm.Part(text=' text ')]))])
+
+
+@pytest.fixture
+def recording_client(monkeypatch):
+    monkeypatch.setattr(glm, 'GenerativeServiceClient', RecordingClient)
+    monkeypatch.setattr(RecordingClient, 'created', [])
+    monkeypatch.setattr(RecordingClient, 'sent', [])
+    return RecordingClient
+
+
+def test_concurrent_backends_keep_their_keys(recording_client):
+    backends = [GeminiBackend('key-a'), GeminiBackend('key-b')]
+    start = threading.Barrier(20)
+
+    def request(backend):
+        start.wait()
+        backend.generate(backend.api_key)
+
+    threads = [threading.Thread(target=request, args=(backends[number % 2],))
+               for number in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # One client per backend, reused for all of its requests
+    assert sorted(recording_client.created) == ['key-a', 'key-b']
+    assert len(recording_client.sent) == 20
+    assert all(request.contents[0].parts[0].text == key
+               for request, key, _ in recording_client.sent)
+
+
+def test_request_and_response(recording_client):
+    backend = GeminiBackend('key', model_name='gemini-test')
+    assert backend.generate('prompt', timeout=5, json_output=True) == 'summary text'
+    request, _, timeout = recording_client.sent[0]
+    assert request.model == 'models/gemini-test'
+    assert request.generation_config.response_mime_type == 'application/json'
+    assert timeout == 5
+
+    backend.generate('prompt')
+    assert not recording_client.sent[1][0].generation_config.response_mime_type
+
+
+def test_empty_response_raises(recording_client, monkeypatch):
+    monkeypatch.setattr(RecordingClient, 'generate_content',
+                        lambda self, request, timeout, retry: glm.GenerateContentResponse())
+    with pytest.raises(ValueError):
+        GeminiBackend('key').generate('prompt')
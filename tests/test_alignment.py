@@ -0,0 +1,95 @@
+"""
+Resampled second images: grid pixels outside their footprint are not data
+"""
+
+import numpy as np
+import pytest
+
+from alignment import read_on_grid
+from change_detector import ChangeDetector
+from conftest import reproject_crop
+from raster_cache import RasterCache
+
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+
+def open_detector(pair, **kwargs) -> ChangeDetector:
+    detector = ChangeDetector(*pair, **kwargs)
+    detector.open_images()
+    return detector
+
+
+def test_valid_mask_covers_the_footprint(reprojected_pair):
+    detector = open_detector(reprojected_pair)
+    valid = detector.valid_mask()
+    assert valid.shape == (detector.grid['height'], detector.grid['width'])
+    assert 0.01 < 1 - valid.mean() < 0.2
+    data = read_on_grid(reprojected_pair[1], detector.grid, None)
+    assert not data[:, ~valid].any()
+    assert np.all(data[:, valid].any(axis=0))
+
+
+def test_aligned_pair_has_no_mask(synthetic_pair):
+    assert open_detector(synthetic_pair).valid_mask() is None
+
+
+def test_normalization_ranges_skip_invalid_pixels(reprojected_pair):
+    detector = open_detector(reprojected_pair)
+    valid = detector.valid_mask()
+    for index in (0, 1):
+        for band in range(3):
+            data = detector._band(index, band)[valid]
+            assert np.array_equal(detector._band_range(index, band), [data.min(), data.max()])
+
+
+@pytest.mark.parametrize('method', ['threshold', 'otsu', 'cvd'])
+def test_no_change_outside_footprint(reprojected_pair, method):
+    # The second image is the first one resampled, so there is next to no change
+    detector = open_detector(reprojected_pair, clip_percentiles=(2, 98))
+    valid = detector.valid_mask()
+    change_map = getattr(detector, f'detect_changes_{method}')()
+    assert not change_map[~valid].any()
+    for tile_size in (None, 64):
+        stats = detector.analyze_change_statistics(change_map, tile_size=tile_size)
+        assert stats['total_pixels'] == np.count_nonzero(valid)
+        assert stats['changed_pixels'] + stats['unchanged_pixels'] == stats['total_pixels']
+        assert stats['change_percentage'] < 1
+
+
+def test_otsu_histogram_counts_valid_pixels(reprojected_pair):
+    detector = open_detector(reprojected_pair)
+    detector.otsu_threshold()
+    assert detector._cache_get('otsu_histogram').sum() == np.count_nonzero(detector.valid_mask())
+
+
+def test_disk_cache_keys_first_image_by_footprint(reprojected_pair, tmp_path):
+    # Same grid as the reprojected pair, but the fill is data, so the footprint is larger
+    before, _ = reprojected_pair
+    filled = (before, reproject_crop(before, str(tmp_path / 'filled.tif'), nodata=None))
+    assert (np.count_nonzero(open_detector(filled).valid_mask())
+            > np.count_nonzero(open_detector(reprojected_pair).valid_mask()))
+
+    cache = RasterCache(str(tmp_path / 'cache'))
+    for pair in (reprojected_pair, filled, reprojected_pair):
+        expected = open_detector(pair, clip_percentiles=(2, 98)).normalize_images()
+        cached = open_detector(pair, clip_percentiles=(2, 98), disk_cache=cache).normalize_images()
+        assert all(np.array_equal(a, b) for a, b in zip(cached, expected))
+
+
+@pytest.mark.parametrize('precision', ['float32', 'uint8'])
+def test_precision_report_counts_valid_pixels(reprojected_pair, precision):
+    detector = open_detector(reprojected_pair, clip_percentiles=(2, 98), precision=precision)
+    valid_pixels = np.count_nonzero(detector.valid_mask())
+    report = detector.precision_report()
+    for method, entry in report.items():
+        change_map = getattr(detector, f'detect_changes_{method}')()
+        assert entry['change_percentage'] == pytest.approx(
+            100 * np.count_nonzero(change_map) / valid_pixels)
+        assert entry['mismatch_percentage'] == pytest.approx(
+            100 * entry['mismatched_pixels'] / valid_pixels)
+        if precision == 'float32':
+            # The float32 reference is the detector's own path, masked the same way
+            assert entry['mismatched_pixels'] == entry['max_abs_error'] == 0
+            assert entry['change_percentage_float32'] == entry['change_percentage']
+    if precision == 'float32':
+        assert report['otsu']['otsu_threshold_float32'] == report['otsu']['otsu_threshold']
@@ -0,0 +1,85 @@
+"""
+Batch jobs: a crashing worker only fails its own job, and misaligned pairs
+run on their overlap
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+from batch import run_batch, run_jobs
+from change_detector import ChangeDetector
+
+
+def crash_or_sleep(job):
+    """Kill the worker outright for crash jobs, like the OOM killer would"""
+    if job.get('crash'):
+        os._exit(1)
+    time.sleep(job.get('seconds', 0.3))
+    return {'id': job['id'], 'status': 'done', 'pid': os.getpid()}
+
+
+def test_crash_fails_only_its_job_and_keeps_parallelism():
+    jobs = [{'id': f'job{number}'} for number in range(10)]
+    # The crash breaks the pool while job0 is still running next to it
+    jobs[0]['seconds'] = 1.0
+    jobs[1].update(crash=True)
+
+    results = {result['id']: result for result in run_jobs(crash_or_sleep, jobs, workers=2)}
+
+    assert sorted(results) == sorted(job['id'] for job in jobs)
+    assert results['job1'] == {'id': 'job1', 'status': 'failed', 'error': 'Worker process died'}
+    assert all(result['status'] == 'done' for key, result in results.items() if key != 'job1')
+
+    # Jobs queued behind the crash ran in one fresh two-worker pool, not one
+    # isolated process each
+    assert len({results[f'job{number}']['pid'] for number in range(2, 10)}) == 2
+
+
+def test_single_worker_runs_in_process():
+    results = list(run_jobs(crash_or_sleep, [{'id': 'a', 'seconds': 0}], workers=1))
+    assert results[0]['pid'] == os.getpid()
+
+
+def test_misaligned_pairs_run_on_their_overlap(synthetic_pair, reprojected_pair, tmp_path):
+    before, after = synthetic_pair
+    elsewhere = str(tmp_path / 'elsewhere.tif')
+    with rasterio.open(before) as src:
+        profile, image = src.profile, src.read()
+    profile['transform'] = profile['transform'] * Affine.translation(10000, 0)
+    with rasterio.open(elsewhere, 'w', **profile) as dst:
+        dst.write(image)
+
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps([
+        {'id': 'aligned', 'image1': before, 'image2': after, 'method': 'otsu'},
+        {'id': 'reprojected', 'image1': reprojected_pair[0], 'image2': reprojected_pair[1],
+         'method': 'otsu'},
+        {'id': 'vegetation', 'image1': reprojected_pair[0], 'image2': reprojected_pair[1],
+         'method': 'vegetation'},
+        {'id': 'apart', 'image1': before, 'image2': elsewhere}
+    ]))
+    summary = run_batch(str(manifest), str(tmp_path / 'out'), workers=1, tile_size=64)
+    results = {job['id']: job for job in summary['jobs']}
+
+    assert results['aligned']['aligned'] and not results['reprojected']['aligned']
+    assert results['apart']['status'] == 'failed'
+    assert results['apart']['error'] == 'ValueError: The images do not overlap'
+
+    detector = ChangeDetector(*reprojected_pair)
+    expected = detector.detect_changes_otsu()
+    assert results['reprojected']['threshold'] == detector.otsu_threshold()
+    assert results['reprojected']['stats'] == detector.analyze_change_statistics(expected)
+    with rasterio.open(results['reprojected']['outputs']['change_map']) as src:
+        assert np.array_equal(src.read(1), expected)
+        assert src.transform == detector.grid['transform']
+        assert src.crs == detector.grid['crs']
+
+    loss = detector.detect_vegetation_change()['vegetation_loss']
+    with rasterio.open(results['vegetation']['outputs']['change_map']) as src:
+        assert src.count == 2
+        assert np.array_equal(src.read(1), loss)
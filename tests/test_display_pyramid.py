@@ -0,0 +1,92 @@
+"""
+Display pyramids: 8-bit levels, on-demand levels and render-time overlays
+"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from display_pyramid import DisplayPyramid, _downsample
+
+
+def decode(png):
+    return np.asarray(Image.open(io.BytesIO(png)).convert('RGB'))
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    # Odd sides, so halving pads the last row and column at several levels
+    rgb = rng.random((1203, 997, 3), dtype=np.float32)
+    change_map = (rng.random((1203, 997)) < 0.01).astype(np.uint8)
+    intensity = rng.random((1203, 997), dtype=np.float32)
+    return rgb, change_map, intensity
+
+
+def test_levels_are_8_bit(images):
+    rgb, change_map, intensity = images
+    for pyramid in (DisplayPyramid(rgb), DisplayPyramid(intensity, cmap='hot'),
+                    DisplayPyramid(change_map, reduce='max', vmin=0, vmax=1)):
+        assert all(level.dtype == np.uint8 for level in pyramid.levels if level is not None)
+    assert DisplayPyramid(intensity).nbytes < intensity.nbytes / 2
+
+
+@pytest.mark.parametrize('reduce', ['mean', 'max'])
+def test_on_demand_levels_match_eager_levels(images, reduce):
+    rgb = images[0]
+    eager = DisplayPyramid(rgb, reduce=reduce, max_eager_size=10 ** 6)
+    lazy = DisplayPyramid(rgb, reduce=reduce, max_eager_size=300)
+    assert any(level is None for level in lazy.levels[1:])
+    assert lazy.nbytes < eager.nbytes
+
+    level = eager.levels[0]
+    for index in range(1, len(eager.levels)):
+        assert np.array_equal(level := _downsample(level, reduce), eager.levels[index])
+        height, width = level.shape[:2]
+        for rows, cols in (((0, height), (0, width)), ((3, 41), (width - 17, width)),
+                           ((height - 1, height), (0, 1))):
+            assert np.array_equal(lazy.crop(index, rows, cols),
+                                  level[rows[0]:rows[1], cols[0]:cols[1]])
+
+
+def test_windows_render_like_eager_pyramid(images):
+    intensity = images[2]
+    eager = DisplayPyramid(intensity, cmap='hot', max_eager_size=10 ** 6)
+    lazy = DisplayPyramid(intensity, cmap='hot', max_eager_size=300)
+    for size, window in ((256, None), (300, (100, 1203, 0, 997)), (128, (501, 977, 13, 600))):
+        assert lazy.render(size, window) == eager.render(size, window)
+
+
+def test_overlay_paints_at_render_time(images):
+    rgb, change_map = images[0], images[1]
+    base = DisplayPyramid(rgb)
+    mask = DisplayPyramid(change_map, reduce='max', cmap='RdYlGn_r', vmin=0, vmax=1)
+    overlay = base.with_overlay(mask)
+    assert overlay.levels is base.levels
+    assert overlay.nbytes == 0
+
+    for size, window in ((256, None), (2000, None), (400, (10, 500, 20, 700))):
+        level = overlay.level_for(size, window)
+        painted = decode(overlay.render(size, window))
+        # The mask PNG keeps the colormap indices as its palette indices
+        marks = np.asarray(Image.open(io.BytesIO(mask.render(size, window)))) > 0
+        plain = decode(base.render(size, window))
+        assert level == base.level_for(size, window)
+        assert (painted[marks] == (255, 0, 0)).all()
+        assert np.array_equal(painted[~marks], plain[~marks])
+    # Rendering leaves the shared base levels untouched
+    assert not (base.levels[0] == (255, 0, 0)).all(axis=-1).any()
+
+
+def test_rendering_leaves_the_pyramid_unchanged(images):
+    pyramid = DisplayPyramid(images[2], cmap='hot', max_eager_size=300)
+    nbytes = pyramid.nbytes
+    # Windows covering the same pixels of the level share a key
+    first = pyramid.view_key(64, (0, 600, 0, 600))
+    assert pyramid.view_key(64, (2, 598, 2, 598)) == first
+    assert pyramid.render(64, (0, 600, 0, 600)) == pyramid.render(64, (2, 598, 2, 598))
+    for zoom in (1, 2, 4, 8, 16, 32):
+        pyramid.render(256, (0, 1203 // zoom, 0, 997 // zoom))
+    assert pyramid.nbytes == nbytes
@@ -0,0 +1,75 @@
+"""
+The numba kernels must give bit-identical results to the NumPy kernels
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from kernels import DIFFERENCE_METHODS, fused_difference, fused_ndvi_change, \
+    fused_threshold  # noqa: E402
+
+
+def make_stack(dtype, seed, bands=4, height=37, width=301):
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.integer):
+        stack = rng.integers(0, 10000, size=(bands, height, width)).astype(dtype)
+    else:
+        stack = rng.random((bands, height, width)).astype(dtype)
+    # A constant band exercises the unscaled path of the normalization
+    stack[-1] = stack[-1, 0, 0]
+    return stack
+
+
+def band_ranges(stack, clip):
+    lows, highs = stack.min(axis=(1, 2)), stack.max(axis=(1, 2))
+    if clip:
+        # Narrower ranges, so clipping changes some values
+        lows, highs = np.percentile(stack, 5, axis=(1, 2)), np.percentile(stack, 95, axis=(1, 2))
+        highs[-1] = lows[-1]
+    return lows, highs
+
+
+@pytest.fixture(params=[np.uint16, np.float32], ids=['uint16', 'float32'])
+def pair(request):
+    return make_stack(request.param, 1), make_stack(request.param, 2)
+
+
+@pytest.mark.parametrize('clip', [False, True])
+@pytest.mark.parametrize('method', DIFFERENCE_METHODS)
+def test_difference_backends_identical(pair, method, clip):
+    image1, image2 = pair
+    ranges1, ranges2 = band_ranges(image1, clip), band_ranges(image2, clip)
+    expected = fused_difference(image1, image2, ranges1, ranges2, method, clip,
+                                chunk_rows=16, backend='numpy')
+    result = fused_difference(image1, image2, ranges1, ranges2, method, clip,
+                              backend='numba')
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('clip', [False, True])
+@pytest.mark.parametrize('method', DIFFERENCE_METHODS)
+def test_threshold_backends_identical(pair, method, clip):
+    image1, image2 = pair
+    ranges1, ranges2 = band_ranges(image1, clip), band_ranges(image2, clip)
+    # The median splits the map in half and puts pixels right at the threshold
+    threshold = float(np.median(fused_difference(image1, image2, ranges1, ranges2, method,
+                                                 clip)))
+    expected = fused_threshold(image1, image2, ranges1, ranges2, method, threshold, clip,
+                               backend='numpy')
+    result = fused_threshold(image1, image2, ranges1, ranges2, method, threshold, clip,
+                             backend='numba')
+    assert expected.any() and not expected.all()
+    assert np.array_equal(result, expected)
+
+
+def test_ndvi_change_backends_identical(pair):
+    image1, image2 = pair
+    # Zero red and NIR pixels hit the epsilon in the denominator
+    image1[0, :2], image1[1, :2] = 0, 0
+    expected = fused_ndvi_change(image1[0], image1[1], image2[0], image2[1], backend='numpy')
+    result = fused_ndvi_change(image1[0], image1[1], image2[0], image2[1], backend='numba')
+    for reference, values in zip(expected, result):
+        assert values.dtype == reference.dtype
+        assert np.array_equal(values, reference)
@@ -0,0 +1,90 @@
+"""
+Tile-by-tile labelling must agree with labelling the whole map at once
+"""
+
+import numpy as np
+import pytest
+import rasterio
+from scipy import ndimage
+
+from change_detector import ChangeDetector
+from labeling import TiledLabeler, tiled_change_statistics
+from raster_export import geotiff_profile
+
+
+def blobby_map(height, width, density, seed=0):
+    """Random rectangles and speckle, so many regions straddle tile borders"""
+    rng = np.random.default_rng(seed)
+    cell = 3
+    coarse = rng.random((height // cell + 1, width // cell + 1)) < density
+    blobs = np.repeat(np.repeat(coarse, cell, axis=0), cell, axis=1)[:height, :width]
+    return blobs ^ (rng.random((height, width)) < 0.02)
+
+
+def serpentine_map(size):
+    """One 4-connected region that crosses the same tile borders many times"""
+    change_map = np.zeros((size, size), dtype=bool)
+    change_map[::2] = True
+    for row in range(1, size, 2):
+        change_map[row, -1 if row % 4 == 1 else 0] = True
+    return change_map
+
+
+def canonical_labels(labels):
+    """Renumber labels 1..n in order of first appearance in raster order"""
+    values, first = np.unique(labels.ravel(), return_index=True)
+    order = values[np.argsort(first)]
+    order = order[order != 0]
+    lookup = np.zeros(labels.max() + 1, dtype=np.int64)
+    lookup[order] = np.arange(1, len(order) + 1)
+    return lookup[labels]
+
+
+def stitch(labeler):
+    labels = np.zeros((labeler.height, labeler.width), dtype=np.int64)
+    for window, tile in labeler.iter_labels():
+        labels[window.toslices()] = tile
+    return labels
+
+
+MAPS = {
+    'sparse': lambda: blobby_map(301, 259, 0.2),
+    'dense': lambda: blobby_map(301, 259, 0.55, seed=1),
+    'serpentine': lambda: serpentine_map(97),
+    'empty': lambda: np.zeros((70, 50), dtype=bool),
+    'full': lambda: np.ones((70, 50), dtype=bool),
+}
+
+
+@pytest.mark.parametrize('name', MAPS)
+@pytest.mark.parametrize('tile_size', [16, 45, 64, 1024])
+def test_statistics_match_whole_map(name, tile_size):
+    change_map = MAPS[name]()
+    # Paths are not needed to analyze an in-memory map
+    expected = ChangeDetector(None, None).analyze_change_statistics(change_map)
+    assert tiled_change_statistics(change_map, tile_size) == expected
+
+
+@pytest.mark.parametrize('name', MAPS)
+@pytest.mark.parametrize('tile_size', [16, 45])
+def test_labels_match_ndimage(name, tile_size):
+    change_map = MAPS[name]()
+    labeler = TiledLabeler(change_map, tile_size).run()
+    expected, num_features = ndimage.label(change_map)
+
+    labels = stitch(labeler)
+    assert len(labeler.region_ids) == num_features
+    assert labels.max() == num_features
+    assert np.array_equal(canonical_labels(labels), expected)
+
+
+def test_raster_source_matches_array(tmp_path):
+    change_map = blobby_map(301, 259, 0.3, seed=2).astype(np.uint8)
+    path = str(tmp_path / 'change.tif')
+    with rasterio.open(path, 'w', **geotiff_profile(301, 259, block_size=32)) as dst:
+        dst.write(change_map, 1)
+
+    labeler = TiledLabeler(path, tile_size=64).run()
+    assert labeler.tile_shape != (301, 259)
+    assert labeler.statistics() == tiled_change_statistics(change_map, 64)
+    assert np.array_equal(canonical_labels(stitch(labeler)), ndimage.label(change_map)[0])
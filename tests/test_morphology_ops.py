@@ -0,0 +1,70 @@
+"""
+The fast morphology backends must match skimage bit for bit
+"""
+
+import numpy as np
+import pytest
+from skimage import morphology
+
+from change_detector import ChangeDetector
+from morphology_ops import MORPHOLOGY_BACKENDS, clean_binary
+
+# binary_opening/binary_closing are deprecated in newer skimage releases but
+# remain the reference the backends reproduce
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+FAST_BACKENDS = [backend for backend in MORPHOLOGY_BACKENDS if backend != 'skimage']
+
+
+def reference(change_map, closing):
+    kernel = morphology.disk(2)
+    result = morphology.binary_opening(change_map, kernel)
+    if closing:
+        result = morphology.binary_closing(result, kernel)
+    return result
+
+
+def random_map(height, width, density, seed=0):
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((height // 4 + 1, width // 4 + 1)) < density
+    blobs = np.repeat(np.repeat(coarse, 4, axis=0), 4, axis=1)[:height, :width]
+    return blobs ^ (rng.random((height, width)) < 0.05)
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@pytest.mark.parametrize('closing', [True, False])
+@pytest.mark.parametrize('shape', [(64, 64), (61, 67), (100, 9), (9, 100), (5, 5), (3, 13)])
+@pytest.mark.parametrize('density', [0.1, 0.5, 0.9])
+def test_backend_matches_skimage(backend, closing, shape, density):
+    change_map = random_map(*shape, density, seed=sum(shape))
+    assert np.array_equal(clean_binary(change_map, closing, backend),
+                          reference(change_map, closing))
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@pytest.mark.parametrize('fill', [False, True])
+@pytest.mark.parametrize('shape', [(1, 1), (1, 17), (17, 1), (12, 12)])
+def test_uniform_maps(backend, fill, shape):
+    change_map = np.full(shape, fill)
+    for closing in (True, False):
+        assert np.array_equal(clean_binary(change_map, closing, backend),
+                              reference(change_map, closing))
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+def test_accepts_uint8_maps(backend):
+    change_map = random_map(40, 37, 0.4).astype(np.uint8)
+    result = clean_binary(change_map, True, backend)
+    assert result.dtype == bool
+    assert np.array_equal(result, reference(change_map.astype(bool), True))
+
+
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@pytest.mark.parametrize('method, args', [('threshold', (0.15,)), ('cvd', (0.1,))])
+def test_detector_change_maps_match(synthetic_pair, backend, method, args):
+    maps = []
+    for morphology_backend in ('skimage', backend):
+        detector = ChangeDetector(*synthetic_pair, morphology_backend=morphology_backend)
+        detector.load_images()
+        maps.append(getattr(detector, f'detect_changes_{method}')(*args))
+    assert np.array_equal(*maps)
@@ -0,0 +1,66 @@
+"""
+Disk cache bookkeeping: the content-hash index and warm-cache decoding
+"""
+
+import os
+
+import numpy as np
+
+import change_detector
+from change_detector import ChangeDetector
+from raster_cache import RasterCache
+
+
+def test_index_written_only_for_new_files(tmp_path):
+    source = tmp_path / 'image.bin'
+    source.write_bytes(b'pixels')
+    cache = RasterCache(str(tmp_path / 'cache'))
+
+    first = cache.key(str(source), 'decoded', band=0)
+    assert cache._index_path.exists()
+    cache._index_path.unlink()
+    # Known files are served from the in-memory index without rewriting it
+    assert cache.key(str(source), 'decoded', band=1) != first
+    assert cache.key(str(source), 'decoded', band=0) == first
+    assert not cache._index_path.exists()
+
+
+def test_index_drops_deleted_and_changed_files(tmp_path):
+    sources = [tmp_path / f'image{number}.bin' for number in range(3)]
+    for source in sources:
+        source.write_bytes(source.name.encode())
+    cache = RasterCache(str(tmp_path / 'cache'))
+    for source in sources:
+        cache.content_hash(str(source))
+
+    sources[0].unlink()
+    sources[1].write_bytes(b'rewritten')
+    os.utime(sources[1], ns=(1, 1))
+    cache.content_hash(str(sources[1]))
+    assert len(cache._index) == 2
+
+    # A new instance prunes what disappeared since the index was written
+    sources[2].unlink()
+    reopened = RasterCache(str(tmp_path / 'cache'))
+    reopened.content_hash(str(sources[1]))
+    assert list(reopened._index.values()) == [cache.content_hash(str(sources[1]))]
+
+
+def test_warm_normalize_decodes_nothing(synthetic_pair, tmp_path, monkeypatch):
+    cache = RasterCache(str(tmp_path / 'cache'))
+    cold = ChangeDetector(*synthetic_pair, disk_cache=cache)
+    expected = cold.normalize_images(bands=[0, 2])
+
+    # Neither the GeoTIFFs nor the cached decoded bands are touched
+    reads = []
+    read_on_grid, band = change_detector.read_on_grid, ChangeDetector._band
+    monkeypatch.setattr(change_detector, 'read_on_grid',
+                        lambda *args, **kwargs: reads.append(args) or read_on_grid(*args, **kwargs))
+    monkeypatch.setattr(ChangeDetector, '_band',
+                        lambda *args: reads.append(args) or band(*args))
+    warm = ChangeDetector(*synthetic_pair, disk_cache=cache)
+    result = warm.normalize_images(bands=[0, 2])
+
+    assert reads == []
+    for values, reference in zip(result, expected):
+        assert np.array_equal(values, reference)
@@ -0,0 +1,70 @@
+"""
+GeoTIFF and Cloud-Optimized GeoTIFF exports read back unchanged
+"""
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from raster_export import BLOCK_SIZE, geotiff_bytes, write_geotiff
+
+CRS = 'EPSG:32645'
+TRANSFORM = from_origin(300000, 3100000, 10, 10)
+
+
+@pytest.fixture
+def maps():
+    rng = np.random.default_rng(0)
+    # Neither side is a multiple of the block size
+    change_map = (rng.random((700, 601)) < 0.2).astype(np.uint8)
+    intensity = rng.integers(0, 256, (700, 601), dtype=np.uint8)
+    return change_map, intensity
+
+
+def check_dataset(src, expected: np.ndarray, nbits, cog: bool):
+    assert np.array_equal(src.read(1), expected)
+    assert src.transform == TRANSFORM
+    assert src.crs == rasterio.crs.CRS.from_string(CRS)
+    assert src.profile['tiled']
+    assert src.block_shapes == [(BLOCK_SIZE, BLOCK_SIZE)]
+    structure = src.tags(ns='IMAGE_STRUCTURE')
+    assert src.tags(1, ns='IMAGE_STRUCTURE').get('NBITS') == (str(nbits) if nbits else None)
+    assert structure.get('COMPRESSION') == 'DEFLATE'
+    if cog:
+        assert structure.get('LAYOUT') == 'COG'
+        assert src.overviews(1)
+    else:
+        assert not src.overviews(1)
+
+
+@pytest.mark.parametrize('cog', [False, True])
+@pytest.mark.parametrize('nbits', [1, None])
+def test_write_geotiff_round_trip(maps, tmp_path, nbits, cog):
+    expected = maps[0] if nbits == 1 else maps[1]
+    path = write_geotiff(expected, str(tmp_path / 'map.tif'), CRS, TRANSFORM,
+                         nbits=nbits, cog=cog)
+    with rasterio.open(path) as src:
+        check_dataset(src, expected, nbits, cog)
+    # The intermediate GeoTIFF of a COG export is removed
+    assert [p.name for p in tmp_path.iterdir()] == ['map.tif']
+
+
+@pytest.mark.parametrize('cog', [False, True])
+def test_geotiff_bytes_round_trip(maps, cog):
+    change_map = maps[0].astype(bool)
+    data = geotiff_bytes(change_map, CRS, TRANSFORM, nbits=1, cog=cog)
+    with MemoryFile(data) as memory, memory.open() as src:
+        check_dataset(src, change_map.astype(np.uint8), 1, cog)
+
+
+def test_one_bit_maps_are_smaller(maps):
+    change_map = maps[0]
+    packed = geotiff_bytes(change_map, CRS, TRANSFORM, nbits=1)
+    assert len(packed) < len(geotiff_bytes(change_map, CRS, TRANSFORM))
+
+
+def test_rejects_stacks(maps, tmp_path):
+    with pytest.raises(ValueError):
+        write_geotiff(np.stack(maps), str(tmp_path / 'map.tif'))
@@ -0,0 +1,75 @@
+"""
+TemporalChangeDetector steps against ChangeDetector on each pair of dates
+"""
+
+import weakref
+
+import numpy as np
+import pytest
+import rasterio
+
+from change_detector import ChangeDetector
+from temporal_detector import TemporalChangeDetector
+
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+
+@pytest.fixture(scope='module')
+def dates(synthetic_pair, tmp_path_factory):
+    """Four dates: the synthetic pair, an edit of the later image and the first again"""
+    before, after = synthetic_pair
+    edited = str(tmp_path_factory.mktemp('dates') / 'edited.tif')
+    with rasterio.open(after) as src:
+        profile, image = src.profile, src.read()
+    image[:, 40:120, 150:260] = image[:, 40:120, 150:260] // 3
+    with rasterio.open(edited, 'w', **profile) as dst:
+        dst.write(image)
+    return [before, after, edited, before]
+
+
+@pytest.mark.parametrize('method', ['threshold', 'otsu', 'cvd'])
+@pytest.mark.parametrize('clip_percentiles', [None, (2, 98)])
+def test_steps_match_change_detector(dates, method, clip_percentiles):
+    result = TemporalChangeDetector(dates, clip_percentiles=clip_percentiles).detect_changes(
+        method, keep_step_maps=True)
+
+    assert len(result['step_maps']) == len(dates) - 1
+    for step, change_map in enumerate(result['step_maps']):
+        detector = ChangeDetector(dates[step], dates[step + 1],
+                                  clip_percentiles=clip_percentiles)
+        expected = getattr(detector, f'detect_changes_{method}')()
+        assert np.array_equal(change_map, expected)
+        if method == 'otsu':
+            assert result['thresholds'][step] == detector.otsu_threshold()
+
+    steps = np.stack(result['step_maps']).astype(bool)
+    assert np.array_equal(result['change_count'], steps.sum(axis=0))
+    assert np.array_equal(result['cumulative_change'], steps.any(axis=0))
+    changed = steps.any(axis=0)
+    assert np.array_equal(result['first_change'],
+                          np.where(changed, steps.argmax(axis=0), -1))
+    assert np.array_equal(result['last_change'],
+                          np.where(changed, len(steps) - 1 - steps[::-1].argmax(axis=0), -1))
+
+
+def test_step_maps_are_opt_in(dates):
+    result = TemporalChangeDetector(dates).detect_changes('threshold')
+    assert 'step_maps' not in result
+    assert result['change_count'].any()
+
+
+def test_at_most_two_dates_decoded(dates, monkeypatch):
+    live, peak = set(), []
+    load_date = TemporalChangeDetector._load_date
+
+    def tracked_load_date(self, index):
+        image, ranges = load_date(self, index)
+        live.add(index)
+        weakref.finalize(image, live.discard, index)
+        peak.append(len(live))
+        return image, ranges
+
+    monkeypatch.setattr(TemporalChangeDetector, '_load_date', tracked_load_date)
+    TemporalChangeDetector(dates).detect_changes('otsu')
+    assert len(peak) == len(dates)
+    assert max(peak) == 2
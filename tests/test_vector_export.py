@@ -0,0 +1,121 @@
+"""
+Change polygons: valid, non-overlapping, area-preserving and round-tripping
+"""
+
+import json
+
+import numpy as np
+import pytest
+import shapely
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.warp import transform_geom
+
+from change_detector import ChangeDetector
+from vector_export import export_change_vectors, geojson_bytes, iter_change_features
+
+TRANSFORM = Affine(10, 0, 300000, 0, -10, 3100000)
+MAP_CRS = CRS.from_epsg(32645)
+
+
+def noise_map(seed: int) -> np.ndarray:
+    """Speckled map whose naive per-ring simplification breaks polygons"""
+    return (np.random.default_rng(seed).random((64, 64)) < 0.6).astype(np.uint8)
+
+
+def ring_map() -> np.ndarray:
+    """A ragged frame around a hole with an island inside it"""
+    change_map = np.zeros((40, 40), dtype=np.uint8)
+    change_map[5:35, 5:35] = 1
+    change_map[9:31, 9:31] = 0
+    change_map[5, 10:30:3] = 0
+    change_map[8, 11:30:3] = 0
+    change_map[15:25, 15:25] = 1
+    return change_map
+
+
+def shapes_of(feature_list):
+    return np.array([shapely.geometry.shape(feature['geometry']) for feature in feature_list])
+
+
+def assert_valid_coverage(geometries):
+    assert shapely.is_valid(geometries).all()
+    left, right = shapely.STRtree(geometries).query(geometries, predicate='intersects')
+    pairs = left < right
+    assert not shapely.relate_pattern(geometries[left[pairs]], geometries[right[pairs]],
+                                      'T********').any()
+
+
+@pytest.mark.parametrize('tile_size', [32, 1024])
+@pytest.mark.parametrize('seed', range(5))
+def test_simplified_polygons_are_valid(seed, tile_size):
+    change_map = noise_map(seed)
+    exact = list(iter_change_features(change_map, tile_size=tile_size, simplify_tolerance=0))
+    simplified = list(iter_change_features(change_map, tile_size=tile_size,
+                                           simplify_tolerance=1.0))
+    assert_valid_coverage(shapes_of(exact))
+    assert_valid_coverage(shapes_of(simplified))
+    # Simplification still removes vertices where it is safe
+    vertices = [shapely.get_num_coordinates(shapes_of(f)).sum() for f in (exact, simplified)]
+    assert vertices[1] < vertices[0]
+
+
+@pytest.mark.parametrize('tile_size', [16, 1024])
+@pytest.mark.parametrize('change_map', [noise_map(0), ring_map()], ids=['noise', 'ring'])
+def test_exact_areas_match_region_properties(change_map, tile_size):
+    feature_list = list(iter_change_features(change_map, TRANSFORM, tile_size=tile_size,
+                                             simplify_tolerance=0))
+    # Pieces of a region split by tile borders add up to the whole region
+    regions = {}
+    for feature, geometry in zip(feature_list, shapes_of(feature_list)):
+        properties = feature['properties']
+        assert properties['area'] == properties['pixels'] * 100
+        regions.setdefault(properties['region_id'], [properties['area'], 0.0])[1] += geometry.area
+    assert all(area == total for area, total in regions.values())
+
+    expected = ChangeDetector(None, None).region_properties(
+        change_map, intensity=change_map.astype(np.float32))['area']
+    assert np.array_equal(sorted(area for area, _ in regions.values()), np.sort(expected) * 100)
+
+
+@pytest.mark.parametrize('tolerance', [0, 1.0])
+def test_holes_are_kept(tolerance):
+    feature_list = list(iter_change_features(ring_map(), simplify_tolerance=tolerance))
+    holes = sorted(len(f['geometry']['coordinates']) - 1 for f in feature_list)
+    # The frame has one hole; the island inside it has none
+    assert holes == [0, 1]
+    assert_valid_coverage(shapes_of(feature_list))
+
+
+def test_geojson_is_rfc7946(tmp_path):
+    change_map = ring_map()
+    data = json.loads(geojson_bytes(change_map, MAP_CRS, TRANSFORM))
+    assert 'crs' not in data
+
+    in_map_units = list(iter_change_features(change_map, TRANSFORM))
+    assert len(data['features']) == len(in_map_units)
+    for written, feature in zip(data['features'], in_map_units):
+        expected = transform_geom(MAP_CRS, 'EPSG:4326', feature['geometry'])
+        assert np.allclose(np.concatenate(written['geometry']['coordinates']),
+                           np.concatenate(expected['coordinates']))
+        assert written['properties'] == feature['properties']
+    lon, lat = np.concatenate(data['features'][0]['geometry']['coordinates']).T
+    assert np.all((-180 <= lon) & (lon <= 180) & (-90 <= lat) & (lat <= 90))
+
+
+def test_geopackage_round_trip(tmp_path):
+    fiona = pytest.importorskip('fiona')
+    change_map = noise_map(1)
+    path = str(tmp_path / 'changes.gpkg')
+    count = export_change_vectors(change_map, path, TRANSFORM, MAP_CRS, tile_size=32)
+    expected = list(iter_change_features(change_map, TRANSFORM, tile_size=32))
+    assert count == len(expected)
+
+    with fiona.open(path) as src:
+        assert CRS.from_wkt(src.crs_wkt) == MAP_CRS
+        written = list(src)
+    assert len(written) == count
+    for feature, reference in zip(written, expected):
+        assert dict(feature.properties) == reference['properties']
+        assert shapely.equals_exact(shapely.geometry.shape(feature.geometry),
+                                    shapely.geometry.shape(reference['geometry']), 0)
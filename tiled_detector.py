@@ -0,0 +1,343 @@
+"""
+Tiled, window-streaming change detection
+Runs the ChangeDetector algorithms tile by tile on rasterio windows and writes
+the change map straight to an output GeoTIFF, so peak memory depends on the
+tile size rather than on the scene size. Tiles can be processed in a pool of
+worker processes.
+"""
+
+import rasterio
+from rasterio.windows import Window
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+import logging
+import os
+
+from change_detector import ChangeDetector, clean_change_map
+from kernels import fused_difference, fused_ndvi_change, fused_threshold, resolve_kernel_backend
+from labeling import tiled_change_statistics
+from morphology_ops import MORPHOLOGY_BACKENDS
+from raster_export import geotiff_profile
+from raster_stats import OtsuHistogram, compute_band_statistics
+from tiling import MORPHOLOGY_HALO, aligned_tile_shape, iter_tiles, map_tiles
+
+logger = logging.getLogger(__name__)
+
+
+def _read_tile_pair(job: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    window = job['read_window']
+    with rasterio.open(job['image1_path']) as src1, rasterio.open(job['image2_path']) as src2:
+        return src1.read(window=window), src2.read(window=window)
+
+
+def _tile_difference(job: Dict, method: str) -> np.ndarray:
+    """Read one window of both images and difference it with the global band ranges"""
+    tile1, tile2 = _read_tile_pair(job)
+    return fused_difference(tile1, tile2, job['band_ranges1'], job['band_ranges2'],
+                            method, clip=job['clip'], backend=job['kernel_backend'])
+
+
+def _classify_tile(job: Dict) -> np.ndarray:
+    """Per-pixel change decision for one tile"""
+    method, threshold = job['method'], job['threshold']
+    if method == 'otsu':
+        return OtsuHistogram.scale(_tile_difference(job, 'absolute')) > threshold
+    elif method in ('threshold', 'cvd'):
+        tile1, tile2 = _read_tile_pair(job)
+        return fused_threshold(tile1, tile2, job['band_ranges1'], job['band_ranges2'],
+                               'absolute' if method == 'threshold' else 'cvd', threshold,
+                               clip=job['clip'], backend=job['kernel_backend'])
+    raise ValueError(f"Unknown method: {method}")
+
+
+def _otsu_histogram_tile(job: Dict) -> np.ndarray:
+    """256-bin histogram of the scaled absolute difference of one tile"""
+    diff = _tile_difference(job, 'absolute')
+    return OtsuHistogram.block_counts(OtsuHistogram.scale(diff))
+
+
+def _change_map_tile(job: Dict) -> Tuple[Window, np.ndarray]:
+    """Threshold and clean one tile, returning only its core without the halo"""
+    change_map = _classify_tile(job).astype(np.uint8)
+    change_map = clean_change_map(change_map, closing=job['method'] != 'cvd',
+                                  backend=job['morphology_backend'])
+    return job['write_window'], change_map[job['inner']].astype(np.uint8)
+
+
+def _vegetation_tile(job: Dict) -> Tuple[Window, np.ndarray]:
+    """NDVI change of one tile from the red and NIR bands only"""
+    window = job['read_window']
+    red, nir = job['local_bands']
+    with rasterio.open(job['image1_path']) as src1, rasterio.open(job['image2_path']) as src2:
+        bands1 = src1.read(job['indexes'], window=window)
+        bands2 = src2.read(job['indexes'], window=window)
+    _, _, ndvi_change = fused_ndvi_change(bands1[red], bands1[nir], bands2[red], bands2[nir],
+                                          backend=job['kernel_backend'])
+    return job['write_window'], ndvi_change
+
+
+class TiledChangeDetector:
+    """
+    Window-streaming counterpart of ChangeDetector for large scenes
+    """
+
+    def __init__(self, image1_path: str, image2_path: str, tile_size: int = 1024,
+                 workers: Optional[int] = 1,
+                 clip_percentiles: Optional[Tuple[float, float]] = None,
+                 morphology_backend: str = 'skimage',
+                 kernel_backend: str = 'auto'):
+        """
+        Initialize the tiled change detector with two image paths
+
+        Args:
+            image1_path: Path to the first (earlier) satellite image
+            image2_path: Path to the second (later) satellite image
+            tile_size: Approximate tile edge length in pixels
+            workers: Number of worker processes (None uses every core)
+            clip_percentiles: Optional (low, high) percentiles for robust
+                normalization, e.g. (2, 98); values outside are clipped
+            morphology_backend: Backend for the speckle cleanup ('skimage',
+                'decomposed' or 'bitpacked'; all give identical maps)
+            kernel_backend: Pixel kernel backend ('auto', 'numpy' or 'numba');
+                'auto' uses numba when installed and NumPy otherwise
+        """
+        if morphology_backend not in MORPHOLOGY_BACKENDS:
+            raise ValueError(f"Unknown morphology backend: {morphology_backend}")
+
+        self.image1_path = image1_path
+        self.image2_path = image2_path
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.clip_percentiles = clip_percentiles
+        self.morphology_backend = morphology_backend
+        self.kernel_backend = resolve_kernel_backend(kernel_backend)
+        self.metadata1 = None
+        self.metadata2 = None
+        self.statistics1 = None
+        self.statistics2 = None
+        self.band_ranges1 = None
+        self.band_ranges2 = None
+        self.otsu_histogram = None
+
+    def load_metadata(self) -> Dict:
+        """
+        Read raster metadata without decoding any pixels
+
+        Returns:
+            Dictionary containing metadata
+        """
+        def read_metadata(path):
+            with rasterio.open(path) as src:
+                return {
+                    'crs': src.crs,
+                    'transform': src.transform,
+                    'bounds': src.bounds,
+                    'width': src.width,
+                    'height': src.height,
+                    'count': src.count,
+                    'tile_shape': aligned_tile_shape(src, self.tile_size)
+                }
+
+        self.metadata1 = read_metadata(self.image1_path)
+        self.metadata2 = read_metadata(self.image2_path)
+
+        shape1 = (self.metadata1['height'], self.metadata1['width'])
+        shape2 = (self.metadata2['height'], self.metadata2['width'])
+        if shape1 != shape2:
+            raise ValueError(f"Image shapes differ: {shape1} vs {shape2}")
+
+        return {
+            'image1': self.metadata1,
+            'image2': self.metadata2
+        }
+
+    def _ensure_metadata(self):
+        if self.metadata1 is None:
+            self.load_metadata()
+
+    def _tiles(self, halo: int = 0) -> Iterator[Tuple[Window, Window, Tuple[slice, slice]]]:
+        self._ensure_metadata()
+        return iter_tiles(self.metadata1['height'], self.metadata1['width'],
+                          self.metadata1['tile_shape'], halo)
+
+    def _map_tiles(self, func: Callable, jobs: Iterable[Dict]) -> Iterator:
+        return map_tiles(func, jobs, self.workers)
+
+    def compute_band_ranges(self):
+        """
+        Scan both images to find the global per-band ranges used for
+        normalization, so every tile is scaled the same way
+
+        This is one streaming pass for min-max scaling, plus a histogram pass
+        when percentile clipping is enabled.
+        """
+        self._ensure_metadata()
+        with_histogram = self.clip_percentiles is not None
+        self.statistics1 = compute_band_statistics(self.image1_path, with_histogram,
+                                                   self.tile_size, self.workers)
+        self.statistics2 = compute_band_statistics(self.image2_path, with_histogram,
+                                                   self.tile_size, self.workers)
+        self.band_ranges1 = self.statistics1.normalization_range(self.clip_percentiles)
+        self.band_ranges2 = self.statistics2.normalization_range(self.clip_percentiles)
+
+    def _output_profile(self, count: int = 1, dtype: str = 'uint8') -> Dict:
+        self._ensure_metadata()
+        return geotiff_profile(self.metadata1['height'], self.metadata1['width'],
+                               self.metadata1['crs'], self.metadata1['transform'],
+                               count=count, dtype=dtype)
+
+    def _tile_jobs(self, halo: int = 0, **params) -> Iterator[Dict]:
+        """Describe every tile as a small picklable job"""
+        if self.band_ranges1 is None:
+            self.compute_band_ranges()
+
+        for read_window, write_window, inner in self._tiles(halo):
+            yield {
+                'image1_path': self.image1_path,
+                'image2_path': self.image2_path,
+                'band_ranges1': self.band_ranges1,
+                'band_ranges2': self.band_ranges2,
+                'clip': self.clip_percentiles is not None,
+                'kernel_backend': self.kernel_backend,
+                'read_window': read_window,
+                'write_window': write_window,
+                'inner': inner,
+                **params
+            }
+
+    def _write_change_map(self, output_path: str, method: str, threshold: float) -> str:
+        """Threshold, clean and write every tile of a single-band change map"""
+        # CVD only applies an opening, which needs half the halo
+        halo = MORPHOLOGY_HALO // 2 if method == 'cvd' else MORPHOLOGY_HALO
+        jobs = self._tile_jobs(halo, method=method, threshold=threshold,
+                               morphology_backend=self.morphology_backend)
+
+        with rasterio.open(output_path, 'w', **self._output_profile()) as dst:
+            for write_window, change_map in self._map_tiles(_change_map_tile, jobs):
+                dst.write(change_map, 1, window=write_window)
+
+        logger.info(f"Change map written to {output_path}")
+        return output_path
+
+    def detect_changes_threshold(self, output_path: str, threshold: float = 0.15) -> str:
+        """
+        Detect changes using simple thresholding, tile by tile
+
+        Args:
+            output_path: Path of the change map GeoTIFF to write
+            threshold: Threshold value for change detection (0-1)
+
+        Returns:
+            Path of the written change map
+        """
+        return self._write_change_map(output_path, 'threshold', threshold)
+
+    def otsu_threshold(self) -> int:
+        """
+        Otsu threshold of the scaled absolute difference over the whole scene,
+        from a histogram accumulated tile by tile
+
+        The histogram is kept, so later calls return immediately.
+
+        Returns:
+            Threshold on the 0-255 scale
+        """
+        if self.otsu_histogram is None:
+            histogram = OtsuHistogram()
+            for counts in self._map_tiles(_otsu_histogram_tile, self._tile_jobs()):
+                histogram.merge(counts)
+            self.otsu_histogram = histogram
+        return self.otsu_histogram.threshold()
+
+    def detect_changes_otsu(self, output_path: str) -> str:
+        """
+        Detect changes using Otsu's automatic thresholding, tile by tile
+
+        Args:
+            output_path: Path of the change map GeoTIFF to write
+
+        Returns:
+            Path of the written change map
+        """
+        threshold = self.otsu_threshold()
+        logger.info(f"Otsu threshold: {threshold}")
+        return self._write_change_map(output_path, 'otsu', threshold)
+
+    def detect_changes_cvd(self, output_path: str, threshold: float = 0.1) -> str:
+        """
+        Change Vector Detection, tile by tile
+
+        Args:
+            output_path: Path of the change map GeoTIFF to write
+            threshold: Threshold for change magnitude
+
+        Returns:
+            Path of the written change map
+        """
+        return self._write_change_map(output_path, 'cvd', threshold)
+
+    def detect_vegetation_change(self, output_path: str, red_band: int = 0,
+                                 nir_band: int = 1,
+                                 ndvi_change_path: Optional[str] = None) -> Optional[str]:
+        """
+        Detect vegetation changes using NDVI, tile by tile
+
+        Only the red and NIR bands are read. The output has two bands:
+        vegetation loss and vegetation gain.
+
+        Args:
+            output_path: Path of the loss/gain GeoTIFF to write
+            red_band: Index of red band
+            nir_band: Index of near-infrared band
+            ndvi_change_path: Optional path for a float32 NDVI change raster
+
+        Returns:
+            Path of the written raster, or None if there are not enough bands
+        """
+        self._ensure_metadata()
+        if min(self.metadata1['count'], self.metadata2['count']) <= max(red_band, nir_band):
+            logger.warning("Cannot calculate vegetation change - insufficient bands")
+            return None
+
+        # Only the two bands are read, so they are re-indexed locally
+        jobs = ({
+            'image1_path': self.image1_path,
+            'image2_path': self.image2_path,
+            'indexes': [red_band + 1, nir_band + 1],
+            'local_bands': (0, 1) if red_band != nir_band else (0, 0),
+            'kernel_backend': self.kernel_backend,
+            'read_window': read_window,
+            'write_window': write_window
+        } for read_window, write_window, _ in self._tiles())
+
+        ndvi_dst = None
+        with rasterio.open(output_path, 'w', **self._output_profile(count=2)) as dst:
+            dst.set_band_description(1, 'vegetation_loss')
+            dst.set_band_description(2, 'vegetation_gain')
+            if ndvi_change_path:
+                ndvi_dst = rasterio.open(ndvi_change_path, 'w',
+                                         **self._output_profile(dtype='float32'))
+            try:
+                for window, ndvi_change in self._map_tiles(_vegetation_tile, jobs):
+                    dst.write((ndvi_change < -0.1).astype(np.uint8), 1, window=window)
+                    dst.write((ndvi_change > 0.1).astype(np.uint8), 2, window=window)
+                    if ndvi_dst is not None:
+                        ndvi_dst.write(ndvi_change.astype(np.float32), 1, window=window)
+            finally:
+                if ndvi_dst is not None:
+                    ndvi_dst.close()
+
+        logger.info(f"Vegetation change written to {output_path}")
+        return output_path
+
+    def analyze_change_statistics(self, change_map_path: str) -> Dict[str, float]:
+        """
+        Calculate statistics of a written change map without loading it
+
+        Args:
+            change_map_path: Path of a change map GeoTIFF
+
+        Returns:
+            Dictionary of statistics
+        """
+        return tiled_change_statistics(change_map_path, self.tile_size, self.workers)
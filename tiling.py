@@ -0,0 +1,110 @@
+"""
+Tile geometry and tile scheduling shared by the streaming processors
+"""
+
+import multiprocessing
+import os
+import sys
+from rasterio.windows import Window
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+
+# Opening followed by closing with disk(2) depends on pixels up to 8 away
+MORPHOLOGY_HALO = 8
+
+
+def aligned_tile_shape(src, tile_size: int) -> Tuple[int, int]:
+    """
+    Round a requested tile size to a whole number of the raster's blocks
+
+    Args:
+        src: Open rasterio dataset
+        tile_size: Requested tile edge length in pixels
+
+    Returns:
+        (tile_height, tile_width) aligned to the internal block layout
+    """
+    block_h, block_w = src.block_shapes[0]
+    tile_h = max(block_h, (tile_size // block_h) * block_h)
+    tile_w = max(block_w, (tile_size // block_w) * block_w)
+    return min(tile_h, src.height), min(tile_w, src.width)
+
+
+def iter_tiles(height: int, width: int, tile_shape: Tuple[int, int],
+               halo: int = 0) -> Iterator[Tuple[Window, Window, Tuple[slice, slice]]]:
+    """
+    Split a raster grid into tiles with an optional overlapping halo
+
+    Args:
+        height: Raster height in pixels
+        width: Raster width in pixels
+        tile_shape: (tile_height, tile_width) of the core tiles
+        halo: Number of extra pixels to read around each tile
+
+    Yields:
+        (read_window, write_window, inner) where read_window includes the halo,
+        write_window is the core tile and inner slices the core out of the
+        array read from read_window
+    """
+    tile_h, tile_w = tile_shape
+    for row in range(0, height, tile_h):
+        for col in range(0, width, tile_w):
+            h = min(tile_h, height - row)
+            w = min(tile_w, width - col)
+            row0, col0 = max(row - halo, 0), max(col - halo, 0)
+            row1, col1 = min(row + h + halo, height), min(col + w + halo, width)
+            read_window = Window(col0, row0, col1 - col0, row1 - row0)
+            write_window = Window(col, row, w, h)
+            inner = (slice(row - row0, row - row0 + h), slice(col - col0, col - col0 + w))
+            yield read_window, write_window, inner
+
+
+def init_worker():
+    """Run compiled kernels single-threaded; the pool provides the parallelism"""
+    numba = sys.modules.get('numba')
+    if numba is not None:
+        numba.set_num_threads(1)
+    else:
+        os.environ['NUMBA_NUM_THREADS'] = '1'
+
+
+def pool_context():
+    """Multiprocessing context for worker pools (None for the default)"""
+    # numba's threading layers are not safe to fork once they have started,
+    # so spawn fresh workers whenever it is loaded
+    if 'numba' in sys.modules:
+        return multiprocessing.get_context('spawn')
+    return None
+
+
+def map_tiles(func: Callable, jobs: Iterable[Dict], workers: int = 1) -> Iterator:
+    """
+    Run a tile function over all jobs, in a process pool when more than one
+    worker is requested
+
+    At most two jobs per worker are in flight so finished tiles do not pile
+    up in memory. With a pool, results are yielded in completion order.
+
+    Args:
+        func: Module-level function taking one job dictionary
+        jobs: Picklable job descriptions
+        workers: Number of worker processes
+
+    Yields:
+        The result of func for each job
+    """
+    if workers <= 1:
+        yield from map(func, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                             initializer=init_worker) as executor:
+        pending = set()
+        for job in jobs:
+            pending.add(executor.submit(func, job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
@@ -0,0 +1,314 @@
+"""
+Streaming vectorization of change regions
+Change maps are labelled with TiledLabeler, polygonized one tile at a time
+and simplified, and every feature is written to disk as soon as it is
+built. Regions crossing tile borders are split into pieces that share their
+region_id and carry the area of the whole region; vertices on tile borders
+are never simplified away, so the pieces still meet exactly. A simplified
+polygon that is invalid, or that overlaps another polygon of its tile,
+keeps its exact pixel outline, so every written geometry is valid and no
+two overlap.
+
+GeoJSON output follows RFC 7946 and is written in EPSG:4326; GeoPackage
+output keeps the map's CRS and uses fiona when it is installed.
+"""
+
+import json
+import os
+import tempfile
+import rasterio
+from rasterio import features
+from rasterio.warp import transform_geom
+from affine import Affine
+import numpy as np
+import shapely
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import logging
+
+from labeling import TiledLabeler
+
+try:
+    import fiona
+except ImportError:
+    fiona = None
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DRIVERS = {'.geojson': 'GeoJSON', '.json': 'GeoJSON', '.gpkg': 'GPKG'}
+
+FEATURE_SCHEMA = {
+    'geometry': 'Polygon',
+    'properties': {'region_id': 'int', 'pixels': 'int', 'area': 'float'}
+}
+
+
+def _simplify_ring(ring: np.ndarray, tolerance: float, pinned: np.ndarray) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of a closed ring that keeps pinned vertices
+
+    Args:
+        ring: (n + 1, 2) coordinates with the first vertex repeated at the end
+        tolerance: Largest allowed deviation, in the units of ring
+        pinned: Boolean flag per coordinate for vertices that must be kept
+
+    Returns:
+        Simplified closed ring (the input if it would degenerate)
+    """
+    n = len(ring) - 1
+    if tolerance <= 0 or n <= 4:
+        return ring
+
+    keep = pinned[:n].copy()
+    keep[0] = True
+    # The vertex farthest from the start splits the ring into two open paths
+    keep[int(np.argmax(((ring[:n] - ring[0]) ** 2).sum(axis=1)))] = True
+
+    anchors = np.append(np.flatnonzero(keep), n)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, direction = ring[start], ring[end] - ring[start]
+        inner = ring[start + 1:end] - a
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(direction[0] * inner[:, 1] - direction[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack += [(start, middle), (middle, end)]
+
+    simplified = ring[np.append(np.flatnonzero(keep), n)]
+    return simplified if len(simplified) >= 4 else ring
+
+
+def _simplify_polygons(polygons: List[List[np.ndarray]], box: Tuple[int, int, int, int],
+                       tolerance: float) -> List[List[np.ndarray]]:
+    """
+    Simplify the polygons of one tile without breaking their topology
+
+    Polygons that become invalid, or whose interiors come to overlap another
+    polygon of the tile, keep their exact rings. Pieces in different tiles
+    cannot overlap: border vertices are pinned, and a shortcut between
+    points of a tile stays inside it.
+
+    Args:
+        polygons: Rings (shell first) of each polygon, in pixel coordinates
+        box: (col0, row0, col1, row1) of the tile
+        tolerance: Douglas-Peucker tolerance in pixels
+
+    Returns:
+        Rings of each polygon
+    """
+    if tolerance <= 0 or not polygons:
+        return polygons
+    col0, row0, col1, row1 = box
+    simplified = []
+    for rings in polygons:
+        simplified.append([_simplify_ring(ring, tolerance,
+                                          (ring[:, 0] == col0) | (ring[:, 0] == col1) |
+                                          (ring[:, 1] == row0) | (ring[:, 1] == row1))
+                           for ring in rings])
+
+    exact_shapes = np.array([shapely.Polygon(rings[0], rings[1:]) for rings in polygons])
+    simple_shapes = np.array([shapely.Polygon(rings[0], rings[1:]) for rings in simplified])
+    use = shapely.is_valid(simple_shapes)
+    while use.any():
+        shapes = np.where(use, simple_shapes, exact_shapes)
+        left, right = shapely.STRtree(shapes).query(shapes, predicate='intersects')
+        pairs = left < right
+        left, right = left[pairs], right[pairs]
+        # Exact outlines only ever touch; interiors meeting means an overlap
+        overlap = shapely.relate_pattern(shapes[left], shapes[right], 'T********')
+        offenders = np.union1d(left[overlap], right[overlap])
+        offenders = offenders[use[offenders]]
+        if not len(offenders):
+            break
+        use[offenders] = False
+
+    return [s if keep else p for s, p, keep in zip(simplified, polygons, use)]
+
+
+def iter_change_features(source: Union[str, np.ndarray], transform: Optional[Affine] = None,
+                         tile_size: int = 1024, simplify_tolerance: float = 1.0,
+                         min_area: float = 0.0, workers: int = 1) -> Iterator[Dict]:
+    """
+    Stream change regions as GeoJSON-like polygon features
+
+    Args:
+        source: Binary change map array or path of a change map raster
+        transform: Affine pixel-to-map transform (read from the raster if
+            None; identity for arrays without one)
+        tile_size: Approximate tile edge length in pixels
+        simplify_tolerance: Douglas-Peucker tolerance in pixels (0 keeps the
+            exact pixel outlines)
+        min_area: Drop regions smaller than this, in squared map units
+        workers: Worker processes for labelling (raster sources only)
+
+    Yields:
+        Feature dicts with map-coordinate polygons and 'region_id', 'pixels'
+        (size of the whole region) and 'area' properties
+    """
+    if transform is None:
+        if isinstance(source, np.ndarray):
+            transform = Affine.identity()
+        else:
+            with rasterio.open(source) as src:
+                transform = src.transform
+
+    labeler = TiledLabeler(source, tile_size, workers).run()
+    pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+    # Indexed by final label; entry 0 is the background
+    sizes = np.concatenate([[0], labeler.region_sizes]).astype(np.int64)
+    wanted = sizes * pixel_area >= min_area
+    wanted[0] = False
+
+    for window, labels in labeler.iter_labels():
+        row0, col0 = window.row_off, window.col_off
+        row1, col1 = row0 + window.height, col0 + window.width
+        mask = wanted[labels]
+        if not mask.any():
+            continue
+
+        shapes = list(features.shapes(labels.astype(np.int32), mask=mask, connectivity=4,
+                                      transform=Affine.translation(col0, row0)))
+        polygons = _simplify_polygons(
+            [[np.asarray(ring, dtype=np.float64) for ring in geometry['coordinates']]
+             for geometry, _ in shapes],
+            (col0, row0, col1, row1), simplify_tolerance)
+
+        for pixel_rings, (_, region) in zip(polygons, shapes):
+            rings = []
+            for ring in pixel_rings:
+                x = transform.a * ring[:, 0] + transform.b * ring[:, 1] + transform.c
+                y = transform.d * ring[:, 0] + transform.e * ring[:, 1] + transform.f
+                rings.append(np.column_stack([x, y]).tolist())
+
+            region = int(region)
+            yield {
+                'type': 'Feature',
+                'geometry': {'type': 'Polygon', 'coordinates': rings},
+                'properties': {
+                    'region_id': region,
+                    'pixels': int(sizes[region]),
+                    'area': float(sizes[region] * pixel_area)
+                }
+            }
+
+
+def write_geojson(feature_iter: Iterable[Dict], output_path: str, crs=None) -> int:
+    """
+    Write features to an RFC 7946 GeoJSON FeatureCollection, one feature at
+    a time
+
+    Args:
+        feature_iter: GeoJSON-like feature dicts
+        output_path: Path of the file to write
+        crs: Coordinate reference system of the features; they are
+            reprojected to EPSG:4326 (longitude, latitude). Without one the
+            coordinates are written as they are. The 'area' property stays
+            in the units of crs.
+
+    Returns:
+        Number of features written
+    """
+    count = 0
+    with open(output_path, 'w') as f:
+        f.write('{"type": "FeatureCollection",\n"features": [\n')
+        for feature in feature_iter:
+            if crs is not None:
+                feature = dict(feature, geometry=transform_geom(crs, 'EPSG:4326',
+                                                                feature['geometry']))
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(feature))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+def write_geopackage(feature_iter: Iterable[Dict], output_path: str, crs=None,
+                     layer: str = 'changes') -> int:
+    """
+    Write features to a GeoPackage layer, one feature at a time
+
+    Args:
+        feature_iter: GeoJSON-like feature dicts
+        output_path: Path of the file to write
+        crs: Coordinate reference system
+        layer: Layer name
+
+    Returns:
+        Number of features written
+    """
+    if fiona is None:
+        raise ImportError("GeoPackage export requires fiona (pip install fiona)")
+
+    count = 0
+    crs_wkt = crs.to_wkt() if crs is not None else ''
+    with fiona.open(output_path, 'w', driver='GPKG', schema=FEATURE_SCHEMA,
+                    crs_wkt=crs_wkt, layer=layer) as dst:
+        for feature in feature_iter:
+            dst.write(fiona.Feature.from_dict(feature))
+            count += 1
+    return count
+
+
+def export_change_vectors(source: Union[str, np.ndarray], output_path: str,
+                          transform: Optional[Affine] = None, crs=None,
+                          tile_size: int = 1024, simplify_tolerance: float = 1.0,
+                          min_area: float = 0.0, workers: int = 1) -> int:
+    """
+    Vectorize a change map to GeoJSON (.geojson/.json, in EPSG:4326) or
+    GeoPackage (.gpkg, in the map's CRS)
+
+    Args:
+        source: Binary change map array or path of a change map raster
+        output_path: Path of the vector file; its extension picks the format
+        transform: Affine pixel-to-map transform (read from the raster if None)
+        crs: Coordinate reference system (read from the raster if None)
+        tile_size: Approximate tile edge length in pixels
+        simplify_tolerance: Douglas-Peucker tolerance in pixels
+        min_area: Drop regions smaller than this, in squared map units
+        workers: Worker processes for labelling (raster sources only)
+
+    Returns:
+        Number of features written
+    """
+    driver = VECTOR_DRIVERS.get(os.path.splitext(output_path)[1].lower())
+    if driver is None:
+        raise ValueError(f"Unsupported vector format: {output_path}")
+    if crs is None and not isinstance(source, np.ndarray):
+        with rasterio.open(source) as src:
+            crs = src.crs
+
+    feature_iter = iter_change_features(source, transform, tile_size, simplify_tolerance,
+                                        min_area, workers)
+    if driver == 'GPKG':
+        count = write_geopackage(feature_iter, output_path, crs)
+    else:
+        count = write_geojson(feature_iter, output_path, crs)
+
+    logger.info(f"Wrote {count} change polygons to {output_path}")
+    return count
+
+
+def geojson_bytes(change_map: np.ndarray, crs=None, transform: Optional[Affine] = None,
+                  **kwargs) -> bytes:
+    """
+    Encoded GeoJSON of the change polygons of a map, e.g. for a download button
+
+    Keyword arguments are passed on to iter_change_features.
+
+    Returns:
+        File content
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'changes.geojson')
+        write_geojson(iter_change_features(change_map, transform, **kwargs), path, crs)
+        with open(path, 'rb') as f:
+            return f.read()